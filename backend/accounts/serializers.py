@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from rides.images import SrcsetField
 from .models import User, Driver, Passenger
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -82,12 +83,13 @@ class UserProfileSerializer(serializers.ModelSerializer):
     vehicle_model = serializers.CharField(source='driver_profile.vehicle_model', required=False, allow_blank=True, allow_null=True)
     vehicle_color = serializers.CharField(source='driver_profile.vehicle_color', required=False, allow_blank=True, allow_null=True)
     vehicle_plate = serializers.CharField(source='driver_profile.vehicle_plate', required=False, allow_blank=True, allow_null=True)
+    profile_picture_srcset = SrcsetField(source='profile_picture')
     
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name',
-            'phone_number', 'user_type', 'profile_picture', 'license_number', 'vehicle_model',
+            'phone_number', 'user_type', 'profile_picture', 'profile_picture_srcset', 'license_number', 'vehicle_model',
             'vehicle_color', 'vehicle_plate', 'created_at', 'is_profile_complete',
             'is_staff', 'is_superuser'
         ]
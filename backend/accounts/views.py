@@ -5,6 +5,7 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer
 from rides.serializers import PublicProfileSerializer
+from rides.cache import touch_driver_rides
 from .models import User
 from django.core.mail import send_mail
 from django.conf import settings
@@ -32,6 +33,12 @@ class ProfileView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
+    def perform_update(self, serializer):
+        user = serializer.save()
+        # Ride listings show the driver's profile
+        if user.user_type == 'driver':
+            touch_driver_rides(user.id)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class RegisterView(generics.CreateAPIView):
     permission_classes = [AllowAny]
@@ -106,7 +113,10 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     
     def perform_update(self, serializer):
         # Save the serializer and update the user instance
-        serializer.save()
+        user = serializer.save()
+        # Ride listings show the driver's profile
+        if user.user_type == 'driver':
+            touch_driver_rides(user.id)
 
 class PublicProfileView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
@@ -168,6 +168,40 @@ class BookingEarningsTest(TestCase):
         self.assertIsNotNone(driver_tx)
         self.assertEqual(driver_tx.amount, Decimal('100.00'))
 
+    def expire_hold(self):
+        from rides.holds import expire_holds, place_hold
+
+        place_hold(self.booking, ttl=timedelta(minutes=-1))
+        expire_holds()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'cancelled')
+
+    def test_late_payment_confirms_an_expired_hold(self):
+        self.expire_hold()
+        self.assertTrue(process_stk_result(self.tx, '0', 'Success'))
+
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.status, self.booking.is_paid), ('confirmed', True))
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.available_seats, 2)
+        self.driver_wallet.refresh_from_db()
+        self.assertEqual(self.driver_wallet.balance, Decimal('100.00'))
+
+    def test_late_payment_for_resold_seats_stays_in_wallet(self):
+        from accounts.models import Notification
+
+        self.expire_hold()
+        Ride.objects.filter(pk=self.ride.pk).update(available_seats=0, status='fully_booked')
+        self.assertTrue(process_stk_result(self.tx, '0', 'Success'))
+
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.status, self.booking.is_paid), ('cancelled', False))
+        self.passenger_wallet.refresh_from_db()
+        self.assertEqual(self.passenger_wallet.balance, Decimal('105.00'))
+        self.assertTrue(
+            Notification.objects.filter(user=self.passenger, title="Booking Could Not Be Confirmed").exists()
+        )
+
 
 class RetryRidePaymentApiTest(TestCase):
     def setUp(self):
@@ -602,8 +602,13 @@ def process_stk_result(transaction_obj, result_code, result_desc, callback_metad
                     ride = transaction_obj.ride
                     if ride.status == 'pending_payment':
                         ride.status = 'available'
-                        ride.save()
+                        ride.save(update_fields=['status'])
                         logger.info(f"Activated ride {ride.id} after platform fee payment.")
+
+                        from rides.alerts import notify_saved_searches
+                        from rides.cache import invalidate_ride_lists
+                        db_transaction.on_commit(lambda ride=ride: invalidate_ride_lists(ride))
+                        db_transaction.on_commit(lambda ride=ride: notify_saved_searches(ride), robust=True)
                         
                         # Deduct the fee from wallet (Pass-through)
                         wallet.balance -= amount
@@ -643,14 +648,37 @@ def process_stk_result(transaction_obj, result_code, result_desc, callback_metad
                 # Only explicit booking-payment transactions may confirm bookings.
                 pending_booking = transaction_obj.booking if transaction_obj.transaction_type == "booking" else None
                 
-                if pending_booking and pending_booking.status == 'pending':
+                # The hold sweeper may have cancelled the booking before the money arrived
+                hold_expired = (
+                    pending_booking is not None
+                    and pending_booking.status == 'cancelled'
+                    and not pending_booking.is_paid
+                    and pending_booking.hold_expires_at is not None
+                )
+
+                if pending_booking and (pending_booking.status == 'pending' or hold_expired):
                     subtotal = pending_booking.ride.price * Decimal(pending_booking.no_of_seats)
                     expected_amount = (subtotal * Decimal('1.05')).quantize(Decimal('0.01'))
                     
                     # Allow a small margin of error (1 KES) to account for rounding by Daraja/M-Pesa
                     if amount >= (expected_amount - Decimal('1.0')):
-                        # Confirm the booking
-                        pending_booking.confirm_payment()
+                        # Confirm the booking; an expired hold takes its seats again if they are still free
+                        try:
+                            pending_booking.confirm_payment()
+                        except ValueError:
+                            ride = pending_booking.ride
+                            logger.info(f"Booking {pending_booking.id} paid after its hold expired and the seats were taken.")
+                            Notification.objects.create(
+                                user=wallet.user,
+                                title="Booking Could Not Be Confirmed",
+                                message=(
+                                    f"Your payment for the ride from {ride.departure_location} to {ride.destination} arrived "
+                                    f"after your seat hold expired, and the seats are no longer available. "
+                                    f"KES {amount} remains in your wallet."
+                                ),
+                                notification_type="error"
+                            )
+                            return True
                         
                         # Credit the driver with the booking amount less the platform fee
                         driver_amount = (pending_booking.ride.price * Decimal(pending_booking.no_of_seats)).quantize(Decimal('0.01'))
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
@@ -250,6 +251,15 @@ MPESA_INITIATOR_USERNAME = os.getenv('MPESA_INITIATOR_USERNAME')
 
 MPESA_INITIATOR_SECURITY_CREDENTIAL = os.getenv('MPESA_INITIATOR_SECURITY_CREDENTIAL')
 
+# How long an M-Pesa/card booking holds its seats while waiting for the payment callback
+SEAT_HOLD_MINUTES = int(os.getenv('SEAT_HOLD_MINUTES', '15'))
+
+# 'redis' keeps live seat counters in front of the Ride rows for hot routes (see rides.seat_counter)
+SEAT_COUNTER_BACKEND = os.getenv('SEAT_COUNTER_BACKEND', 'database')
+
+# Partially uploaded images (rides.uploads) are assembled here before moving to media storage
+UPLOAD_SESSION_DIR = os.getenv('UPLOAD_SESSION_DIR', os.path.join(tempfile.gettempdir(), 'ridelink-uploads'))
+
 
 # stripe
 # settings.py
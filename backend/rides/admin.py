@@ -1,7 +1,68 @@
-from django.contrib import admin
-from .models import Ride, Booking, RideImage
+from django import forms
+from django.contrib import admin, messages
+from django.db import transaction as db_transaction
+from .models import Ride, Booking, RideImage, Place, PlaceAlias
+from .gazetteer import merge_places
+from .inventory import change_seats
+
+class RideAdminForm(forms.ModelForm):
+    class Meta:
+        model = Ride
+        fields = '__all__'
+
+    def clean_available_seats(self):
+        seats = self.cleaned_data['available_seats']
+        if self.instance.pk is None or 'available_seats' not in self.changed_data:
+            free, delta = 0, seats
+        else:
+            # The admin validates and saves in one transaction, so the lock holds until save_model
+            free = Ride.objects.select_for_update().values_list('available_seats', flat=True).get(pk=self.instance.pk)
+            delta = seats - self.initial['available_seats']
+        if free + delta < 0:
+            raise forms.ValidationError("More seats are already taken than the new capacity allows.")
+        return seats
+
 
 # Register your models here.
-admin.site.register(Ride)
+@admin.register(Ride)
+class RideAdmin(admin.ModelAdmin):
+    form = RideAdminForm
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # A full save leaves the seat inventory alone: write the edited fields, the seats as a change
+        fields = [name for name in form.changed_data if name != 'available_seats']
+        with db_transaction.atomic():
+            obj.save(update_fields=fields)
+            if 'available_seats' in form.changed_data:
+                delta = obj.available_seats - form.initial['available_seats']
+                if not change_seats(obj.pk, delta):
+                    # clean_available_seats checked this under the ride lock; undo the other edits too
+                    raise ValueError("More seats are already taken than the new capacity allows.")
+
+
 admin.site.register(RideImage)
-admin.site.register(Booking)
\ No newline at end of file
+admin.site.register(Booking)
+
+
+class PlaceAliasInline(admin.TabularInline):
+    model = PlaceAlias
+    extra = 1
+
+
+@admin.register(Place)
+class PlaceAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name']
+    search_fields = ['name', 'aliases__alias']
+    inlines = [PlaceAliasInline]
+    actions = ['merge_into_oldest']
+
+    @admin.action(description="Merge selected places into the oldest one")
+    def merge_into_oldest(self, request, queryset):
+        places = list(queryset.order_by('id'))
+        moved = merge_places(places[0], places[1:])
+        self.message_user(
+            request, f"Merged {len(places) - 1} place(s) into {places[0].name}; {moved} ride location(s) moved.",
+            messages.SUCCESS
+        )
@@ -0,0 +1,105 @@
+# rides/alerts.py
+"""
+Match alerts for saved searches.
+
+Each SavedSearch is indexed under one key per side: its longest normalized
+query token, the most selective one. Saved searches use the same token-prefix
+semantics as the ride list, so a search can only match a ride when that key is
+a prefix of one of the ride's tokens. When a ride goes live, the candidates are
+therefore an IN lookup of the ride's few dozen prefix terms on the
+(departure_key, destination_key) index. Only those candidates are checked in
+full, so the cost tracks the number of matching searches rather than the
+number of saved searches.
+"""
+import logging
+
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import Notification
+
+from .models import SavedSearch
+from .search import prefix_terms, tokenize
+
+logger = logging.getLogger(__name__)
+
+
+def route_key(value):
+    """Index key of one side of a saved search: its longest token, or '' for "any"."""
+    tokens = tokenize(value)
+    return max(tokens, key=len) if tokens else ''
+
+
+def ride_locations(ride):
+    """The ride's stops in travel order (just departure and destination for a single-leg ride)."""
+    if ride.is_multi_stop:
+        return list(ride.stops.values_list('location', flat=True))
+    return [ride.departure_location, ride.destination]
+
+
+def candidate_searches(ride, locations):
+    """Active saved searches whose index keys fit the ride, with date and price checked in SQL."""
+    boarding_terms, alighting_terms = set(), set()
+    for location in locations[:-1]:
+        boarding_terms |= prefix_terms(location)
+    for location in locations[1:]:
+        alighting_terms |= prefix_terms(location)
+
+    return (
+        SavedSearch.objects.filter(is_active=True)
+        .filter(Q(departure_key='') | Q(departure_key__in=boarding_terms))
+        .filter(Q(destination_key='') | Q(destination_key__in=alighting_terms))
+        .filter(Q(date_from__isnull=True) | Q(date_from__lte=ride.departure_time))
+        .filter(Q(date_to__isnull=True) | Q(date_to__gte=ride.departure_time))
+        .filter(Q(max_price__isnull=True) | Q(max_price__gte=ride.price))
+        .exclude(user_id=ride.driver_id)
+        .only('id', 'user_id', 'departure_location', 'destination')
+    )
+
+
+def route_matches(search, location_terms):
+    """True if a stop matching the search's departure comes before one matching its destination."""
+    boarding = set(tokenize(search.departure_location))
+    alighting = set(tokenize(search.destination))
+    for index, terms in enumerate(location_terms[:-1]):
+        if boarding <= terms and any(alighting <= later for later in location_terms[index + 1:]):
+            return True
+    return False
+
+
+def match_saved_searches(ride):
+    locations = ride_locations(ride)
+    location_terms = [prefix_terms(location) for location in locations]
+    return [
+        search for search in candidate_searches(ride, locations)
+        if route_matches(search, location_terms)
+    ]
+
+
+def notify_saved_searches(ride):
+    """Notify every passenger with a saved search that the newly available `ride` matches."""
+    matches = match_saved_searches(ride)
+    if not matches:
+        return 0
+
+    notified_users = set()
+    notifications = []
+    for search in matches:
+        # One alert per passenger, even if several of their searches match
+        if search.user_id in notified_users:
+            continue
+        notified_users.add(search.user_id)
+        notifications.append(Notification(
+            user_id=search.user_id,
+            title="New Ride Matches Your Search",
+            message=(
+                f"A new ride from {ride.departure_location} to {ride.destination} on "
+                f"{timezone.localtime(ride.departure_time):%d %b %H:%M} is available for KES {ride.price}."
+            ),
+            notification_type="info"
+        ))
+    Notification.objects.bulk_create(notifications)
+    SavedSearch.objects.filter(id__in=[search.id for search in matches]).update(last_notified_at=timezone.now())
+
+    logger.info(f"Ride {ride.id} matched {len(matches)} saved search(es); notified {len(notifications)} passenger(s).")
+    return len(notifications)
@@ -0,0 +1,135 @@
+# rides/autocomplete.py
+"""
+Location autocomplete from an in-process prefix index.
+
+Every distinct ride location (departure or destination, grouped by its
+normalized form) is weighted by the number of rides that use it. The index is
+a sorted array of (word suffix, location key) pairs, one per word start, so
+"mom" finds "Mombasa" and "cbd" finds "Nairobi CBD". A lookup is two bisects
+plus a top-k over the matching slice, with no database access.
+
+Each process keeps its own index:
+- it is built from the database on first use and rebuilt every
+  REBUILD_SECONDS, which picks up edits and deletions;
+- rides created in this process are added on commit (note_ride);
+- rides created elsewhere are pulled in at most every SYNC_SECONDS with one
+  `id > last seen` query.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from django.db.models import Count, Max
+
+from .search import normalize_location
+
+SYNC_SECONDS = 30
+REBUILD_SECONDS = 60 * 60
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+LOCATION_FIELDS = ('departure_location', 'destination')
+
+
+def word_suffixes(key):
+    """`key` from each of its word starts on."""
+    words = key.split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+class LocationIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = []  # sorted (suffix, key) pairs
+        self.weights = Counter()
+        # Display spellings of each key, by use
+        self.spellings = defaultdict(Counter)
+        self.last_ride_id = 0
+        # Rides added by note_ride() that sync() has not reached yet
+        self.noted = set()
+        self.built_at = self.synced_at = None
+
+    def _add(self, location, weight=1):
+        key = normalize_location(location)
+        if not key:
+            return
+        if key not in self.weights:
+            for suffix in word_suffixes(key):
+                insort(self.entries, (suffix, key))
+        self.weights[key] += weight
+        self.spellings[key][location.strip()] += weight
+
+    def rebuild(self):
+        """Replace the index with one built from every ride."""
+        from .models import Ride
+
+        fresh = LocationIndex()
+        fresh.last_ride_id = Ride.objects.aggregate(last=Max('id'))['last'] or 0
+        for field in LOCATION_FIELDS:
+            counts = (
+                Ride.objects.filter(id__lte=fresh.last_ride_id)
+                .values(field).order_by().annotate(rides=Count('id'))
+                .values_list(field, 'rides')
+            )
+            for location, rides in counts:
+                fresh._add(location, rides)
+        fresh.built_at = fresh.synced_at = time.monotonic()
+
+        with self.lock:
+            self.entries, self.weights, self.spellings = fresh.entries, fresh.weights, fresh.spellings
+            self.last_ride_id, self.built_at, self.synced_at = fresh.last_ride_id, fresh.built_at, fresh.synced_at
+            self.noted = set()
+
+    def sync(self):
+        """Add rides created by other processes since the last build or sync."""
+        from .models import Ride
+
+        rows = list(
+            Ride.objects.filter(id__gt=self.last_ride_id).order_by('id')
+            .values_list('id', *LOCATION_FIELDS)
+        )
+        with self.lock:
+            for ride_id, *locations in rows:
+                if ride_id <= self.last_ride_id or ride_id in self.noted:
+                    continue
+                for location in locations:
+                    self._add(location)
+            if rows:
+                self.last_ride_id = max(self.last_ride_id, rows[-1][0])
+            self.noted = {ride_id for ride_id in self.noted if ride_id > self.last_ride_id}
+            self.synced_at = time.monotonic()
+
+    def note_ride(self, ride):
+        """Add a ride created in this process."""
+        if self.built_at is None:
+            return
+        with self.lock:
+            if ride.id <= self.last_ride_id or ride.id in self.noted:
+                return
+            for field in LOCATION_FIELDS:
+                self._add(getattr(ride, field))
+            self.noted.add(ride.id)
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.built_at is None or now - self.built_at > REBUILD_SECONDS:
+            self.rebuild()
+        elif now - self.synced_at > SYNC_SECONDS:
+            self.sync()
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """Up to `limit` [(location, rides)] whose words start with `query`, most used first."""
+        prefix = normalize_location(query)
+        if not prefix:
+            return []
+        self.refresh()
+        with self.lock:
+            start = bisect_left(self.entries, (prefix,))
+            end = bisect_left(self.entries, (prefix + '\uffff',), start)
+            matches = {key for _, key in self.entries[start:end]}
+            best = heapq.nsmallest(limit, matches, key=lambda key: (-self.weights[key], key))
+            return [(self.spellings[key].most_common(1)[0][0], self.weights[key]) for key in best]
+
+
+location_index = LocationIndex()
@@ -0,0 +1,60 @@
+# rides/availability.py
+"""
+Per-day availability for a route.
+
+route_calendar() answers "on which days can I travel, and from what price"
+with a single GROUP BY over the bookable rides of a route: ride count, free
+seats and cheapest price per local calendar day. Passengers no longer page
+through the ride list one day at a time to find out.
+
+Filtering by destination_place (rides.gazetteer) makes it a range scan of
+ride_destination_place_idx, (destination_place, departure_time). The
+calendar is cached under the same route generations as the ride list (see
+rides.cache), so a ride write on the route invalidates it.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+MAX_CALENDAR_DAYS = 92
+DEFAULT_CALENDAR_DAYS = 31
+
+
+def day_bounds(first_day, last_day):
+    """Aware datetimes from the start of `first_day` to the end of `last_day`, local time."""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(first_day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def route_calendar(rides, first_day, last_day):
+    """
+    One row per day from `first_day` to `last_day` (inclusive) for the bookable
+    rides in `rides`: {'date', 'rides', 'seats', 'min_price'}. Days without
+    rides have zero counts and no price.
+    """
+    start, end = day_bounds(first_day, last_day)
+    groups = (
+        rides.filter(status='available', departure_time__gte=max(start, timezone.now()), departure_time__lt=end)
+        .annotate(day=TruncDate('departure_time', tzinfo=timezone.get_current_timezone()))
+        .values('day')
+        .order_by()
+        .annotate(rides=Count('id'), seats=Sum('available_seats'), min_price=Min('price'))
+    )
+    by_day = {group['day']: group for group in groups}
+
+    calendar = []
+    day = first_day
+    while day <= last_day:
+        group = by_day.get(day)
+        calendar.append({
+            'date': day,
+            'rides': group['rides'] if group else 0,
+            'seats': group['seats'] if group else 0,
+            'min_price': group['min_price'] if group else None,
+        })
+        day += timedelta(days=1)
+    return calendar
@@ -0,0 +1,145 @@
+# rides/cache.py
+"""
+Generation-based namespaces for cached ride lists.
+
+Cached list pages never get deleted. Their keys embed generation counters,
+and a ride write bumps the counters it affects, so later reads miss and the
+old entries expire through their TTL. Bumping a counter is a single atomic
+INCR, unlike a delete_pattern() SCAN over the whole keyspace.
+
+A query that filters by route reads one counter per search token. Each token
+maps to a bucket named after its first three characters. A ride bumps the
+buckets of its departure and destination tokens, plus the global counter that
+unfiltered lists use. A booking in Nakuru therefore leaves cached Mombasa
+searches alone.
+
+List pages hold only ride ids. The serialized rides are cached separately as
+one fragment per ride, keyed by (ride id, updated_at). Every ride write moves
+updated_at, which gives the ride a new key, so overlapping queries share
+fragments and a change makes only that ride miss. Changes to what a fragment
+embeds from elsewhere (the driver's profile and rating, image srcsets) go
+through touch_rides(), which moves updated_at the same way.
+
+Each user also has a change version under the same counter scheme
+(`user:<id>`). Conditional GET validators read it (see rides.conditional).
+"""
+import hashlib
+
+from django.core.cache import cache
+
+from .search import SEARCH_FIELDS, tokenize
+
+LIST_CACHE_TIMEOUT = 60 * 5
+# Fragments also embed the driver's profile, which does not touch ride.updated_at
+FRAGMENT_CACHE_TIMEOUT = 60 * 15
+FRAGMENT_KEY_PREFIX = 'ride_fragment'
+GENERATION_KEY_PREFIX = 'rides_gen'
+GLOBAL_SCOPE = 'all'
+BUCKET_LENGTH = 3
+
+
+def _generation_key(scope):
+    return f"{GENERATION_KEY_PREFIX}:{scope}"
+
+
+def route_scopes(field, value):
+    """Generation scopes covering a search on `field`, or None if too broad to bucket."""
+    tokens = tokenize(value)
+    if not tokens or any(len(token) < BUCKET_LENGTH for token in tokens):
+        return None
+    return {f"{SEARCH_FIELDS[field]}:{token[:BUCKET_LENGTH]}" for token in tokens}
+
+
+def ride_scopes(ride):
+    """Every generation scope a change to `ride` has to bump."""
+    scopes = {GLOBAL_SCOPE}
+    for field, kind in SEARCH_FIELDS.items():
+        scopes.update(f"{kind}:{token[:BUCKET_LENGTH]}" for token in tokenize(getattr(ride, field)))
+    return scopes
+
+
+def query_scopes(params):
+    """Generation scopes a list query depends on."""
+    if 'lat' in params:
+        return {GLOBAL_SCOPE}
+    scopes = set()
+    for field in SEARCH_FIELDS:
+        if params.get(field):
+            field_scopes = route_scopes(field, params[field])
+            if field_scopes is None:
+                return {GLOBAL_SCOPE}
+            scopes.update(field_scopes)
+    return scopes or {GLOBAL_SCOPE}
+
+
+def get_generations(scopes):
+    keys = {scope: _generation_key(scope) for scope in scopes}
+    found = cache.get_many(list(keys.values()))
+    return {scope: found.get(key, 0) for scope, key in keys.items()}
+
+
+def bump_generations(scopes):
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # First bump for this scope; if another process created it meanwhile, incr that.
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+
+def invalidate_ride_lists(*rides):
+    """Move every list namespace that can contain these rides to a new generation."""
+    scopes = set()
+    for ride in rides:
+        scopes |= ride_scopes(ride)
+    bump_generations(scopes)
+
+
+def touch_rides(rides):
+    """
+    Give `rides` (a Ride queryset) a new updated_at and move their list
+    namespaces, after a change to data their fragments embed from other rows.
+    """
+    from django.utils import timezone
+
+    from .models import Ride
+
+    touched = list(rides.order_by().only('id', *SEARCH_FIELDS))
+    if touched:
+        Ride.objects.filter(id__in=[ride.id for ride in touched]).update(updated_at=timezone.now())
+        invalidate_ride_lists(*touched)
+    return len(touched)
+
+
+def touch_driver_rides(*driver_ids):
+    """touch_rides() for every ride of these drivers, e.g. after a profile edit."""
+    from .models import Ride
+
+    return touch_rides(Ride.objects.filter(driver_id__in=[driver_id for driver_id in driver_ids if driver_id]))
+
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+def bump_user_versions(*user_ids):
+    """Move the change version of each user, e.g. after one of their bookings or reviews changed."""
+    bump_generations({user_scope(user_id) for user_id in user_ids if user_id})
+
+
+def list_cache_key(prefix, params):
+    """Cache key for a list query, namespaced by the generations it depends on."""
+    generations = get_generations(query_scopes(params))
+    namespace = ','.join(f"{scope}={generations[scope]}" for scope in sorted(generations))
+    digest = hashlib.md5(f"{namespace}|{params.urlencode()}".encode('utf-8')).hexdigest()
+    return f"{prefix}_{digest}"
+
+
+def fragment_stamp(updated_at):
+    return f"{updated_at.timestamp():.6f}"
+
+
+def fragment_key(ride_id, stamp):
+    return f"{FRAGMENT_KEY_PREFIX}:{ride_id}:{stamp}"
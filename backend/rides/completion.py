@@ -0,0 +1,93 @@
+# rides/completion.py
+"""
+Set-based ride completion.
+
+complete_rides() locks a batch of rides and snapshots their confirmed
+bookings, capturing the passengers before anything changes. It then marks the
+rides and those bookings completed with one UPDATE each and notifies the
+passengers with a single bulk INSERT. Completing one ride from the API and
+completing every past ride from `manage.py complete_rides` go through the
+same code.
+"""
+import logging
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from accounts.models import Notification
+
+from .cache import bump_user_versions, invalidate_ride_lists
+from .models import Booking, Ride
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_BATCH_SIZE = 500
+# Rides a batch run completes once they have departed; pending_payment rides were never live
+COMPLETABLE_STATUSES = ('available', 'fully_booked', 'departed')
+
+
+def complete_rides(rides, now=None, batch_size=COMPLETION_BATCH_SIZE, skip_locked=True):
+    """
+    Complete every ride in the `rides` queryset that is not completed yet,
+    along with its confirmed bookings. Returns {'rides': n, 'bookings': n}.
+
+    Batch runs skip rides locked by a booking in flight and pick them up next
+    time; pass skip_locked=False to wait for them instead.
+    """
+    now = now or timezone.now()
+    completed = {'rides': 0, 'bookings': 0}
+
+    while True:
+        with db_transaction.atomic():
+            batch = list(
+                rides.exclude(status='completed')
+                .select_for_update(skip_locked=skip_locked, of=('self',))
+                .order_by('departure_time', 'id')
+                .only('id', 'driver_id', 'departure_location', 'destination')[:batch_size]
+            )
+            if not batch:
+                break
+            ride_ids = [ride.id for ride in batch]
+            by_id = {ride.id: ride for ride in batch}
+
+            # Snapshot first: after the UPDATE, status='confirmed' no longer finds these bookings
+            bookings = list(
+                Booking.objects.filter(ride_id__in=ride_ids, status='confirmed').values_list('id', 'user_id', 'ride_id')
+            )
+            Ride.objects.filter(id__in=ride_ids).update(status='completed', updated_at=now)
+            Booking.objects.filter(id__in=[booking_id for booking_id, _, _ in bookings]).update(
+                status='completed', updated_at=now
+            )
+            Notification.objects.bulk_create([
+                Notification(
+                    user_id=user_id,
+                    title="Ride Completed",
+                    message=(
+                        f"Your ride from {by_id[ride_id].departure_location} to {by_id[ride_id].destination} "
+                        f"has been marked as completed. Please leave a review for your driver!"
+                    ),
+                    notification_type="success"
+                )
+                for _, user_id, ride_id in bookings
+            ])
+
+            user_ids = {user_id for _, user_id, _ in bookings} | {ride.driver_id for ride in batch}
+            db_transaction.on_commit(lambda batch=batch: invalidate_ride_lists(*batch))
+            db_transaction.on_commit(lambda user_ids=user_ids: bump_user_versions(*user_ids))
+
+        completed['rides'] += len(batch)
+        completed['bookings'] += len(bookings)
+        if len(batch) < batch_size:
+            break
+
+    if completed['rides']:
+        logger.info(f"Completed {completed['rides']} ride(s) and {completed['bookings']} booking(s).")
+    return completed
+
+
+def past_rides(cutoff, driver=None):
+    """Rides that departed before `cutoff` and can be completed, optionally for one driver."""
+    rides = Ride.objects.filter(departure_time__lt=cutoff, status__in=COMPLETABLE_STATUSES)
+    if driver is not None:
+        rides = rides.filter(driver=driver)
+    return rides
@@ -0,0 +1,141 @@
+# rides/conditional.py
+"""
+Conditional GET (ETag / Last-Modified) for the ride, booking and review endpoints.
+
+By default the validators for a list or detail request come from one aggregate
+over the queryset the view would serialize: the newest `updated_at` and the
+row count. The row count catches deletions. They also include the requesting
+user's change version from rides.cache, which moves whenever one of the user's
+bookings or reviews changes, including writes that use update_fields and
+therefore leave `updated_at` alone. If the client's If-None-Match or
+If-Modified-Since still matches, the view answers 304 before serializing.
+
+Views that already know what their response depends on build the validators
+themselves and call check_conditional() from the handler. The passenger ride
+list does this from its list cache key and the fragment stamps of the cached
+page, so a repeated request touches no table at all.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_generations, user_scope
+
+
+class NotModified(Exception):
+    """Short-circuits dispatch with a 304 (or 412) response built from the validators."""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+def revalidate_or_never_cache(view_func):
+    """
+    Replacement for never_cache on views using ConditionalGetMixin.
+
+    A response that has an ETag may be stored privately but must be revalidated
+    before every use. never_cache's `no-store` would make clients drop it, so
+    they could never send If-None-Match. Responses without a validator keep
+    never_cache's headers.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if response.has_header('ETag'):
+            patch_cache_control(response, private=True, no_cache=True, max_age=0)
+        else:
+            add_never_cache_headers(response)
+        return response
+    return wrapper
+
+
+class ConditionalGetMixin:
+    """ETag / Last-Modified handling for the list and retrieve actions of a ViewSet."""
+    conditional_actions = ('list', 'retrieve')
+    # Timestamps whose newest value changes the payload; the first one becomes Last-Modified
+    conditional_timestamp_fields = ('updated_at',)
+
+    def get_conditional_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset
+
+    def get_user_version(self, request):
+        """The requesting user's change version, 0 for anonymous users."""
+        user = request.user
+        if not user.is_authenticated:
+            return 0
+        scope = user_scope(user.pk)
+        return get_generations([scope])[scope]
+
+    def make_etag(self, request, *parts):
+        """An ETag over the request, the user and their change version, and `parts`."""
+        user = request.user
+        fingerprint = '|'.join([
+            request.get_full_path(),
+            request.accepted_media_type or '',
+            str(user.pk),
+            getattr(user, 'user_type', ''),
+            str(self.get_user_version(request)),
+            *[str(part) for part in parts],
+        ])
+        return quote_etag(hashlib.md5(fingerprint.encode('utf-8')).hexdigest())
+
+    def get_validators(self, request):
+        """(etag, last_modified) for the current request, or None when there is nothing to validate."""
+        aggregates = {
+            f'newest_{index}': Max(field)
+            for index, field in enumerate(self.conditional_timestamp_fields)
+        }
+        stats = self.get_conditional_queryset().order_by().aggregate(
+            rows=Count('pk', distinct=True), **aggregates
+        )
+        if self.action == 'retrieve' and not stats['rows']:
+            # Let the view raise its usual 404
+            return None
+
+        stamps = [stats[f'newest_{index}'] for index in range(len(self.conditional_timestamp_fields))]
+        etag = self.make_etag(
+            request, stats['rows'], *[stamp.isoformat() if stamp else '' for stamp in stamps]
+        )
+        return etag, stamps[0]
+
+    def check_conditional(self, request, etag, last_modified=None):
+        """Serve the response under these validators; raise NotModified if the client's copy is current."""
+        self.conditional_validators = (etag, last_modified)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request._request, etag=etag, last_modified=timestamp)
+        if response is not None:
+            raise NotModified(response)
+
+    def initial(self, request, *args, **kwargs):
+        # Runs after authentication, permission and throttling checks, before the handler
+        super().initial(request, *args, **kwargs)
+        self.conditional_validators = None
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return
+
+        validators = self.get_validators(request)
+        if validators is not None:
+            self.check_conditional(request, *validators)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, 'conditional_validators', None)
+        if validators and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
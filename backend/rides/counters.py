@@ -0,0 +1,35 @@
+# rides/counters.py
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+SOLD_STATUSES = ('confirmed', 'completed')
+
+
+def recompute_ride_counters(rides, bookings):
+    """
+    Recompute Ride.booking_count / confirmed_seat_count for the `rides` queryset
+    from the `bookings` manager in one set-based UPDATE. Takes the managers as
+    arguments so data migrations can pass historical models.
+    """
+    per_ride = bookings.filter(ride_id=OuterRef('pk')).order_by().values('ride_id')
+    booking_count = per_ride.annotate(total=Count('id')).values('total')
+    seat_count = (
+        per_ride.filter(status__in=SOLD_STATUSES)
+        .annotate(total=Sum('no_of_seats'))
+        .values('total')
+    )
+    return rides.update(
+        booking_count=Coalesce(Subquery(booking_count, output_field=IntegerField()), Value(0)),
+        confirmed_seat_count=Coalesce(Subquery(seat_count, output_field=IntegerField()), Value(0)),
+    )
+
+
+def recompute_held_seats(rides, bookings):
+    """Recompute Ride.held_seats for the `rides` queryset from the live holds in `bookings`."""
+    held = (
+        bookings.filter(ride_id=OuterRef('pk'), status='pending', hold_expires_at__isnull=False)
+        .order_by().values('ride_id')
+        .annotate(total=Sum('no_of_seats'))
+        .values('total')
+    )
+    return rides.update(held_seats=Coalesce(Subquery(held, output_field=IntegerField()), Value(0)))
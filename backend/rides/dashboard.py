@@ -0,0 +1,87 @@
+# rides/dashboard.py
+"""
+Driver dashboard summary.
+
+driver_summary() returns what the dashboard used to collect from the four
+category lists, the bookings list and the wallet. It takes three queries:
+- one conditional aggregate over the driver's rides (ride_driver_category_idx)
+  for the category counts, seats sold and earnings, read from the
+  denormalized booking counters;
+- one aggregate for the pending booking requests on upcoming rides;
+- the next few departures.
+
+The result is cached per driver under the driver's change version from
+rides.cache. Booking writes, ride saves and deletions, completion and hold
+expiry move that version. Categories also change as departure times pass, so
+an entry never outlives the driver's next departure.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import LIST_CACHE_TIMEOUT, get_generations, user_scope
+from .models import Booking, Ride
+
+UPCOMING_LIMIT = 5
+DASHBOARD_KEY_PREFIX = 'driver_dashboard'
+
+
+def driver_summary(driver_id, now=None):
+    now = now or timezone.now()
+    open_rides = ~Q(status='completed')
+    # Same categories as RideViewSet.get_queryset's `category` filter
+    totals = Ride.objects.filter(driver_id=driver_id).aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(departure_time__gte=now) & open_rides),
+        completed=Count('id', filter=Q(status='completed')),
+        past=Count('id', filter=Q(departure_time__lt=now, booking_count__gt=0) & open_rides),
+        expired=Count('id', filter=Q(departure_time__lt=now, booking_count=0) & open_rides),
+        seats_sold=Coalesce(Sum('confirmed_seat_count'), 0),
+        # Fares of confirmed and completed seats, before any payout
+        earnings=Coalesce(
+            Sum(F('price') * F('confirmed_seat_count'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    )
+    pending = Booking.objects.filter(
+        ride__driver_id=driver_id, ride__departure_time__gte=now, status='pending'
+    ).aggregate(requests=Count('id'), seats=Coalesce(Sum('no_of_seats'), 0))
+    upcoming = list(
+        Ride.objects.filter(driver_id=driver_id, departure_time__gte=now).filter(open_rides)
+        .order_by('departure_time', 'id')
+        .values(
+            'id', 'departure_location', 'destination', 'departure_time',
+            'available_seats', 'booking_count', 'status'
+        )[:UPCOMING_LIMIT]
+    )
+
+    return {
+        'categories': {category: totals[category] for category in ('active', 'completed', 'past', 'expired')},
+        'total_rides': totals['total'],
+        'upcoming': upcoming,
+        'pending_requests': pending['requests'],
+        'pending_seats': pending['seats'],
+        'seats_sold': totals['seats_sold'],
+        'earnings': str(Decimal(totals['earnings']).quantize(Decimal('0.01'))),
+    }
+
+
+def cached_driver_summary(driver_id):
+    """driver_summary(), cached until the driver's version moves or their next ride departs."""
+    scope = user_scope(driver_id)
+    version = get_generations({scope})[scope]
+    key = f"{DASHBOARD_KEY_PREFIX}:{driver_id}:{version}"
+    summary = cache.get(key)
+    if summary is None:
+        now = timezone.now()
+        summary = driver_summary(driver_id, now)
+        timeout = LIST_CACHE_TIMEOUT
+        if summary['upcoming']:
+            timeout = min(timeout, int((summary['upcoming'][0]['departure_time'] - now).total_seconds()))
+        if timeout > 0:
+            cache.set(key, summary, timeout=timeout)
+    return summary
@@ -0,0 +1,200 @@
+# rides/demand.py
+"""
+Route demand rollup.
+
+RouteDemand has one row per (normalized departure, normalized destination,
+local hour of the week). It holds the number of route searches, bookings,
+seats sold and the revenue behind them, so demand by route and time is an
+indexed read rather than an aggregate over every Booking joined to Ride.
+
+The rollup is kept current incrementally:
+- Booking.save/delete report every change in sold seats once it commits
+  (record_sale), including cancellations, which subtract;
+- the passenger ride list counts each route search in the cache (log_search),
+  with one INCR on a counter per route and hour of the week, and `manage.py
+  rollup_route_demand` drains those counters into the table.
+
+Counters live in five-minute buckets. A search only ever writes to the current
+bucket and the rollup only drains buckets that have closed, so no search is
+lost between reading a counter and deleting it. Each bucket lists its counters
+in numbered slots, written by whichever search created the counter. Buckets
+the rollup never drains expire after a day.
+
+`manage.py rollup_route_demand --rebuild` recomputes the booking columns from
+scratch, for a first load or to repair drift.
+"""
+import hashlib
+import logging
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Booking, RouteDemand
+from .search import normalize_location
+
+logger = logging.getLogger(__name__)
+
+BOOKING_FIELDS = ('bookings', 'seats_sold', 'price_total')
+
+SEARCH_KEY_PREFIX = 'route_searches'
+SEARCH_BUCKET_SECONDS = 5 * 60
+SEARCH_COUNTER_TIMEOUT = 24 * 60 * 60
+
+
+def hour_of_week(moment):
+    local = timezone.localtime(moment)
+    return local.weekday() * 24 + local.hour
+
+
+def _increment(departure, destination, hour, **deltas):
+    """Add `deltas` to one rollup row, creating it on first use."""
+    key = {'departure': departure, 'destination': destination, 'hour_of_week': hour}
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if RouteDemand.objects.filter(**key).update(**changes, updated_at=timezone.now()):
+        return
+    try:
+        with db_transaction.atomic():
+            RouteDemand.objects.create(**key, **deltas)
+    except IntegrityError:
+        # Created concurrently
+        RouteDemand.objects.filter(**key).update(**changes, updated_at=timezone.now())
+
+
+def record_sale(ride, bookings, seats):
+    """Count `bookings` bookings and `seats` sold seats (negative to take back) on the ride's route and hour."""
+    _increment(
+        ride.departure_search or normalize_location(ride.departure_location),
+        ride.destination_search or normalize_location(ride.destination),
+        hour_of_week(ride.departure_time),
+        bookings=bookings,
+        seats_sold=seats,
+        price_total=ride.price * seats,
+    )
+
+
+def _search_bucket(moment):
+    return int(moment.timestamp() // SEARCH_BUCKET_SECONDS)
+
+
+def _search_key(bucket, *parts):
+    return ':'.join([SEARCH_KEY_PREFIX, str(bucket), *[str(part) for part in parts]])
+
+
+def _counter_key(bucket, route):
+    digest = hashlib.md5('|'.join(str(part) for part in route).encode('utf-8')).hexdigest()
+    return _search_key(bucket, 'count', digest)
+
+
+def _incr(key):
+    """Increment a cache counter, creating it on first use. Returns the new value."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout=SEARCH_COUNTER_TIMEOUT):
+            return 1
+        return cache.incr(key)
+
+
+def log_search(params):
+    """Count a passenger search that names both ends of a route. The hour is the one searched for, else now."""
+    departure = normalize_location(params.get('departure_location'))
+    destination = normalize_location(params.get('destination'))
+    if not departure or not destination:
+        return
+    moment = parse_datetime(params.get('date_after') or '') or timezone.now()
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    route = (departure[:100], destination[:100], hour_of_week(moment))
+    bucket = _search_bucket(timezone.now())
+    if _incr(_counter_key(bucket, route)) == 1:
+        # First search of this route and hour in the bucket: list the counter for the rollup
+        slot = _incr(_search_key(bucket, 'slots'))
+        cache.set(_search_key(bucket, 'slot', slot), route, timeout=SEARCH_COUNTER_TIMEOUT)
+
+
+def _drain_search_counters(now):
+    """Searches counted in the closed buckets not yet drained, as a Counter of routes, and the keys to delete."""
+    # The bucket before the current one may still see a search that started before it closed
+    last = _search_bucket(now) - 2
+    drained = cache.get(_search_key('drained'))
+    first = max(
+        drained + 1 if drained is not None else 0,
+        last - SEARCH_COUNTER_TIMEOUT // SEARCH_BUCKET_SECONDS,
+    )
+    searches = Counter()
+    keys = []
+    for bucket in range(first, last + 1):
+        slots = cache.get(_search_key(bucket, 'slots'))
+        if not slots:
+            continue
+        slot_keys = [_search_key(bucket, 'slot', slot) for slot in range(1, slots + 1)]
+        routes = list(cache.get_many(slot_keys).values())
+        counter_keys = [_counter_key(bucket, route) for route in routes]
+        counts = cache.get_many(counter_keys)
+        for route, key in zip(routes, counter_keys):
+            searches[tuple(route)] += counts.get(key, 0)
+        keys += [_search_key(bucket, 'slots'), *slot_keys, *counter_keys]
+    return searches, keys, last
+
+
+def roll_up_searches(now=None):
+    """Fold the searches counted in closed buckets into RouteDemand and clear them. Returns the number of searches."""
+    searches, keys, last = _drain_search_counters(now or timezone.now())
+    with db_transaction.atomic():
+        for (departure, destination, hour), count in searches.items():
+            if count:
+                _increment(departure, destination, hour, searches=count)
+    cache.set(_search_key('drained'), last, timeout=None)
+    cache.delete_many(keys)
+
+    total = sum(searches.values())
+    logger.info(f"Rolled {total} route search(es) into the demand table.")
+    return total
+
+
+def rebuild_booking_demand():
+    """Recompute the booking columns of the whole rollup from sold bookings. Returns the number of rows."""
+    now = timezone.now()
+    tz = timezone.get_current_timezone()
+    groups = (
+        Booking.objects.filter(status__in=Booking.SOLD_STATUSES)
+        .values(
+            departure=F('ride__departure_search'),
+            destination=F('ride__destination_search'),
+            weekday=ExtractIsoWeekDay('ride__departure_time', tzinfo=tz),
+            hour=ExtractHour('ride__departure_time', tzinfo=tz),
+        )
+        .order_by()
+        .annotate(
+            bookings=Count('id'),
+            seats_sold=Sum('no_of_seats'),
+            price_total=Sum(F('ride__price') * F('no_of_seats'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+    )
+    rows = [
+        RouteDemand(
+            departure=group['departure'],
+            destination=group['destination'],
+            hour_of_week=(group['weekday'] - 1) * 24 + group['hour'],
+            bookings=group['bookings'],
+            seats_sold=group['seats_sold'],
+            price_total=group['price_total'],
+            updated_at=now,
+        )
+        for group in groups
+    ]
+    with db_transaction.atomic():
+        RouteDemand.objects.update(bookings=0, seats_sold=0, price_total=0, updated_at=now)
+        RouteDemand.objects.bulk_create(
+            rows,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['departure', 'destination', 'hour_of_week'],
+            update_fields=[*BOOKING_FIELDS, 'updated_at'],
+        )
+    return len(rows)
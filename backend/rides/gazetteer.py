@@ -0,0 +1,105 @@
+# rides/gazetteer.py
+"""
+Location gazetteer.
+
+Free-text ride locations resolve to Place rows. Each place has one or more
+PlaceAlias rows holding a normalized spelling (rides.search.normalize_location),
+so "Nairobi", " nairobi," and "NAIROBI" are one alias of one place. Ride.save
+resolves departure_location and destination into departure_place and
+destination_place. A spelling seen for the first time becomes a new place with
+itself as the only alias.
+
+Spellings of the same place that normalize differently ("NRB", "Nairobi CBD")
+are folded together with merge_places() (an admin action), which moves their
+aliases and rides onto one place. Filtering rides by place id is then an
+equality on ride_departure_place_idx / ride_destination_place_idx instead of a
+text match.
+
+`manage.py canonicalize_ride_places` resolves existing rides in batches.
+"""
+import logging
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+
+from .models import Place, PlaceAlias, Ride
+from .search import normalize_location
+
+logger = logging.getLogger(__name__)
+
+ALIAS_LENGTH = 100
+
+
+def alias_key(location):
+    return normalize_location(location)[:ALIAS_LENGTH]
+
+
+def find_place(location):
+    """Id of the place `location` is an alias of, or None. Never creates one."""
+    key = alias_key(location)
+    if not key:
+        return None
+    return PlaceAlias.objects.filter(alias=key).values_list('place_id', flat=True).first()
+
+
+def resolve_place(location):
+    """Id of the place `location` is an alias of, creating the place on first sight. None for blank text."""
+    key = alias_key(location)
+    if not key:
+        return None
+    place_id = PlaceAlias.objects.filter(alias=key).values_list('place_id', flat=True).first()
+    if place_id is not None:
+        return place_id
+    try:
+        with db_transaction.atomic():
+            place = Place.objects.create(name=location.strip()[:100])
+            PlaceAlias.objects.create(place=place, alias=key)
+            return place.id
+    except IntegrityError:
+        # Created concurrently; the savepoint dropped our place along with the alias
+        return PlaceAlias.objects.get(alias=key).place_id
+
+
+def resolve_places(locations):
+    """{location: place id} for many locations, with one alias query for the spellings already known."""
+    keys = {location: alias_key(location) for location in set(locations)}
+    known = dict(
+        PlaceAlias.objects.filter(alias__in={key for key in keys.values() if key})
+        .values_list('alias', 'place_id')
+    )
+    resolved = {}
+    for location, key in keys.items():
+        if key and key not in known:
+            known[key] = resolve_place(location)
+        resolved[location] = known.get(key)
+    return resolved
+
+
+def canonicalize_rides(rides):
+    """Set departure_place and destination_place on each of `rides` (a list). Saves nothing."""
+    places = resolve_places([ride.departure_location for ride in rides] + [ride.destination for ride in rides])
+    for ride in rides:
+        ride.departure_place_id = places[ride.departure_location]
+        ride.destination_place_id = places[ride.destination]
+    return rides
+
+
+def merge_places(target, places):
+    """Fold `places` into `target`: their aliases and rides move over and they are deleted. Returns rides moved."""
+    from .cache import GLOBAL_SCOPE, bump_generations
+
+    place_ids = [place.id for place in places if place.id != target.id]
+    if not place_ids:
+        return 0
+    now = timezone.now()
+    with db_transaction.atomic():
+        PlaceAlias.objects.filter(place_id__in=place_ids).update(place=target)
+        # updated_at moves too, so cached ride fragments pick up the new place ids
+        moved = Ride.objects.filter(departure_place_id__in=place_ids).update(departure_place=target, updated_at=now)
+        moved += Ride.objects.filter(destination_place_id__in=place_ids).update(destination_place=target, updated_at=now)
+        Place.objects.filter(id__in=place_ids).delete()
+        if moved:
+            # Place filters are cached under the global scope, which any ride bumps
+            db_transaction.on_commit(lambda: bump_generations({GLOBAL_SCOPE}))
+    logger.info(f"Merged {len(place_ids)} place(s) into place {target.id}; {moved} ride location(s) moved.")
+    return moved
@@ -0,0 +1,148 @@
+# rides/geo.py
+"""
+Geohash helpers for "rides near me" searches.
+
+Each ride stores a geohash of its pickup and drop-off coordinates. A radius
+search picks the geohash precision whose cells are at least as large as the
+radius, so the 3x3 block of cells around the search point always covers the
+whole circle. Each cell becomes a half-open range on the indexed geohash
+column, from the cell up to the next cell of the same length, and only the
+rows inside them are ranked by haversine distance in SQL. Both bounds are
+made of geohash characters (digits and lowercase letters), which sort the
+same under byte and linguistic collations. A LIKE prefix match would not do:
+SQLite's LIKE is case-insensitive and cannot use the B-tree index.
+"""
+import math
+
+from django.db.models import F, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+STORED_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+MAX_RADIUS_KM = 200
+
+GEO_FIELDS = {
+    'departure': ('departure_latitude', 'departure_longitude', 'departure_geohash'),
+    'destination': ('destination_latitude', 'destination_longitude', 'destination_geohash'),
+}
+
+
+def encode(latitude, longitude, precision=STORED_PRECISION):
+    """Encode a coordinate as a geohash string."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits <<= 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(latitude span, longitude span) in degrees of a cell at this precision."""
+    total_bits = precision * 5
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def precision_for_radius(latitude, radius_km):
+    """Finest precision whose cells are still at least `radius_km` tall and wide."""
+    lng_scale = max(math.cos(math.radians(latitude)), 0.01)
+    for precision in range(STORED_PRECISION, 0, -1):
+        lat_span, lng_span = cell_size(precision)
+        if lat_span * KM_PER_DEGREE >= radius_km and lng_span * KM_PER_DEGREE * lng_scale >= radius_km:
+            return precision
+    return 1
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """The cell containing the point plus its eight neighbours."""
+    precision = precision_for_radius(latitude, radius_km)
+    lat_span, lng_span = cell_size(precision)
+    cells = set()
+    for dlat in (-1, 0, 1):
+        lat = latitude + dlat * lat_span
+        if lat < -90 or lat > 90:
+            continue
+        for dlng in (-1, 0, 1):
+            lng = (longitude + dlng * lng_span + 180) % 360 - 180
+            cells.add(encode(lat, lng, precision))
+    return sorted(cells)
+
+
+def next_cell(cell):
+    """The first geohash after every hash under `cell`, or None if `cell` is the last one."""
+    head = cell.rstrip(BASE32[-1])
+    if not head:
+        return None
+    return head[:-1] + BASE32[BASE32.index(head[-1]) + 1]
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two coordinates, in kilometres."""
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (math.sin(dlat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def filter_near(queryset, latitude, longitude, radius_km, point='departure'):
+    """
+    Restrict a Ride queryset to rides whose pickup (or drop-off) lies within
+    `radius_km`, annotated with `distance_km` and ordered nearest first.
+    """
+    lat_field, lng_field, hash_field = GEO_FIELDS[point]
+
+    cell_filter = Q()
+    for cell in covering_cells(latitude, longitude, radius_km):
+        # Every hash under the cell, as an index range scan
+        upper = next_cell(cell)
+        cell_range = Q(**{f'{hash_field}__gte': cell})
+        if upper is not None:
+            cell_range &= Q(**{f'{hash_field}__lt': upper})
+        cell_filter |= cell_range
+
+    lat_rad = math.radians(latitude)
+    dlat = Radians(F(lat_field)) - Value(lat_rad)
+    dlng = Radians(F(lng_field)) - Value(math.radians(longitude))
+    a = (
+        Power(Sin(dlat / 2), 2)
+        + Value(math.cos(lat_rad)) * Cos(Radians(F(lat_field))) * Power(Sin(dlng / 2), 2)
+    )
+    distance = Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(a))
+
+    return (
+        queryset.filter(cell_filter)
+        .annotate(distance_km=distance)
+        .filter(distance_km__lte=radius_km)
+        .order_by('distance_km', 'departure_time', 'id')
+    )
@@ -0,0 +1,139 @@
+# rides/holds.py
+"""
+Time-boxed seat holds for bookings paid through M-Pesa or card.
+
+A hold takes the booking's seats from the ride straight away (rides.inventory)
+and stamps the booking with `hold_expires_at`. Ride.held_seats counts the
+seats currently held, so the seats of a ride that are waiting on a payment are
+a single column read. When the payment callback arrives, end_hold() turns the
+hold into an ordinary deduction. Holds whose callback never arrives are
+cancelled in bulk by expire_holds(), which `manage.py expire_seat_holds` runs
+periodically. Seats it releases go to the ride's waitlist first (rides.waitlist).
+An expired booking keeps its `hold_expires_at`, so a payment that arrives late
+can still confirm it if the seats are free (Booking.confirm_payment).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import Notification
+
+from . import seat_counter
+from .cache import bump_user_versions, invalidate_ride_lists
+from .inventory import sync_segment_seats
+from .models import Booking, Ride, RideSegment
+
+EXPIRY_BATCH_SIZE = 1000
+
+
+def hold_ttl():
+    return timedelta(minutes=settings.SEAT_HOLD_MINUTES)
+
+
+def place_hold(booking, ttl=None):
+    """Take the pending booking's seats until it is paid or the hold runs out."""
+    with db_transaction.atomic():
+        booking.reduce_seats()
+        booking.hold_expires_at = timezone.now() + (ttl or hold_ttl())
+        Booking.objects.filter(pk=booking.pk).update(hold_expires_at=booking.hold_expires_at)
+        Ride.objects.filter(pk=booking.ride_id).update(held_seats=F('held_seats') + booking.no_of_seats)
+
+
+def end_hold(booking):
+    """
+    Stop counting the booking's seats as held, leaving them deducted.
+
+    Returns False if the hold was already gone, e.g. released by the sweeper
+    before the payment arrived.
+    """
+    with db_transaction.atomic():
+        ended = Booking.objects.filter(
+            pk=booking.pk, status='pending', hold_expires_at__isnull=False
+        ).update(hold_expires_at=None)
+        if ended:
+            Ride.objects.filter(pk=booking.ride_id).update(held_seats=F('held_seats') - booking.no_of_seats)
+    booking.hold_expires_at = None
+    return bool(ended)
+
+
+def expire_holds(now=None, batch_size=EXPIRY_BATCH_SIZE):
+    """
+    Cancel every pending booking whose hold has run out and give its seats back.
+
+    Each batch is one set-based UPDATE on the affected rides and one on the
+    bookings. Rows locked by a payment callback in flight are skipped and
+    picked up by the next sweep. Returns the number of holds released.
+    """
+    now = now or timezone.now()
+    released = 0
+
+    while True:
+        with db_transaction.atomic():
+            rows = list(
+                Booking.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(status='pending', hold_expires_at__lte=now)
+                .order_by('hold_expires_at', 'id')
+                .values_list('id', 'ride_id', 'user_id', 'ride__driver_id')[:batch_size]
+            )
+            if not rows:
+                break
+
+            booking_ids = [row[0] for row in rows]
+            ride_ids = {row[1] for row in rows}
+            held = (
+                Booking.objects.filter(id__in=booking_ids, ride_id=OuterRef('pk'))
+                .order_by().values('ride_id')
+                .annotate(total=Sum('no_of_seats'))
+                .values('total')
+            )
+            seats = Coalesce(Subquery(held, output_field=IntegerField()), Value(0))
+            Ride.objects.filter(id__in=ride_ids).update(
+                available_seats=F('available_seats') + seats,
+                held_seats=F('held_seats') - seats,
+                status=Case(When(status='fully_booked', then=Value('available')), default=F('status')),
+                updated_at=now,
+            )
+            # Multi-stop rides keep their seats per segment: give back what each segment lent
+            covering = (
+                Booking.objects.filter(
+                    id__in=booking_ids, ride_id=OuterRef('ride_id'),
+                    from_stop__lte=OuterRef('sequence'), to_stop__gt=OuterRef('sequence')
+                )
+                .order_by().values('ride_id')
+                .annotate(total=Sum('no_of_seats'))
+                .values('total')
+            )
+            RideSegment.objects.filter(ride_id__in=ride_ids).update(
+                available_seats=F('available_seats') + Coalesce(Subquery(covering, output_field=IntegerField()), Value(0))
+            )
+            sync_segment_seats(ride_ids)
+            Booking.objects.filter(id__in=booking_ids).update(
+                status='cancelled', seats_deducted=False, updated_at=now
+            )
+            from .waitlist import promote_waitlists
+            promote_waitlists(ride_ids)
+            Notification.objects.bulk_create([
+                Notification(
+                    user_id=user_id,
+                    title="Booking Expired",
+                    message=f"Booking #{booking_id} was cancelled because payment was not received in time.",
+                    notification_type="error"
+                )
+                for booking_id, _, user_id, _ in rows
+            ])
+
+            rides = list(Ride.objects.filter(id__in=ride_ids).only('id', 'departure_location', 'destination'))
+            user_ids = {row[2] for row in rows} | {row[3] for row in rows}
+            db_transaction.on_commit(lambda rides=rides: invalidate_ride_lists(*rides))
+            db_transaction.on_commit(lambda user_ids=user_ids: bump_user_versions(*user_ids))
+            db_transaction.on_commit(lambda ride_ids=ride_ids: seat_counter.forget(*ride_ids))
+
+        released += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return released
@@ -0,0 +1,270 @@
+# rides/images.py
+"""
+Image derivatives.
+
+Ride images, vehicle pictures and profile pictures are stored at whatever
+resolution the phone uploaded them, often several MB. `manage.py process_images`
+works through every stored original off the request path and writes three
+renditions (thumb, card, full) in WebP and JPEG. For each rendition it:
+- applies the EXIF orientation, then drops all metadata (EXIF, GPS, XMP);
+- never upscales, it only bounds the longest side;
+- names the file after the SHA-256 of the original's bytes, so identical
+  uploads (including a template's image reused by its rides) share one set of
+  files, and a name never changes meaning.
+
+Results live in ImageDerivative, keyed by the original's storage name. Each
+serializer exposes them as a `srcset` map of sizes. The map is null until the
+worker has reached the image, and clients fall back to the original URL.
+"""
+import hashlib
+import io
+import logging
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Exists, OuterRef, Q
+from PIL import Image, ImageOps
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+logger = logging.getLogger(__name__)
+
+# Longest side of each rendition, in pixels
+SIZES = {'thumb': 160, 'card': 480, 'full': 1280}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVE_DIR = 'derivatives'
+PROCESS_BATCH_SIZE = 50
+# Serializer context key under which looked-up derivatives are memoized
+CONTEXT_KEY = 'image_derivatives'
+
+
+def image_sources():
+    """(model, field name) of every stored image that gets derivatives."""
+    from accounts.models import Driver, User
+
+    from .models import RideImage, RideTemplateImage
+
+    return [
+        (RideImage, 'image'),
+        (RideTemplateImage, 'image'),
+        (Driver, 'vehicle_picture'),
+        (User, 'profile_picture'),
+    ]
+
+
+def derivative_name(content_hash, size, extension):
+    return f"{DERIVATIVE_DIR}/{content_hash[:2]}/{content_hash}_{size}.{extension}"
+
+
+def _encodable(image, format):
+    """`image` in a mode the format can encode; JPEG gets transparency flattened onto white."""
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if format == 'JPEG' and has_alpha:
+        rgba = image.convert('RGBA')
+        flat = Image.new('RGB', rgba.size, 'white')
+        flat.paste(rgba, mask=rgba.getchannel('A'))
+        return flat
+    if has_alpha:
+        return image if image.mode == 'RGBA' else image.convert('RGBA')
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def render_variants(data, content_hash):
+    """Write every rendition of the original `data` to storage and return the variants map."""
+    variants = {}
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        for size, longest_side in SIZES.items():
+            rendition = image.copy()
+            rendition.thumbnail((longest_side, longest_side), Image.Resampling.LANCZOS)
+            # Encoders fall back to info for XMP/ICC; start from nothing
+            rendition.info = {}
+            variant = {'width': rendition.width, 'height': rendition.height}
+            for extension, (format, options) in FORMATS.items():
+                name = derivative_name(content_hash, size, extension)
+                # Content-addressed: an existing file is already this rendition
+                if not default_storage.exists(name):
+                    buffer = io.BytesIO()
+                    _encodable(rendition, format).save(buffer, format, **options)
+                    default_storage.save(name, ContentFile(buffer.getvalue()))
+                variant[extension] = name
+            variants[size] = variant
+    return variants
+
+
+def process_image(name):
+    """
+    Build the derivatives of the stored image `name`. A file that cannot be read
+    or decoded is recorded with its error, so the worker does not retry it forever.
+    Returns the ImageDerivative row.
+    """
+    from .models import ImageDerivative
+
+    try:
+        with default_storage.open(name, 'rb') as f:
+            data = f.read()
+        content_hash = hashlib.sha256(data).hexdigest()
+        same_content = (
+            ImageDerivative.objects.filter(content_hash=content_hash, error='')
+            .values_list('variants', flat=True).first()
+        )
+        variants = same_content or render_variants(data, content_hash)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not build derivatives of {name}: {e}")
+        derivative, _ = ImageDerivative.objects.update_or_create(
+            source=name, defaults={'content_hash': '', 'variants': {}, 'error': str(e)[:255]}
+        )
+        return derivative
+
+    derivative, _ = ImageDerivative.objects.update_or_create(
+        source=name, defaults={'content_hash': content_hash, 'variants': variants, 'error': ''}
+    )
+    return derivative
+
+
+def pending_sources(limit=PROCESS_BATCH_SIZE):
+    """Up to `limit` stored image names that have no ImageDerivative row yet."""
+    from .models import ImageDerivative
+
+    names = []
+    for model, field in image_sources():
+        rows = (
+            model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+            .filter(~Exists(ImageDerivative.objects.filter(source=OuterRef(field))))
+            .order_by().values_list(field, flat=True).distinct()
+        )
+        names.extend(name for name in rows[:limit - len(names)] if name not in names)
+        if len(names) >= limit:
+            break
+    return names
+
+
+def process_pending(batch_size=PROCESS_BATCH_SIZE):
+    """
+    Process every image without derivatives. Returns (processed, failed).
+
+    Rides showing a newly processed image, their own or their driver's, get a
+    new updated_at, so their cached fragments and ETags pick up the srcset.
+    """
+    from .cache import touch_rides
+    from .models import Ride
+
+    processed = failed = 0
+    while True:
+        names = pending_sources(batch_size)
+        if not names:
+            break
+        for name in names:
+            if process_image(name).error:
+                failed += 1
+            else:
+                processed += 1
+        touch_rides(Ride.objects.filter(
+            Q(images__image__in=names)
+            | Q(driver__profile_picture__in=names)
+            | Q(driver__driver_profile__vehicle_picture__in=names)
+        ).distinct())
+        if len(names) < batch_size:
+            break
+    return processed, failed
+
+
+def load_variants(names):
+    """{name: variants map, or None if not processed (or failed)} for the stored image `names`."""
+    from .models import ImageDerivative
+
+    names = [name for name in set(names) if name]
+    if not names:
+        return {}
+    found = dict(
+        ImageDerivative.objects.filter(source__in=names, error='').values_list('source', 'variants')
+    )
+    return {name: found.get(name) or None for name in names}
+
+
+def srcset(variants, url):
+    """The srcset map of a variants map, with `url` turning a storage name into a URL."""
+    if not variants:
+        return None
+    return {
+        size: {
+            'width': variant['width'],
+            'height': variant['height'],
+            **{extension: url(variant[extension]) for extension in FORMATS},
+        }
+        for size, variant in variants.items()
+    }
+
+
+def _collect_image_names(serializer, instance, names):
+    """Add the image names every SrcsetField under `serializer` would render for `instance` to `names`."""
+    for field in serializer.fields.values():
+        if field.write_only or not isinstance(field, (SrcsetField, serializers.BaseSerializer)):
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            # Only relations already prefetched; walking the others would query them a second time
+            if field.source not in getattr(instance, '_prefetched_objects_cache', {}):
+                continue
+        try:
+            value = field.get_attribute(instance)
+        except (SkipField, ObjectDoesNotExist, AttributeError, KeyError):
+            continue
+        if value is None:
+            continue
+        if isinstance(field, SrcsetField):
+            names.add(getattr(value, 'name', value))
+        elif isinstance(field, serializers.ListSerializer):
+            for item in (value.all() if hasattr(value, 'all') else value):
+                _collect_image_names(field.child, item, names)
+        else:
+            _collect_image_names(field, value, names)
+
+
+def prefetch_srcsets(root):
+    """Load the derivatives of every image in the root serializer's response with one query."""
+    instance = root.instance
+    if instance is None:
+        return {}
+    names = set()
+    if isinstance(root, serializers.ListSerializer):
+        for item in instance:
+            _collect_image_names(root.child, item, names)
+    else:
+        _collect_image_names(root, instance, names)
+    return load_variants(names)
+
+
+class SrcsetField(serializers.Field):
+    """
+    Read-only srcset map of an image field (pass the field as `source`).
+    The first one rendered loads the derivatives of every image in the
+    response at once (prefetch_srcsets) and memoizes them in the serializer
+    context; images it could not reach are looked up as they come.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        name = getattr(value, 'name', value)
+        if not name:
+            return None
+        if CONTEXT_KEY not in self.context:
+            self.context[CONTEXT_KEY] = prefetch_srcsets(self.root)
+        variants = self.context[CONTEXT_KEY]
+        if name not in variants:
+            variants.update(load_variants([name]))
+        return srcset(variants[name], self.url)
+
+    def url(self, name):
+        # Mirrors serializers.FileField.to_representation with use_url=True
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        return url
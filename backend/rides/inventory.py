@@ -0,0 +1,114 @@
+# rides/inventory.py
+"""
+Seat inventory for rides.
+
+Seats are taken and given back with one guarded UPDATE per call, for example
+
+    UPDATE rides_ride
+       SET available_seats = available_seats - n,
+           status = CASE WHEN available_seats = n THEN 'fully_booked' ELSE status END
+     WHERE id = ? AND available_seats >= n
+
+The database checks and applies the change atomically, so concurrent bookers
+contend only for the duration of that one statement. They no longer queue on
+a row lock held across a Python round trip and a full-row save(). The
+`ride_available_seats_non_negative` CHECK constraint backs this up at the
+database level.
+
+Multi-stop rides (rides.stops) keep the inventory per segment. A sub-route
+booking takes seats from exactly the segments it covers, using the same
+guarded UPDATE, and the ride's own available_seats is then re-derived as the
+minimum over its segments.
+"""
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, Min, OuterRef, Subquery, Value, When
+from django.utils import timezone
+
+from .models import Ride, RideSegment
+
+
+def reserve_seats(ride_id, seats):
+    """Take `seats` from the ride if that many are left. Returns False (and changes nothing) otherwise."""
+    if seats <= 0:
+        raise ValueError("Number of seats must be positive.")
+    return bool(
+        Ride.objects.filter(pk=ride_id, available_seats__gte=seats).update(
+            available_seats=F('available_seats') - seats,
+            # CASE sees the pre-update row, so this is "the last seats on an open ride were just taken"
+            status=Case(
+                When(available_seats=seats, status='available', then=Value('fully_booked')), default=F('status')
+            ),
+            updated_at=timezone.now(),
+        )
+    )
+
+
+def release_seats(ride_id, seats):
+    """Give `seats` back to the ride, reopening it if it was fully booked. Returns False if the ride is gone."""
+    if seats <= 0:
+        raise ValueError("Number of seats must be positive.")
+    return bool(
+        Ride.objects.filter(pk=ride_id).update(
+            available_seats=F('available_seats') + seats,
+            status=Case(When(status='fully_booked', then=Value('available')), default=F('status')),
+            updated_at=timezone.now(),
+        )
+    )
+
+
+def change_seats(ride_id, delta):
+    """
+    Add `delta` seats (negative to remove) to the ride after the driver changed
+    its capacity. Returns False if fewer than -`delta` seats are free.
+    """
+    if delta > 0:
+        return release_seats(ride_id, delta)
+    if delta < 0:
+        return reserve_seats(ride_id, -delta)
+    return True
+
+
+def sync_segment_seats(ride_ids):
+    """Set each multi-stop ride's available_seats to its fullest segment and flip its status to match."""
+    fullest = (
+        RideSegment.objects.filter(ride_id=OuterRef('pk'))
+        .order_by().values('ride_id')
+        .annotate(seats=Min('available_seats'))
+        .values('seats')
+    )
+    rides = Ride.objects.filter(pk__in=ride_ids, is_multi_stop=True)
+    rides.update(available_seats=Subquery(fullest), updated_at=timezone.now())
+    rides.filter(status='available', available_seats=0).update(status='fully_booked')
+    rides.filter(status='fully_booked', available_seats__gt=0).update(status='available')
+
+
+def reserve_segment_seats(ride_id, from_stop, to_stop, seats):
+    """
+    Take `seats` on every segment from stop `from_stop` to stop `to_stop` of a
+    multi-stop ride, or on none of them. Returns False if any segment is short.
+    """
+    if seats <= 0:
+        raise ValueError("Number of seats must be positive.")
+    with db_transaction.atomic():
+        taken = RideSegment.objects.filter(
+            ride_id=ride_id, sequence__gte=from_stop, sequence__lt=to_stop, available_seats__gte=seats
+        ).update(available_seats=F('available_seats') - seats)
+        if taken != to_stop - from_stop:
+            # Some segment was short; undo the ones that were taken
+            db_transaction.set_rollback(True)
+            return False
+        sync_segment_seats([ride_id])
+    return True
+
+
+def release_segment_seats(ride_id, from_stop, to_stop, seats):
+    """Give `seats` back on every segment from stop `from_stop` to stop `to_stop`."""
+    if seats <= 0:
+        raise ValueError("Number of seats must be positive.")
+    with db_transaction.atomic():
+        released = RideSegment.objects.filter(
+            ride_id=ride_id, sequence__gte=from_stop, sequence__lt=to_stop
+        ).update(available_seats=F('available_seats') + seats)
+        if released:
+            sync_segment_seats([ride_id])
+    return bool(released)
@@ -0,0 +1,67 @@
+# rides/lifecycle.py
+"""
+Scheduled ride lifecycle transitions.
+
+Rides whose departure_time has passed move from `available`/`fully_booked` to
+`departed` in batches of set-based UPDATEs, run by
+`manage.py run_ride_lifecycle`. Between runs, the passenger list still filters
+on departure_time. The stored status keeps the set of `available` rows, and
+the partial index on it (ride_available_departure_idx), down to rides that can
+still be booked.
+
+Cached passenger lists need no invalidation here. They already exclude
+departed rides by time, and moving updated_at gives the ride new fragment and
+ETag keys.
+"""
+import logging
+import time
+from collections import Counter
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .models import Ride
+
+logger = logging.getLogger(__name__)
+
+DEPARTING_STATUSES = ('available', 'fully_booked')
+LIFECYCLE_BATCH_SIZE = 1000
+
+
+def expire_departed_rides(now=None, batch_size=LIFECYCLE_BATCH_SIZE):
+    """
+    Move every ride that has departed to `departed`.
+
+    Returns run metrics: rides transitioned, a breakdown by their previous
+    status, the number of batches and the elapsed seconds.
+    """
+    now = now or timezone.now()
+    started = time.perf_counter()
+    by_status = Counter()
+    batches = 0
+
+    while True:
+        with db_transaction.atomic():
+            rows = list(
+                Ride.objects.select_for_update(skip_locked=True)
+                .filter(status__in=DEPARTING_STATUSES, departure_time__lt=now)
+                .order_by('departure_time', 'id')
+                .values_list('id', 'status')[:batch_size]
+            )
+            if not rows:
+                break
+            # Rows are locked, so the previous statuses read above are exact for the metrics
+            Ride.objects.filter(id__in=[ride_id for ride_id, _ in rows]).update(status='departed', updated_at=now)
+        by_status.update(status for _, status in rows)
+        batches += 1
+        if len(rows) < batch_size:
+            break
+
+    metrics = {
+        'transitioned': sum(by_status.values()),
+        'by_status': dict(by_status),
+        'batches': batches,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    logger.info("Ride lifecycle run: %s", metrics)
+    return metrics
@@ -0,0 +1,89 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from rides.gazetteer import canonicalize_rides, find_place, merge_places, resolve_place
+from rides.models import Place, Ride
+from rides.search import filter_by_location, index_rides
+
+User = get_user_model()
+
+# How drivers spell the benchmarked departure; "NRB" only matches once it is an alias
+SPELLINGS = ['Nairobi', 'nairobi ', 'NAIROBI', 'Nairobi.', 'NRB']
+OTHER_TOWNS = 200
+PAGE_SIZE = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare searching rides by departure through a substring match (icontains), the token "
+        "prefix index (rides.search) and an exact gazetteer place id (rides.gazetteer). "
+        "All generated rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=100000)
+        parser.add_argument('--match-ratio', type=float, default=0.02,
+                            help="Share of rides departing from the searched place")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with db_transaction.atomic():
+            self.generate(options['rides'], options['match_ratio'])
+            place_id = find_place('Nairobi')
+            searches = (
+                ('icontains', lambda rides: rides.filter(departure_location__icontains='nairobi')),
+                ('token index', lambda rides: filter_by_location(rides, 'departure_location', 'nairobi')),
+                ('place id', lambda rides: rides.filter(departure_place_id=place_id)),
+            )
+
+            self.stdout.write(f"{options['rides']} rides, searching departures from Nairobi (first page + count)")
+            self.stdout.write(f"{'search':>12} {'matches':>8} {'ms':>9}")
+            for name, search in searches:
+                rides = search(Ride.objects.all())
+                matches = rides.count()
+                seconds = self.best_of(options['repeat'], lambda: (
+                    list(rides.order_by('departure_time', 'id').values_list('id', flat=True)[:PAGE_SIZE]),
+                    rides.count(),
+                ))
+                self.stdout.write(f"{name:>12} {matches:>8} {seconds * 1000:>9.2f}")
+
+            db_transaction.set_rollback(True)
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def generate(self, count, match_ratio):
+        driver = User.objects.create_user(username='bench_place_driver', password=None, user_type='driver')
+        departure = timezone.now() + timedelta(days=1)
+        every = max(int(1 / match_ratio), 1) if match_ratio > 0 else count + 1
+        rides = [
+            Ride(
+                departure_location=(
+                    SPELLINGS[(index // every) % len(SPELLINGS)] if index % every == 0
+                    else f"Town {index % OTHER_TOWNS}"
+                ),
+                destination=f"Town {(index * 7) % OTHER_TOWNS}",
+                departure_time=departure + timedelta(minutes=index),
+                driver=driver,
+                available_seats=3,
+                price=Decimal('500.00'),
+            )
+            for index in range(count)
+        ]
+        for start in range(0, count, 5000):
+            canonicalize_rides(rides[start:start + 5000])
+        rides = Ride.objects.bulk_create(rides, batch_size=5000)
+        index_rides(rides, replace=False)
+        # An ops merge: "NRB" is Nairobi
+        merge_places(Place.objects.get(id=resolve_place('Nairobi')), Place.objects.filter(aliases__alias='nrb'))
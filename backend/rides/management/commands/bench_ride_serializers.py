@@ -0,0 +1,86 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.request import Request
+
+from accounts.models import Driver
+from rides.models import Ride, RideImage
+from rides.read_serializers import serialize_rides
+from rides.serializers import RideListSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare RideListSerializer with the values()-based read path on generated rides. "
+        "All generated rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        with db_transaction.atomic():
+            driver = self.generate(sizes[-1])
+            request = Request(RequestFactory().get('/api/rides/', HTTP_HOST='localhost'))
+            context = {'request': request}
+
+            self.stdout.write(f"{'rides':>8} {'serializer (s)':>15} {'values() (s)':>13} {'speedup':>8}")
+            for size in sizes:
+                rides = Ride.objects.filter(driver=driver).order_by('id')[:size]
+                slow = self.best_of(options['repeat'], lambda: RideListSerializer(
+                    rides.select_related('driver', 'driver__driver_profile').prefetch_related('images'),
+                    many=True, context=context
+                ).data)
+                fast = self.best_of(options['repeat'], lambda: serialize_rides(rides, context))
+                self.stdout.write(f"{size:>8} {slow:>15.3f} {fast:>13.3f} {slow / fast:>7.1f}x")
+
+            db_transaction.set_rollback(True)
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def generate(self, count):
+        driver = User.objects.create_user(
+            username='bench_serializer_driver', password=None, user_type='driver',
+            first_name='Bench', last_name='Driver', profile_picture='profile_pictures/bench.png'
+        )
+        Driver.objects.create(
+            user=driver, vehicle_model='Probox', vehicle_color='White', vehicle_plate='KAA 001A',
+            rating=Decimal('4.50')
+        )
+        departure = timezone.now() + timedelta(days=1)
+        rides = Ride.objects.bulk_create(
+            [
+                Ride(
+                    departure_location='Nairobi',
+                    destination='Nakuru',
+                    departure_time=departure + timedelta(minutes=index),
+                    driver=driver,
+                    available_seats=3,
+                    price=Decimal('500.00'),
+                    additional_info='Benchmark ride',
+                )
+                for index in range(count)
+            ],
+            batch_size=5000
+        )
+        RideImage.objects.bulk_create(
+            [RideImage(ride=ride, image='ride_images/bench.jpg') for ride in rides],
+            batch_size=5000
+        )
+        return driver
@@ -0,0 +1,102 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction as db_transaction, DatabaseError
+from django.utils import timezone
+
+from rides.inventory import reserve_seats
+from rides.models import Ride
+
+User = get_user_model()
+
+
+def locked_reserve(ride_id, seats):
+    """The previous Booking.reduce_seats path: row lock, mutate in Python, full-row save()."""
+    with db_transaction.atomic():
+        ride = Ride.objects.select_for_update().get(id=ride_id)
+        if seats > ride.available_seats:
+            return False
+        ride.available_seats -= seats
+        if ride.available_seats <= 0:
+            ride.status = 'fully_booked'
+        ride.save(update_fields=['available_seats', 'status'])
+        return True
+
+
+def guarded_reserve(ride_id, seats):
+    with db_transaction.atomic():
+        return reserve_seats(ride_id, seats)
+
+
+class Command(BaseCommand):
+    help = (
+        "Contention benchmark: concurrent bookers taking seats on one ride through the "
+        "select_for_update() path and the guarded-UPDATE path. Generated rows are deleted afterwards. "
+        "Meaningful on PostgreSQL; SQLite serializes all writers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--bookings', type=int, default=50, help="Seat reservations per thread")
+        parser.add_argument('--oversubscribe', type=float, default=1.25,
+                            help="Attempts per available seat, so the sold-out branch is exercised too")
+
+    def handle(self, *args, **options):
+        threads, per_thread = options['threads'], options['bookings']
+        attempts = threads * per_thread
+        seats = int(attempts / options['oversubscribe'])
+
+        driver = User.objects.create_user(username='bench_inventory_driver', password=None, user_type='driver')
+        try:
+            self.stdout.write(f"{threads} threads x {per_thread} bookings on {seats} seats")
+            self.stdout.write(f"{'path':>18} {'seconds':>8} {'bookings/s':>11} {'sold':>6} {'errors':>7} {'seats left':>11}")
+            for name, reserve in (('select_for_update', locked_reserve), ('guarded UPDATE', guarded_reserve)):
+                ride = Ride.objects.create(
+                    departure_location='Nairobi',
+                    destination='Mombasa',
+                    departure_time=timezone.now() + timedelta(days=1),
+                    driver=driver,
+                    available_seats=seats,
+                    price=Decimal('1000.00'),
+                )
+                elapsed, sold, errors = self.run(reserve, ride.id, threads, per_thread)
+                ride.refresh_from_db()
+                self.stdout.write(
+                    f"{name:>18} {elapsed:>8.3f} {attempts / elapsed:>11.0f} {sold:>6} {errors:>7} {ride.available_seats:>11}"
+                )
+                if sold + ride.available_seats != seats:
+                    self.stderr.write(self.style.ERROR(f"{name}: {sold} sold but only {seats - ride.available_seats} seats taken"))
+        finally:
+            # Cascades to the generated rides
+            driver.delete()
+
+    def run(self, reserve, ride_id, threads, per_thread):
+        sold = []
+        errors = []
+        start_barrier = threading.Barrier(threads)
+
+        def worker():
+            ok = failed = 0
+            try:
+                start_barrier.wait()
+                for _ in range(per_thread):
+                    try:
+                        ok += reserve(ride_id, 1)
+                    except DatabaseError:
+                        failed += 1
+            finally:
+                sold.append(ok)
+                errors.append(failed)
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return time.perf_counter() - start, sum(sold), sum(errors)
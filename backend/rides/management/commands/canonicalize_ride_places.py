@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from django.db.models import Q
+
+from rides.gazetteer import canonicalize_rides
+from rides.models import Ride
+
+
+class Command(BaseCommand):
+    help = (
+        "Resolve the departure and destination of existing rides to gazetteer places, in batches. "
+        "Only rides missing a place are touched unless --all is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help="Re-resolve rides that already have places")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rides = Ride.objects.all()
+        if not options['all']:
+            rides = rides.filter(Q(departure_place__isnull=True) | Q(destination_place__isnull=True))
+        last_id = 0
+        total = 0
+
+        while True:
+            batch = list(
+                rides.filter(id__gt=last_id)
+                .only('id', 'departure_location', 'destination', 'departure_place', 'destination_place')
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+
+            with db_transaction.atomic():
+                canonicalize_rides(batch)
+                Ride.objects.bulk_update(batch, ['departure_place', 'destination_place'])
+
+            last_id = batch[-1].id
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Canonicalized {total} ride(s)."))
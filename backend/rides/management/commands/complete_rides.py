@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import User
+from rides.completion import COMPLETION_BATCH_SIZE, complete_rides, past_rides
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark rides that departed more than --hours ago as completed, along with their confirmed bookings, "
+        "for the whole platform or one --driver."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=12, help="Only complete rides that departed this long ago")
+        parser.add_argument('--driver', help="Username of the driver whose rides to complete")
+        parser.add_argument('--batch-size', type=int, default=COMPLETION_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        driver = None
+        if options['driver']:
+            driver = User.objects.filter(username=options['driver'], user_type='driver').first()
+            if driver is None:
+                raise CommandError(f"No driver named {options['driver']!r}.")
+
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        completed = complete_rides(past_rides(cutoff, driver=driver), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Completed {completed['rides']} ride(s) and {completed['bookings']} booking(s) that departed before {cutoff:%Y-%m-%d %H:%M}."
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from rides.holds import EXPIRY_BATCH_SIZE, expire_holds
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancel pending M-Pesa/card bookings whose seat hold has expired and release their seats. "
+        "Run it from cron, or with --loop as a long-running worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=EXPIRY_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping every --interval seconds")
+        parser.add_argument('--interval', type=int, default=60)
+
+    def handle(self, *args, **options):
+        while True:
+            released = expire_holds(batch_size=options['batch_size'])
+            if released or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Released {released} expired seat hold(s)."))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+            close_old_connections()
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from rides.images import PROCESS_BATCH_SIZE, process_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Build thumb/card/full WebP and JPEG derivatives of uploaded ride, vehicle and profile pictures. "
+        "Run it from cron, or with --loop as a long-running worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PROCESS_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep checking for new uploads every --interval seconds")
+        parser.add_argument('--interval', type=int, default=30)
+
+    def handle(self, *args, **options):
+        while True:
+            processed, failed = process_pending(batch_size=options['batch_size'])
+            if processed or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Processed {processed} image(s), {failed} failed."))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+            close_old_connections()
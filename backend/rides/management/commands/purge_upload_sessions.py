@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from rides.uploads import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = "Delete expired chunked-upload sessions and their partial files. Run it from cron."
+
+    def handle(self, *args, **options):
+        purged = purge_expired_sessions()
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired upload session(s)."))
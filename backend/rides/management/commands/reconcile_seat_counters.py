@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from rides import seat_counter
+
+
+class Command(BaseCommand):
+    help = (
+        "Give back the seats of expired Redis seat leases (bookings that rolled back) and reset "
+        "every live seat counter that drifted from its Ride row. Run it from cron, or with --loop "
+        "as a long-running worker. Only meaningful with SEAT_COUNTER_BACKEND = 'redis'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help="Keep reconciling every --interval seconds")
+        parser.add_argument('--interval', type=int, default=60)
+
+    def handle(self, *args, **options):
+        if not seat_counter.enabled():
+            raise CommandError("Seat counters are off (SEAT_COUNTER_BACKEND is not 'redis').")
+
+        while True:
+            totals = {'rides': 0, 'returned': 0, 'drifted': 0}
+            for ride_ids in seat_counter.loaded_ride_ids(options['batch_size']):
+                result = seat_counter.reconcile(ride_ids)
+                if result is None:
+                    raise CommandError("Redis is unavailable.")
+                for field in totals:
+                    totals[field] += result[field]
+            if totals['returned'] or totals['drifted'] or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Checked {totals['rides']} counter(s): returned {totals['returned']} seat(s) "
+                    f"from expired leases, reset {totals['drifted']} that drifted."
+                ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+            close_old_connections()
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from rides.models import Ride
+from rides.search import index_rides, normalize_location
+
+
+class Command(BaseCommand):
+    help = "Rebuild the normalized route search columns and prefix terms for all rides."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+
+        while True:
+            batch = list(
+                Ride.objects.filter(id__gt=last_id)
+                .only('id', 'departure_location', 'destination', 'departure_search', 'destination_search')
+                .order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+
+            for ride in batch:
+                ride.departure_search = normalize_location(ride.departure_location)
+                ride.destination_search = normalize_location(ride.destination)
+            Ride.objects.bulk_update(batch, ['departure_search', 'destination_search'])
+            index_rides(batch)
+
+            last_id = batch[-1].id
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Reindexed {total} ride(s)."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from rides.counters import recompute_held_seats, recompute_ride_counters
+from rides.models import Ride, Booking
+
+
+class Command(BaseCommand):
+    help = "Recompute Ride.booking_count, confirmed_seat_count and held_seats from the bookings table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_id = Ride.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        total = 0
+
+        # One set-based UPDATE per id range keeps each transaction short
+        for start in range(0, max_id + 1, batch_size):
+            rides = Ride.objects.filter(id__gte=start, id__lt=start + batch_size)
+            total += recompute_ride_counters(rides, Booking.objects)
+            recompute_held_seats(rides, Booking.objects)
+
+        self.stdout.write(self.style.SUCCESS(f"Recomputed booking counters for {total} ride(s)."))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from rides.demand import rebuild_booking_demand, roll_up_searches
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold the route searches counted since the last run into the route demand table. "
+        "Run it from cron, or with --loop as a long-running worker. "
+        "--rebuild first recomputes the booking columns from all sold bookings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Recompute bookings, seats sold and revenue from scratch")
+        parser.add_argument('--loop', action='store_true', help="Keep rolling up every --interval seconds")
+        parser.add_argument('--interval', type=int, default=300)
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rows = rebuild_booking_demand()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt booking demand for {rows} route hour(s)."))
+
+        while True:
+            searches = roll_up_searches()
+            if searches or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Rolled up {searches} route search(es)."))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+            close_old_connections()
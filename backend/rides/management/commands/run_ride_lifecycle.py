@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from rides.lifecycle import LIFECYCLE_BATCH_SIZE, expire_departed_rides
+
+
+class Command(BaseCommand):
+    help = (
+        "Move rides whose departure time has passed to the 'departed' status. "
+        "Run it from cron, or with --loop as a long-running worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=LIFECYCLE_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep running every --interval seconds")
+        parser.add_argument('--interval', type=int, default=60)
+
+    def handle(self, *args, **options):
+        while True:
+            metrics = expire_departed_rides(batch_size=options['batch_size'])
+            if metrics['transitioned'] or not options['loop']:
+                breakdown = ', '.join(f"{status}: {count}" for status, count in sorted(metrics['by_status'].items()))
+                self.stdout.write(self.style.SUCCESS(
+                    f"Marked {metrics['transitioned']} ride(s) as departed in {metrics['batches']} batch(es), "
+                    f"{metrics['seconds']}s" + (f" ({breakdown})" if breakdown else "")
+                ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+            close_old_connections()
@@ -0,0 +1,103 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:04
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+# Frozen copy of the tokenizer in rides.search as of this migration, so later
+# changes to search do not change what this backfill writes.
+MAX_PREFIX_LENGTH = 20
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_location(value):
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', str(value))
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(' ', value.lower()).strip()
+
+
+def prefix_terms(value):
+    terms = set()
+    for token in normalize_location(value).split():
+        token = token[:MAX_PREFIX_LENGTH]
+        for end in range(1, len(token) + 1):
+            terms.add(token[:end])
+    return terms
+
+
+def backfill_search_index(apps, schema_editor):
+    Ride = apps.get_model('rides', 'Ride')
+    RideSearchTerm = apps.get_model('rides', 'RideSearchTerm')
+    for ride in Ride.objects.only('id', 'departure_location', 'destination').iterator(chunk_size=1000):
+        Ride.objects.filter(id=ride.id).update(
+            departure_search=normalize_location(ride.departure_location),
+            destination_search=normalize_location(ride.destination),
+        )
+        RideSearchTerm.objects.bulk_create(
+            [RideSearchTerm(ride_id=ride.id, field='departure', term=term) for term in prefix_terms(ride.departure_location)]
+            + [RideSearchTerm(ride_id=ride.id, field='destination', term=term) for term in prefix_terms(ride.destination)]
+        )
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        # pg_trgm may not be installable (e.g. missing privileges); searches then use the term table.
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except Exception:
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS rides_ride_departure_search_trgm "
+        "ON rides_ride USING gin (departure_search gin_trgm_ops)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS rides_ride_destination_search_trgm "
+        "ON rides_ride USING gin (destination_search gin_trgm_ops)"
+    )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS rides_ride_departure_search_trgm")
+    schema_editor.execute("DROP INDEX IF EXISTS rides_ride_destination_search_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0010_alter_booking_status_alter_ride_status_review'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='departure_search',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='destination_search',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='RideSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('departure', 'Departure'), ('destination', 'Destination')], max_length=12)),
+                ('term', models.CharField(max_length=20)),
+                ('ride', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='rides.ride')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['field', 'term', 'ride'], name='ride_search_term_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_search_index, reverse_code=migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, reverse_code=drop_trigram_indexes),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0012_ride_coordinates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['departure_time', 'id'], name='ride_departure_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['price', 'id'], name='ride_price_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['available_seats', 'id'], name='ride_seats_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0013_ride_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='rideimage',
+            options={'ordering': ['id']},
+        ),
+    ]
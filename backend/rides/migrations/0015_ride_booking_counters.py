@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:15
+
+from django.db import migrations, models
+
+from rides.counters import recompute_ride_counters
+
+
+def backfill_counters(apps, schema_editor):
+    Ride = apps.get_model('rides', 'Ride')
+    Booking = apps.get_model('rides', 'Booking')
+    recompute_ride_counters(Ride.objects.all(), Booking.objects)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0014_rideimage_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='booking_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='confirmed_seat_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, reverse_code=migrations.RunPython.noop),
+    ]
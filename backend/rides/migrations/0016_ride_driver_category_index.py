@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0015_ride_booking_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['driver', 'departure_time', 'booking_count'], name='ride_driver_category_idx'),
+        ),
+    ]
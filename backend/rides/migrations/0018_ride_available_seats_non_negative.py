@@ -0,0 +1,26 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def clamp_negative_seats(apps, schema_editor):
+    # Rows oversold by the old read-modify-write path would violate the new constraint
+    Ride = apps.get_model('rides', 'Ride')
+    Ride.objects.filter(available_seats__lt=0).update(available_seats=0, status='fully_booked')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0017_review_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_negative_seats, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ride',
+            constraint=models.CheckConstraint(condition=models.Q(('available_seats__gte', 0)), name='ride_available_seats_non_negative'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0019_booking_seat_holds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ride',
+            name='status',
+            field=models.CharField(choices=[('available', 'Available'), ('fully_booked', 'Fully Booked'), ('pending_payment', 'Pending Payment'), ('completed', 'Completed'), ('departed', 'Departed')], db_index=True, default='available', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(condition=models.Q(('status', 'available')), fields=['departure_time', 'id'], name='ride_available_departure_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0020_ride_departed_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='from_stop',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='to_stop',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='is_multi_stop',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name='RideStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveSmallIntegerField()),
+                ('location', models.CharField(max_length=100)),
+                ('location_search', models.CharField(editable=False, max_length=100)),
+                ('ride', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='rides.ride')),
+            ],
+            options={
+                'ordering': ['ride', 'sequence'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RideStopTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=20)),
+                ('stop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='rides.ridestop')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RideSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveSmallIntegerField()),
+                ('available_seats', models.IntegerField()),
+                ('ride', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='rides.ride')),
+            ],
+            options={
+                'ordering': ['ride', 'sequence'],
+                'constraints': [models.UniqueConstraint(fields=('ride', 'sequence'), name='ride_segment_sequence_unique'), models.CheckConstraint(condition=models.Q(('available_seats__gte', 0)), name='ride_segment_seats_non_negative')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ridestop',
+            constraint=models.UniqueConstraint(fields=('ride', 'sequence'), name='ride_stop_sequence_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='ridestopterm',
+            index=models.Index(fields=['term', 'stop'], name='ride_stop_term_idx'),
+        ),
+    ]
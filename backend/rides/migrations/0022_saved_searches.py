@@ -0,0 +1,37 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0021_multi_stop_rides'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('departure_location', models.CharField(blank=True, default='', max_length=100)),
+                ('destination', models.CharField(blank=True, default='', max_length=100)),
+                ('date_from', models.DateTimeField(blank=True, null=True)),
+                ('date_to', models.DateTimeField(blank=True, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('departure_key', models.CharField(blank=True, default='', editable=False, max_length=20)),
+                ('destination_key', models.CharField(blank=True, default='', editable=False, max_length=20)),
+                ('last_notified_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saved_searches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('is_active', True)), fields=['departure_key', 'destination_key'], name='saved_search_route_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0023_ride_templates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('variants', models.JSONField(default=dict)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('processed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
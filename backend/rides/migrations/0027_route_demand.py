@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:53
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0026_ride_waitlist'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteDemand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('departure', models.CharField(max_length=100)),
+                ('destination', models.CharField(max_length=100)),
+                ('hour_of_week', models.PositiveSmallIntegerField(validators=[django.core.validators.MaxValueValidator(167)])),
+                ('searches', models.IntegerField(default=0)),
+                ('bookings', models.IntegerField(default=0)),
+                ('seats_sold', models.IntegerField(default=0)),
+                ('price_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-seats_sold'], name='route_demand_seats_idx')],
+                'constraints': [models.UniqueConstraint(fields=('departure', 'destination', 'hour_of_week'), name='route_demand_key_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0027_route_demand'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlaceAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'place aliases',
+                'ordering': ['alias'],
+            },
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='departure_place',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='rides.place'),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='destination_place',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='rides.place'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['departure_place', 'departure_time'], name='ride_departure_place_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['destination_place', 'departure_time'], name='ride_destination_place_idx'),
+        ),
+        migrations.AddField(
+            model_name='placealias',
+            name='place',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='rides.place'),
+        ),
+    ]
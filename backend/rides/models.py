@@ -1,7 +1,12 @@
 # rides/models.py
 import logging
+import uuid
+from decimal import Decimal
 from django.db import models
+from django.db.models import F
+from django.core.validators import MinValueValidator, MaxValueValidator
 from accounts.models import User, Notification
+from .counters import SOLD_STATUSES
 from django.utils import timezone
 from django.db import transaction as db_transaction
 
@@ -11,6 +16,16 @@ class Ride(models.Model):
     departure_location = models.CharField(max_length=100, db_index=True)
     destination = models.CharField(max_length=100, db_index=True)
     departure_time = models.DateTimeField(db_index=True)
+    # Normalized copies of the locations used by the route search index (see rides.search)
+    departure_search = models.CharField(max_length=100, blank=True, default='', editable=False)
+    destination_search = models.CharField(max_length=100, blank=True, default='', editable=False)
+    # Optional pickup / drop-off coordinates and their geohash cells (see rides.geo)
+    departure_latitude = models.FloatField(blank=True, null=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    departure_longitude = models.FloatField(blank=True, null=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    destination_latitude = models.FloatField(blank=True, null=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    destination_longitude = models.FloatField(blank=True, null=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    departure_geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
+    destination_geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
     driver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='driven_rides')
     available_seats = models.IntegerField(null=False, default=1)
     additional_info = models.TextField(blank=True, null=True)
@@ -22,6 +37,8 @@ class Ride(models.Model):
         ('fully_booked', 'Fully Booked'),
         ('pending_payment', 'Pending Payment'),
         ('completed', 'Completed'),
+        # Set by the lifecycle scheduler once departure_time has passed (see rides.lifecycle)
+        ('departed', 'Departed'),
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available', db_index=True)
     
@@ -29,13 +46,264 @@ class Ride(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized booking counters, maintained by Booking.save()/delete()
+    # (repair with `manage.py repair_ride_counters`)
+    booking_count = models.PositiveIntegerField(default=0, editable=False)
+    confirmed_seat_count = models.PositiveIntegerField(default=0, editable=False)
+    # Seats taken by pending M-Pesa/card bookings whose hold has not run out (see rides.holds)
+    held_seats = models.PositiveIntegerField(default=0, editable=False)
+    COUNTER_FIELDS = ('booking_count', 'confirmed_seat_count', 'held_seats')
+    # Moved only by guarded UPDATEs (rides.inventory) or by saves that name them in update_fields
+    INVENTORY_FIELDS = ('available_seats', 'status')
+    # Set when the ride has intermediate stops and per-segment seats (see rides.stops)
+    is_multi_stop = models.BooleanField(default=False, editable=False)
+    # The recurring template this ride was materialized from (see rides.recurring)
+    template = models.ForeignKey(
+        'RideTemplate', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='rides'
+    )
+    # Gazetteer places the free-text locations resolve to (see rides.gazetteer)
+    departure_place = models.ForeignKey(
+        'Place', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+',
+        db_index=False
+    )
+    destination_place = models.ForeignKey(
+        'Place', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+',
+        db_index=False
+    )
+
+    class Meta:
+        constraints = [
+            # Backstop for rides.inventory's guarded UPDATEs
+            models.CheckConstraint(condition=models.Q(available_seats__gte=0), name='ride_available_seats_non_negative'),
+            # One ride per template occurrence
+            models.UniqueConstraint(
+                fields=['template', 'departure_time'],
+                condition=models.Q(template__isnull=False),
+                name='ride_template_occurrence_unique'
+            ),
+        ]
+        indexes = [
+            # Composite keys for keyset pagination (see rides.pagination)
+            models.Index(fields=['departure_time', 'id'], name='ride_departure_keyset_idx'),
+            models.Index(fields=['price', 'id'], name='ride_price_keyset_idx'),
+            models.Index(fields=['available_seats', 'id'], name='ride_seats_keyset_idx'),
+            # Driver dashboard categories
+            models.Index(fields=['driver', 'departure_time', 'booking_count'], name='ride_driver_category_idx'),
+            # Place search by exact id, in departure order (the FK columns are indexed only here)
+            models.Index(fields=['departure_place', 'departure_time'], name='ride_departure_place_idx'),
+            models.Index(fields=['destination_place', 'departure_time'], name='ride_destination_place_idx'),
+            # Passenger list: only bookable rides, which the lifecycle scheduler keeps small
+            models.Index(
+                fields=['departure_time', 'id'],
+                condition=models.Q(status='available'),
+                name='ride_available_departure_idx'
+            ),
+        ]
+
     def __str__(self):
         return f"{self.departure_location} to {self.destination} at {self.departure_time}"
 
     def save(self, *args, **kwargs):
-        if self.available_seats == 0 and self.status != 'fully_booked':
+        from .search import normalize_location, index_rides
+
+        status = self.status
+        if self.available_seats == 0 and self.status == 'available':
             self.status = 'fully_booked'
-        super().save(*args, **kwargs)
+        if self.status == 'departed' and self.departure_time >= timezone.now():
+            # Rescheduled into the future
+            self.status = 'available' if self.available_seats > 0 else 'fully_booked'
+
+        update_fields = kwargs.get('update_fields')
+        locations_changed = False
+        if update_fields is None or {'departure_location', 'destination'} & set(update_fields):
+            departure_search = normalize_location(self.departure_location)
+            destination_search = normalize_location(self.destination)
+            locations_changed = (
+                self.pk is None
+                or departure_search != self.departure_search
+                or destination_search != self.destination_search
+            )
+            self.departure_search = departure_search
+            self.destination_search = destination_search
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {
+                    'departure_search', 'destination_search', 'departure_place', 'destination_place'
+                }
+
+        if update_fields is None or any(f.endswith(('_latitude', '_longitude')) for f in update_fields):
+            self.update_geohashes()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'departure_geohash', 'destination_geohash'}
+
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write the booking counters or the seat inventory back from a possibly stale
+            # instance; seat edits go through rides.inventory. A status derived above still is.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in (*self.COUNTER_FIELDS, *self.INVENTORY_FIELDS)
+            ]
+            if self.status != status:
+                kwargs['update_fields'].append('status')
+
+        is_new = self._state.adding
+        with db_transaction.atomic():
+            if locations_changed:
+                from .gazetteer import resolve_place
+                self.departure_place_id = resolve_place(self.departure_location)
+                self.destination_place_id = resolve_place(self.destination)
+            super().save(*args, **kwargs)
+            if locations_changed:
+                index_rides([self])
+            if is_new:
+                from .autocomplete import location_index
+                db_transaction.on_commit(lambda: location_index.note_ride(self))
+            else:
+                # The driver may have changed the seats (see rides.seat_counter)
+                from . import seat_counter
+                db_transaction.on_commit(lambda: seat_counter.forget(self.pk))
+            # The driver's dashboard summary (rides.dashboard) is cached under their version
+            from .cache import bump_user_versions
+            driver_id = self.driver_id
+            db_transaction.on_commit(lambda: bump_user_versions(driver_id))
+
+    def update_geohashes(self):
+        """Recompute the geohash cells from the pickup and drop-off coordinates."""
+        from .geo import encode
+
+        if self.departure_latitude is not None and self.departure_longitude is not None:
+            self.departure_geohash = encode(self.departure_latitude, self.departure_longitude)
+        else:
+            self.departure_geohash = ''
+        if self.destination_latitude is not None and self.destination_longitude is not None:
+            self.destination_geohash = encode(self.destination_latitude, self.destination_longitude)
+        else:
+            self.destination_geohash = ''
+
+
+class RideSearchTerm(models.Model):
+    """One token prefix of a ride's departure or destination, for indexed route search."""
+    FIELD_CHOICES = [
+        ('departure', 'Departure'),
+        ('destination', 'Destination'),
+    ]
+
+    ride = models.ForeignKey(Ride, on_delete=models.CASCADE, related_name='search_terms')
+    field = models.CharField(max_length=12, choices=FIELD_CHOICES)
+    term = models.CharField(max_length=20)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['field', 'term', 'ride'], name='ride_search_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.field}:{self.term} -> ride #{self.ride_id}"
+
+
+class Place(models.Model):
+    """A canonical location in the gazetteer; rides point at it instead of being matched on free text."""
+    name = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class PlaceAlias(models.Model):
+    """A normalized spelling ("nairobi cbd", "nrb") that resolves to a Place."""
+    place = models.ForeignKey(Place, on_delete=models.CASCADE, related_name='aliases')
+    alias = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ['alias']
+        verbose_name_plural = 'place aliases'
+
+    def __str__(self):
+        return f"{self.alias} -> {self.place_id}"
+
+
+class RideTemplate(models.Model):
+    """A driver's recurring ride; rides.recurring materializes it into future Ride rows."""
+    driver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ride_templates')
+    departure_location = models.CharField(max_length=100)
+    destination = models.CharField(max_length=100)
+    departure_latitude = models.FloatField(blank=True, null=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    departure_longitude = models.FloatField(blank=True, null=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    destination_latitude = models.FloatField(blank=True, null=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    destination_longitude = models.FloatField(blank=True, null=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Local time of day and days of the week (Monday=0, e.g. '01234' for weekdays)
+    departure_time = models.TimeField()
+    weekdays = models.CharField(max_length=7, default='01234')
+    available_seats = models.PositiveIntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    additional_info = models.TextField(blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.departure_location} to {self.destination} at {self.departure_time} on {self.weekdays}"
+
+
+class RideTemplateImage(models.Model):
+    """Uploaded once; every materialized ride's RideImage points at the same stored file."""
+    template = models.ForeignKey(RideTemplate, on_delete=models.CASCADE, related_name='images')
+    image = models.ImageField(upload_to='ride_images/')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+
+class RideStop(models.Model):
+    """A point on a multi-stop ride; sequence 0 is the departure and the last one the destination."""
+    ride = models.ForeignKey(Ride, on_delete=models.CASCADE, related_name='stops')
+    sequence = models.PositiveSmallIntegerField()
+    location = models.CharField(max_length=100)
+    location_search = models.CharField(max_length=100, editable=False)
+
+    class Meta:
+        ordering = ['ride', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['ride', 'sequence'], name='ride_stop_sequence_unique'),
+        ]
+
+    def __str__(self):
+        return f"Stop {self.sequence} of ride #{self.ride_id}: {self.location}"
+
+
+class RideStopTerm(models.Model):
+    """One token prefix of a stop location, for indexed "passing through" search."""
+    stop = models.ForeignKey(RideStop, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=20)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'stop'], name='ride_stop_term_idx'),
+        ]
+
+
+class RideSegment(models.Model):
+    """The leg from stop `sequence` to stop `sequence + 1`, with its own seat inventory."""
+    ride = models.ForeignKey(Ride, on_delete=models.CASCADE, related_name='segments')
+    sequence = models.PositiveSmallIntegerField()
+    available_seats = models.IntegerField()
+
+    class Meta:
+        ordering = ['ride', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['ride', 'sequence'], name='ride_segment_sequence_unique'),
+            models.CheckConstraint(condition=models.Q(available_seats__gte=0), name='ride_segment_seats_non_negative'),
+        ]
+
+    def __str__(self):
+        return f"Segment {self.sequence} of ride #{self.ride_id}: {self.available_seats} seat(s)"
 
 
 class RideImage(models.Model):
@@ -43,10 +311,139 @@ class RideImage(models.Model):
     image = models.ImageField(upload_to='ride_images/')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        ordering = ['id']
+
     def __str__(self):
         return f"Image for {self.ride}"
 
 
+class RouteDemand(models.Model):
+    """
+    Demand rollup for one route at one hour of the week (rides.demand), kept
+    current incrementally from bookings and search logs.
+    """
+    departure = models.CharField(max_length=100)
+    destination = models.CharField(max_length=100)
+    # Monday 00:00-00:59 is 0, Sunday 23:00-23:59 is 167 (local time)
+    hour_of_week = models.PositiveSmallIntegerField(validators=[MaxValueValidator(167)])
+    searches = models.IntegerField(default=0)
+    bookings = models.IntegerField(default=0)
+    seats_sold = models.IntegerField(default=0)
+    price_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['departure', 'destination', 'hour_of_week'], name='route_demand_key_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['-seats_sold'], name='route_demand_seats_idx'),
+        ]
+
+    @property
+    def average_price(self):
+        """Average price paid per seat sold."""
+        if self.seats_sold <= 0:
+            return None
+        return (self.price_total / self.seats_sold).quantize(Decimal('0.01'))
+
+    def __str__(self):
+        return f"{self.departure} to {self.destination} at hour {self.hour_of_week}: {self.seats_sold} seat(s) sold"
+
+
+class WaitlistEntry(models.Model):
+    """A passenger queued for seats on a fully booked ride (see rides.waitlist)."""
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('promoted', 'Promoted'),
+        ('left', 'Left'),
+    ]
+
+    ride = models.ForeignKey(Ride, on_delete=models.CASCADE, related_name='waitlist')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries')
+    no_of_seats = models.PositiveIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting')
+    booking = models.OneToOneField(
+        'Booking', on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entry'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            # Head of a ride's queue: one index probe per promotion
+            models.Index(
+                fields=['ride', 'created_at', 'id'],
+                name='waitlist_queue_idx',
+                condition=models.Q(status='waiting'),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ride', 'user'],
+                condition=models.Q(status='waiting'),
+                name='waitlist_one_waiting_entry_per_user',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} waiting for {self.no_of_seats} seat(s) on ride #{self.ride_id}"
+
+
+class UploadSession(models.Model):
+    """An image being uploaded in chunks (see rides.uploads)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    received = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Upload of {self.filename} by {self.owner}: {self.received}/{self.size} bytes"
+
+
+class UploadedImage(models.Model):
+    """
+    A completed upload, referenced by id when a ride is posted. Uploads with
+    the same SHA-256 share one stored file, and an owner gets one row per content.
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_images')
+    sha256 = models.CharField(max_length=64, db_index=True)
+    image = models.ImageField(upload_to='ride_images/')
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'sha256'], name='uploaded_image_owner_sha256_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.image.name} ({self.sha256[:12]})"
+
+
+class ImageDerivative(models.Model):
+    """
+    Resized, EXIF-free copies of one stored upload (see rides.images), keyed by
+    the original's storage name so files shared between rides are processed once.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    # {size: {"width": ..., "height": ..., "webp": name, "jpeg": name}}
+    variants = models.JSONField(default=dict)
+    error = models.CharField(max_length=255, blank=True)
+    processed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Derivatives of {self.source}"
+
+
 class Booking(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -63,47 +460,119 @@ class Booking(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_paid = models.BooleanField(default=False, db_index=True)
     seats_deducted = models.BooleanField(default=False, db_index=True)
+    # Set while the booking holds seats waiting for a payment callback (see rides.holds)
+    hold_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Boarding and alighting stop sequences on a multi-stop ride (see rides.stops)
+    from_stop = models.PositiveSmallIntegerField(null=True, blank=True)
+    to_stop = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Only live holds are indexed, so the expiry sweep scans just those
+            models.Index(
+                fields=['hold_expires_at'],
+                condition=models.Q(hold_expires_at__isnull=False),
+                name='booking_hold_expiry_idx'
+            ),
+        ]
+
+    # Statuses whose seats count towards Ride.confirmed_seat_count
+    SOLD_STATUSES = SOLD_STATUSES
+    # The live seat counter lease taken by reduce_seats(), settled on commit (see rides.seat_counter)
+    seat_lease = None
 
     def __str__(self):
         return f"{self.user.username} booking on {self.ride} - {self.status}"
 
+    @property
+    def sold_seats(self):
+        return self.no_of_seats if self.status in self.SOLD_STATUSES else 0
+
+    def _stored_sold_seats(self):
+        """Sold seats as currently stored, read under a row lock (None if the row is gone)."""
+        stored = Booking.objects.select_for_update().filter(pk=self.pk).values_list('status', 'no_of_seats').first()
+        if stored is None:
+            return None
+        status, no_of_seats = stored
+        return no_of_seats if status in self.SOLD_STATUSES else 0
+
+    def _update_ride_counters(self, bookings=0, seats=0):
+        if bookings or seats:
+            Ride.objects.filter(pk=self.ride_id).update(
+                booking_count=F('booking_count') + bookings,
+                confirmed_seat_count=F('confirmed_seat_count') + seats
+            )
+
     def reduce_seats(self):
         """Reduces available seats for the ride when booking is confirmed/paid"""
+        from . import seat_counter
+        from .cache import invalidate_ride_lists
+        from .inventory import reserve_seats, reserve_segment_seats
+
         if self.seats_deducted:
             return
 
-        with db_transaction.atomic():
-            # Refetch ride with lock to ensure seat availability hasn't changed
-            ride = Ride.objects.select_for_update().get(id=self.ride_id)
-            
-            if self.no_of_seats > ride.available_seats:
-                raise ValueError("Not enough available seats.")
-            
-            ride.available_seats -= self.no_of_seats
-            
-            if ride.available_seats <= 0:
-                ride.status = 'fully_booked'
-            ride.save()
-
-            self.seats_deducted = True
-            self.save(update_fields=['seats_deducted'])
+        # With live seat counters, a sold-out ride is turned away here without touching the row
+        lease = None if self.ride.is_multi_stop else seat_counter.take(self.ride_id, self.no_of_seats)
+        if lease is False:
+            raise ValueError("Not enough available seats.")
+
+        try:
+            with db_transaction.atomic():
+                # Claim the deduction first so a concurrent confirm of this booking can't take seats twice
+                if not Booking.objects.filter(pk=self.pk, seats_deducted=False).update(seats_deducted=True):
+                    self.seats_deducted = True
+                    if lease:
+                        seat_counter.cancel(self.ride_id, lease)
+                    return
+                if self.ride.is_multi_stop:
+                    reserved = reserve_segment_seats(self.ride_id, self.from_stop, self.to_stop, self.no_of_seats)
+                else:
+                    # Written behind the counter; the row stays authoritative
+                    reserved = reserve_seats(self.ride_id, self.no_of_seats)
+                if not reserved:
+                    if lease:
+                        # The counter had seats the row does not: reload it
+                        seat_counter.forget(self.ride_id)
+                    raise ValueError("Not enough available seats.")
+                self.seats_deducted = True
+
+                ride = self.ride
+                db_transaction.on_commit(lambda: invalidate_ride_lists(ride))
+        except Exception:
+            if lease:
+                seat_counter.cancel(self.ride_id, lease)
+            raise
+        if lease:
+            # Until the commit, whoever rolls the booking back has to cancel() it (see RideViewSet.book)
+            self.seat_lease = lease
+            db_transaction.on_commit(lambda: seat_counter.settle(self.ride_id, lease))
 
     def restore_seats(self):
         """Restores available seats for the ride when booking is cancelled"""
+        from . import seat_counter
+        from .cache import invalidate_ride_lists
+        from .inventory import release_seats, release_segment_seats
+
         if not self.seats_deducted:
             return
 
         with db_transaction.atomic():
-            # Refetch ride with lock
-            ride = Ride.objects.select_for_update().get(id=self.ride_id)
-            ride.available_seats += self.no_of_seats
-            
-            if ride.available_seats > 0 and ride.status == 'fully_booked':
-                ride.status = 'available'
-            ride.save()
-
+            if not Booking.objects.filter(pk=self.pk, seats_deducted=True).update(seats_deducted=False):
+                self.seats_deducted = False
+                return
+            if self.ride.is_multi_stop:
+                release_segment_seats(self.ride_id, self.from_stop, self.to_stop, self.no_of_seats)
+            else:
+                release_seats(self.ride_id, self.no_of_seats)
+                db_transaction.on_commit(lambda: seat_counter.forget(self.ride_id))
             self.seats_deducted = False
-            self.save(update_fields=['seats_deducted'])
+
+            ride = self.ride
+            db_transaction.on_commit(lambda: invalidate_ride_lists(ride))
+
+            from .waitlist import promote_waitlist
+            promote_waitlist(self.ride_id)
 
     def confirm_booking(self):
         """Manually confirm a booking (by driver) and reduce seats"""
@@ -120,13 +589,19 @@ class Booking(models.Model):
 
     def confirm_payment(self):
         """Confirm payment and reduce seats"""
+        from .holds import end_hold
+
         if self.is_paid:
             return
 
+        if self.hold_expires_at is not None and not end_hold(self):
+            # The hold expired and its seats were released; take them again
+            self.refresh_from_db(fields=['seats_deducted'])
         self.reduce_seats()
         self.is_paid = True
         self.status = 'confirmed'
-        self.save(update_fields=['is_paid', 'status'])
+        self.hold_expires_at = None
+        self.save(update_fields=['is_paid', 'status', 'hold_expires_at'])
         
         # Send confirmation email
         from .utils import send_booking_confirmation_email
@@ -134,9 +609,13 @@ class Booking(models.Model):
 
     def cancel_booking(self, reason=None):
         """Cancel the booking and restore seats if they were deducted"""
+        from .holds import end_hold
+
         if self.status == 'cancelled':
             return
 
+        if self.hold_expires_at is not None:
+            end_hold(self)
         if self.seats_deducted:
             self.restore_seats()
 
@@ -145,12 +624,59 @@ class Booking(models.Model):
 
     def save(self, *args, **kwargs):
         is_new = self.pk is None
-        super().save(*args, **kwargs)
+        if is_new and self.ride.is_multi_stop:
+            from .stops import stop_range
+            # Whole-route unless a sub-route was asked for
+            self.from_stop, self.to_stop = stop_range(self.ride, self.from_stop, self.to_stop)
+        update_fields = kwargs.get('update_fields')
+        affects_counters = update_fields is None or {'status', 'no_of_seats'} & set(update_fields)
+
+        with db_transaction.atomic():
+            previous_seats = 0
+            if affects_counters and not is_new:
+                previous_seats = self._stored_sold_seats() or 0
+            super().save(*args, **kwargs)
+            if is_new:
+                self._update_ride_counters(bookings=1, seats=self.sold_seats)
+                self._record_demand(0, self.sold_seats)
+            elif affects_counters:
+                self._update_ride_counters(seats=self.sold_seats - previous_seats)
+                self._record_demand(previous_seats, self.sold_seats)
+
+            self._bump_user_versions()
+
         if is_new:
             # Send notification to driver about new booking
             from .utils import send_new_booking_notification_to_driver
             send_new_booking_notification_to_driver(self)
 
+    def delete(self, *args, **kwargs):
+        with db_transaction.atomic():
+            stored_seats = self._stored_sold_seats()
+            result = super().delete(*args, **kwargs)
+            if stored_seats is not None:
+                self._update_ride_counters(bookings=-1, seats=-stored_seats)
+                self._record_demand(stored_seats, 0)
+            self._bump_user_versions()
+        return result
+
+    def _record_demand(self, previous_seats, seats):
+        """Feed a change in sold seats into the route demand rollup once it commits."""
+        if seats == previous_seats:
+            return
+        from .demand import record_sale
+        ride = self.ride
+        bookings = (seats > 0) - (previous_seats > 0)
+        db_transaction.on_commit(
+            lambda: record_sale(ride, bookings=bookings, seats=seats - previous_seats), robust=True
+        )
+
+    def _bump_user_versions(self):
+        # Both the passenger and the driver see this booking
+        from .cache import bump_user_versions
+        user_ids = (self.user_id, self.ride.driver_id)
+        db_transaction.on_commit(lambda: bump_user_versions(*user_ids))
+
 class Review(models.Model):
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='reviews')
     reviewer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews_given')
@@ -158,6 +684,7 @@ class Review(models.Model):
     rating = models.PositiveSmallIntegerField(default=5)  # 1-5 stars
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('booking', 'reviewer')  # One review per booking per side
@@ -179,5 +706,56 @@ class Review(models.Model):
                     if avg_rating:
                         driver_profile.rating = avg_rating
                         driver_profile.save()
+                        from .cache import touch_driver_rides
+                        touch_driver_rides(self.reviewee_id)
                 except Exception as e:
-                    logger.warning(f"Could not update driver rating for reviewee {self.reviewee_id}: {e}")
\ No newline at end of file
+                    logger.warning(f"Could not update driver rating for reviewee {self.reviewee_id}: {e}")
+        from .cache import bump_user_versions
+        user_ids = (self.reviewer_id, self.reviewee_id)
+        db_transaction.on_commit(lambda: bump_user_versions(*user_ids))
+
+    def delete(self, *args, **kwargs):
+        from .cache import bump_user_versions
+        user_ids = (self.reviewer_id, self.reviewee_id)
+        result = super().delete(*args, **kwargs)
+        db_transaction.on_commit(lambda: bump_user_versions(*user_ids))
+        return result
+
+
+class SavedSearch(models.Model):
+    """A passenger's stored route search; new rides that match it trigger a notification (see rides.alerts)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_searches')
+    departure_location = models.CharField(max_length=100, blank=True, default='')
+    destination = models.CharField(max_length=100, blank=True, default='')
+    date_from = models.DateTimeField(null=True, blank=True)
+    date_to = models.DateTimeField(null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    # Inverted-index keys: the most selective normalized token of each side ('' matches any ride)
+    departure_key = models.CharField(max_length=20, blank=True, default='', editable=False)
+    destination_key = models.CharField(max_length=20, blank=True, default='', editable=False)
+    last_notified_at = models.DateTimeField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['departure_key', 'destination_key'],
+                condition=models.Q(is_active=True),
+                name='saved_search_route_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.departure_location or '*'} to {self.destination or '*'}"
+
+    def save(self, *args, **kwargs):
+        from .alerts import route_key
+
+        self.departure_key = route_key(self.departure_location)
+        self.destination_key = route_key(self.destination)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'departure_key', 'destination_key'}
+        super().save(*args, **kwargs)
@@ -0,0 +1,124 @@
+# rides/pagination.py
+import base64
+import json
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RideKeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination for rides, keyed on (ordering field, id).
+
+    Each page is a range scan from the last row of the previous page over a
+    composite index, so page N costs the same as page 1, and rows inserted or
+    removed between requests can never shift a page and cause a ride to be
+    skipped or repeated.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    default_ordering = 'departure_time'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Ordering field -> parser for the cursor value
+    ordering_fields = {
+        'departure_time': datetime.fromisoformat,
+        'price': Decimal,
+        'available_seats': int,
+    }
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_param, '')
+        term = ordering.split(',')[0].strip()
+        field = term.lstrip('-')
+        if field not in self.ordering_fields:
+            return self.default_ordering, False
+        return field, term.startswith('-')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            parse = self.ordering_fields[self.field]
+            return parse(data['v']), int(data['id']), bool(data.get('r'))
+        except (KeyError, TypeError, ValueError, InvalidOperation, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.field)
+        value = value.isoformat() if isinstance(value, datetime) else str(value)
+        data = json.dumps({'v': value, 'id': obj.pk, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self.get_ordering(request)
+        cursor = self.decode_cursor(request)
+        reverse = cursor[2] if cursor else False
+
+        # Walking backwards flips the scan direction; the page is re-reversed below.
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')
+
+        if cursor:
+            value, pk, _ = cursor
+            op = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{op}': value})
+                | Q(**{self.field: value, f'id__{op}': pk})
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
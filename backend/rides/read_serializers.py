@@ -0,0 +1,153 @@
+# rides/read_serializers.py
+"""
+Read-only fast path for ride payloads.
+
+Produces exactly the JSON that RideListSerializer does for list and retrieve
+responses, but from `.values()` rows plus one batched image query, so no Ride,
+User, Driver or RideImage instances are created and DRF's per-object field
+machinery is skipped. The DRF field instances are still used for formatting
+(datetimes, decimals, ratings), so both paths render identically. The srcset
+maps of every image on the page (rides.images) come from one more query.
+"""
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from rest_framework.relations import PrimaryKeyRelatedField
+
+from .images import SrcsetField, load_variants, srcset
+from .models import RideImage
+from .serializers import RideListSerializer
+
+USER_FIELDS = ['id', 'username', 'email', 'first_name', 'last_name', 'phone_number', 'profile_picture']
+DRIVER_PROFILE_FIELDS = ['vehicle_model', 'vehicle_color', 'vehicle_plate', 'vehicle_picture', 'rating']
+IMAGE_FIELDS = ['id', 'image', 'created_at']
+NESTED_FIELDS = {'driver', 'images', 'is_available'}
+IMAGE_BATCH_SIZE = 900
+
+
+class RideReadSerializer:
+    """Serialize Ride querysets to RideListSerializer's output shape from values() rows."""
+
+    def __init__(self, context=None):
+        self.request = (context or {}).get('request')
+        self.variants = {}
+        self.urls = {}
+        template = RideListSerializer(context=context or {})
+        self.fields = template.fields
+        self.ride_fields = [
+            name for name, field in self.fields.items()
+            if not field.write_only
+        ]
+        self.flat_fields = [name for name in self.ride_fields if name not in NESTED_FIELDS]
+        self.user_fields = self.fields['driver'].fields
+        self.profile_fields = self.user_fields['driver_profile'].fields
+        self.image_fields = self.fields['images'].child.fields
+
+    def file_url(self, name):
+        # Mirrors serializers.FileField.to_representation with use_url=True.
+        # Memoized because the same driver and vehicle pictures repeat across a page.
+        if not name:
+            return None
+        if name not in self.urls:
+            url = default_storage.url(name)
+            if self.request is not None:
+                url = self.request.build_absolute_uri(url)
+            self.urls[name] = url
+        return self.urls[name]
+
+    def format(self, field, value, fields):
+        if value is None:
+            return None
+        if field in ('profile_picture', 'vehicle_picture', 'image'):
+            return self.file_url(value)
+        if field == 'rating':
+            return float(value)
+        if isinstance(fields[field], PrimaryKeyRelatedField):
+            # values() already yields the key; the DRF field expects an instance
+            return value
+        return fields[field].to_representation(value)
+
+    def columns(self, queryset):
+        columns = list(self.flat_fields)
+        columns += [f'driver__{name}' for name in USER_FIELDS]
+        columns += ['driver__driver_profile__id']
+        columns += [f'driver__driver_profile__{name}' for name in DRIVER_PROFILE_FIELDS]
+        if 'distance_km' in queryset.query.annotations:
+            columns.append('distance_km')
+        return columns
+
+    def images_by_ride(self, ride_ids):
+        """Image column values of each ride, in id order."""
+        images = defaultdict(list)
+        # Chunked to stay under the bound-parameter limit of SQLite on very large pages
+        for start in range(0, len(ride_ids), IMAGE_BATCH_SIZE):
+            rows = (
+                RideImage.objects.filter(ride_id__in=ride_ids[start:start + IMAGE_BATCH_SIZE])
+                .order_by('id')
+                .values('ride_id', *IMAGE_FIELDS)
+            )
+            for row in rows:
+                images[row['ride_id']].append(row)
+        return images
+
+    def load_srcsets(self, rows, images):
+        """Fetch the derivatives of every picture on the page with one query."""
+        names = {row['driver__profile_picture'] for row in rows}
+        names |= {row['driver__driver_profile__vehicle_picture'] for row in rows}
+        names |= {image['image'] for ride_images in images.values() for image in ride_images}
+        names = [name for name in names if name and name not in self.variants]
+        if names:
+            self.variants.update(load_variants(names))
+
+    def srcset(self, name):
+        if not name:
+            return None
+        return srcset(self.variants.get(name), self.file_url)
+
+    def nested(self, fields, values):
+        """One nested object in serializer field order, from its column `values`."""
+        data = {}
+        for name, field in fields.items():
+            if isinstance(field, SrcsetField):
+                data[name] = self.srcset(values[field.source])
+            elif name in values:
+                data[name] = self.format(name, values[name], fields)
+        return data
+
+    def driver(self, row):
+        driver = self.nested(self.user_fields, {name: row[f'driver__{name}'] for name in USER_FIELDS})
+        if row['driver__driver_profile__id'] is None:
+            driver['driver_profile'] = None
+        else:
+            driver['driver_profile'] = self.nested(
+                self.profile_fields,
+                {name: row[f'driver__driver_profile__{name}'] for name in DRIVER_PROFILE_FIELDS}
+            )
+        return driver
+
+    def serialize(self, queryset):
+        rows = list(queryset.values(*self.columns(queryset)))
+        images = self.images_by_ride([row['id'] for row in rows])
+        self.load_srcsets(rows, images)
+
+        results = []
+        for row in rows:
+            data = {}
+            for name in self.ride_fields:
+                if name == 'driver':
+                    data[name] = self.driver(row)
+                elif name == 'images':
+                    data[name] = [self.nested(self.image_fields, image) for image in images.get(row['id'], [])]
+                elif name == 'is_available':
+                    data[name] = row['available_seats'] > 0 and row['status'] == 'available'
+                else:
+                    data[name] = self.format(name, row[name], self.fields)
+            if 'distance_km' in row:
+                data['distance_km'] = round(row['distance_km'], 3)
+            results.append(data)
+        return results
+
+
+def serialize_rides(queryset, context=None):
+    """RideListSerializer-equivalent payloads for every ride in `queryset`, in queryset order."""
+    return RideReadSerializer(context).serialize(queryset)
@@ -0,0 +1,151 @@
+# rides/recurring.py
+"""
+Materialize recurring ride templates into future rides.
+
+One request creates every ride in a single transaction:
+- one bulk_create for the rides and another for their images, where each
+  RideImage points at the template's stored file, so nothing is uploaded again;
+- one wallet row lock, with a single platform-fee Transaction for the sum of
+  the per-ride fees;
+- one Notification to the driver;
+- one cache invalidation, since all the rides share a route.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from accounts.models import Notification
+from payments.models import Transaction, Wallet
+
+from .alerts import notify_saved_searches
+from .autocomplete import location_index
+from .cache import bump_user_versions, invalidate_ride_lists
+from .gazetteer import canonicalize_rides
+from .models import Ride, RideImage, RideTemplate
+from .search import index_rides, normalize_location
+
+MAX_OCCURRENCES = 30
+# Furthest ahead a template can be materialized
+HORIZON_DAYS = 90
+FEE_RATE = Decimal('0.05')
+MINIMUM_FEE = Decimal('1.00')
+
+
+class InsufficientBalance(Exception):
+    def __init__(self, balance, fee):
+        super().__init__(f"Wallet balance (KES {balance}) is insufficient for the platform fee (KES {fee}).")
+        self.balance = balance
+        self.fee = fee
+
+
+def platform_fee(price, seats):
+    """The per-ride fee RideViewSet.create charges."""
+    return max(price * seats * FEE_RATE, MINIMUM_FEE).quantize(Decimal('0.01'))
+
+
+def occurrences(template, count, start=None):
+    """The next `count` departure datetimes of the template, from `start` (default: now)."""
+    start = start or timezone.now()
+    weekdays = {int(day) for day in template.weekdays}
+    current_tz = timezone.get_current_timezone()
+    day = timezone.localtime(start).date()
+    found = []
+    for _ in range(HORIZON_DAYS):
+        if day.weekday() in weekdays:
+            departure = timezone.make_aware(datetime.combine(day, template.departure_time), current_tz)
+            if departure > start:
+                found.append(departure)
+                if len(found) == count:
+                    break
+        day += timedelta(days=1)
+    return found
+
+
+def materialize(template, count, start=None):
+    """
+    Create rides for the template's next `count` occurrences and charge their
+    fees from the driver's wallet. Occurrences that already have a ride are
+    skipped, so repeating a request is harmless. Returns (new rides, total fee).
+    Raises InsufficientBalance without creating anything.
+    """
+    with db_transaction.atomic():
+        # Serializes concurrent materializations of the same template
+        template = RideTemplate.objects.select_for_update().get(pk=template.pk)
+        departures = occurrences(template, count, start)
+        existing = set(
+            Ride.objects.filter(template=template, departure_time__in=departures).values_list('departure_time', flat=True)
+        )
+        departures = [departure for departure in departures if departure not in existing]
+        if not departures:
+            return [], Decimal('0.00')
+
+        fee = platform_fee(template.price, template.available_seats)
+        total_fee = fee * len(departures)
+
+        wallet, _ = Wallet.objects.get_or_create(user=template.driver)
+        wallet = Wallet.objects.select_for_update().get(id=wallet.id)
+        if wallet.balance < total_fee:
+            raise InsufficientBalance(wallet.balance, total_fee)
+
+        rides = []
+        for departure in departures:
+            ride = Ride(
+                template=template,
+                driver_id=template.driver_id,
+                departure_location=template.departure_location,
+                destination=template.destination,
+                departure_time=departure,
+                departure_latitude=template.departure_latitude,
+                departure_longitude=template.departure_longitude,
+                destination_latitude=template.destination_latitude,
+                destination_longitude=template.destination_longitude,
+                available_seats=template.available_seats,
+                price=template.price,
+                additional_info=template.additional_info,
+                platform_fee=fee,
+                status='available' if template.available_seats > 0 else 'fully_booked',
+                # bulk_create skips Ride.save(), so fill in what it would derive
+                departure_search=normalize_location(template.departure_location),
+                destination_search=normalize_location(template.destination),
+            )
+            ride.update_geohashes()
+            rides.append(ride)
+        canonicalize_rides(rides)
+        rides = Ride.objects.bulk_create(rides)
+        index_rides(rides, replace=False)
+
+        image_names = list(template.images.values_list('image', flat=True))
+        RideImage.objects.bulk_create([
+            RideImage(ride=ride, image=name) for ride in rides for name in image_names
+        ])
+
+        wallet.balance -= total_fee
+        wallet.save()
+        Transaction.objects.create(
+            wallet=wallet,
+            amount=-total_fee,
+            status="success",
+            result_code=0,
+            result_desc=f"Platform Fee for {len(rides)} ride(s) from template #{template.id}",
+            completed_at=timezone.now(),
+            transaction_type="ride_fee"
+        )
+        Notification.objects.create(
+            user_id=template.driver_id,
+            title="Recurring Rides Posted",
+            message=(
+                f"{len(rides)} ride(s) from {template.departure_location} to {template.destination} are now available. "
+                f"Platform fee of KES {total_fee} has been deducted from your wallet."
+            ),
+            notification_type="success"
+        )
+
+        db_transaction.on_commit(lambda: invalidate_ride_lists(rides[0]))
+        db_transaction.on_commit(lambda: bump_user_versions(template.driver_id))
+        db_transaction.on_commit(lambda: [location_index.note_ride(ride) for ride in rides])
+        for ride in rides:
+            db_transaction.on_commit(lambda ride=ride: notify_saved_searches(ride), robust=True)
+
+    return rides, total_fee
@@ -0,0 +1,114 @@
+# rides/search.py
+"""
+Route search index for rides.
+
+Each ride keeps a normalized copy of its departure and destination next to the
+raw text, plus one RideSearchTerm row per token prefix. Searches match when every
+query token is a prefix of a token in the location ("nai cbd" matches
+"Nairobi CBD"). On PostgreSQL with pg_trgm the normalized columns are searched
+through a trigram index; everywhere else the prefix term table is used, which is
+a plain equality lookup on an indexed column.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+
+# Longer query tokens are truncated to this length, matching what is indexed.
+MAX_PREFIX_LENGTH = 20
+
+SEARCH_FIELDS = {
+    'departure_location': 'departure',
+    'destination': 'destination',
+}
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+_trigram_available = None
+
+
+def normalize_location(value):
+    """Lowercase, strip accents and punctuation, and collapse whitespace."""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', str(value))
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(' ', value.lower()).strip()
+
+
+def tokenize(value):
+    """Split a location into normalized tokens, truncated to the indexed length."""
+    tokens = []
+    for token in normalize_location(value).split():
+        token = token[:MAX_PREFIX_LENGTH]
+        if token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def prefix_terms(value):
+    """Every prefix of every token in the location, as stored in the term table."""
+    terms = set()
+    for token in tokenize(value):
+        for end in range(1, len(token) + 1):
+            terms.add(token[:end])
+    return terms
+
+
+def uses_trigram_index():
+    """True when the database can answer searches from the pg_trgm index."""
+    global _trigram_available
+    if connection.vendor != 'postgresql':
+        return False
+    if _trigram_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available = cursor.fetchone() is not None
+    return _trigram_available
+
+
+def build_search_terms(rides):
+    """Unsaved RideSearchTerm rows for the given (saved) rides."""
+    from .models import RideSearchTerm
+
+    terms = []
+    for ride in rides:
+        for field, kind in SEARCH_FIELDS.items():
+            for term in prefix_terms(getattr(ride, field)):
+                terms.append(RideSearchTerm(ride_id=ride.pk, field=kind, term=term))
+    return terms
+
+
+def index_rides(rides, replace=True):
+    """(Re)build the prefix terms of the given rides, e.g. after bulk_create."""
+    from .models import RideSearchTerm
+
+    rides = list(rides)
+    if replace:
+        RideSearchTerm.objects.filter(ride__in=[ride.pk for ride in rides]).delete()
+    RideSearchTerm.objects.bulk_create(build_search_terms(rides), batch_size=1000)
+
+
+def location_condition(field, tokens):
+    """Q matching rides whose `field` contains every one of `tokens` (from tokenize())."""
+    condition = Q()
+    if uses_trigram_index():
+        column = f"{SEARCH_FIELDS[field]}_search"
+        for token in tokens:
+            condition &= Q(**{f"{column}__regex": r'(^| )' + re.escape(token)})
+        return condition
+
+    from .models import RideSearchTerm
+
+    kind = SEARCH_FIELDS[field]
+    for token in tokens:
+        condition &= Q(id__in=RideSearchTerm.objects.filter(field=kind, term=token).values('ride_id'))
+    return condition
+
+
+def filter_by_location(queryset, field, value):
+    """Restrict a Ride queryset to rides whose `field` matches every token in `value`."""
+    tokens = tokenize(value)
+    if not tokens:
+        return queryset
+    return queryset.filter(location_condition(field, tokens))
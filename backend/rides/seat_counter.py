@@ -0,0 +1,208 @@
+# rides/seat_counter.py
+"""
+Live seat counters in Redis, in front of the Ride row.
+
+With SEAT_COUNTER_BACKEND = 'redis', each single-route ride that gets booked
+has its free seats mirrored in a Redis counter. Booking.reduce_seats first
+takes the seats from the counter with a Lua script that checks the floor and
+DECRBYs in one step. It then writes the same change behind to the Ride row
+with the guarded UPDATE of rides.inventory, inside the booking transaction, so
+the row stays authoritative. A booking for a sold-out ride is turned away by
+one Redis round trip (RideViewSet.book checks the counter right after the
+visibility lookup) and never writes to the row or locks it.
+
+Every take is recorded as a lease, a sorted-set member scored by its expiry,
+and the lease is dropped once the booking transaction commits. If the
+transaction rolls back, the lease stays behind, and `manage.py
+reconcile_seat_counters` gives its seats back once it expires. That command
+also compares each counter with its row and resets any that drifted. Seats
+given back in the database (cancellations, expired holds, ride edits) drop the
+counter; the next take reloads it from the row, less the open leases.
+
+If Redis cannot be reached, every call here returns None and bookings use the
+database path.
+"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+COUNTER_KEY = 'ride_seats:{}'
+LEASES_KEY = 'ride_seat_leases:{}'
+# Longer than any booking transaction
+LEASE_SECONDS = 60
+COUNTER_TTL = 6 * 60 * 60
+
+# KEYS: counter, leases. ARGV: seats, lease member, lease expiry, key TTL.
+# Returns the seats left, -1 if fewer than `seats` are left, or -2 if the counter is not loaded.
+TAKE_SCRIPT = """
+local left = redis.call('GET', KEYS[1])
+if not left then return -2 end
+if tonumber(left) < tonumber(ARGV[1]) then return -1 end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return redis.call('DECRBY', KEYS[1], ARGV[1])
+"""
+
+# KEYS: counter, leases. ARGV: seats on the row, key TTL, 'NX' to keep an existing counter.
+# Sets the counter to the row's seats less the seats of open leases, which the row does not include yet.
+LOAD_SCRIPT = """
+local held = 0
+for _, member in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    held = held + tonumber(string.match(member, ':(%d+)$'))
+end
+local seats = math.max(tonumber(ARGV[1]) - held, 0)
+if ARGV[3] == 'NX' then
+    if redis.call('SET', KEYS[1], seats, 'EX', ARGV[2], 'NX') then return seats end
+    return tonumber(redis.call('GET', KEYS[1]))
+end
+redis.call('SET', KEYS[1], seats, 'EX', ARGV[2])
+return seats
+"""
+
+# KEYS: counter, leases. ARGV: lease member. Drops the lease and gives its seats back.
+CANCEL_SCRIPT = """
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 0 then return 0 end
+local seats = tonumber(string.match(ARGV[1], ':(%d+)$'))
+-- Only if still loaded; a reload after the ZREM already counts the seats as free
+if redis.call('EXISTS', KEYS[1]) == 1 then redis.call('INCRBY', KEYS[1], seats) end
+return seats
+"""
+
+# KEYS: counter, leases. ARGV: now. Gives the seats of expired leases back. Returns them.
+EXPIRE_SCRIPT = """
+local seats = 0
+for _, member in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])) do
+    seats = seats + tonumber(string.match(member, ':(%d+)$'))
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+if seats > 0 and redis.call('EXISTS', KEYS[1]) == 1 then redis.call('INCRBY', KEYS[1], seats) end
+return seats
+"""
+
+
+def enabled():
+    return settings.SEAT_COUNTER_BACKEND == 'redis'
+
+
+def _client():
+    from django_redis import get_redis_connection
+
+    return get_redis_connection('default')
+
+
+def _keys(ride_id):
+    return [COUNTER_KEY.format(ride_id), LEASES_KEY.format(ride_id)]
+
+
+def _redis_call(func, *args):
+    """func(client, *args), or None when the counters are off or Redis fails."""
+    if not enabled():
+        return None
+    from redis.exceptions import RedisError
+
+    try:
+        return func(_client(), *args)
+    except RedisError as e:
+        logger.warning(f"Seat counter unavailable, using the database: {e}")
+        return None
+
+
+def _load(client, ride_id, seats=None, only_if_missing=True):
+    """Set the counter from the row's seats (read unless given). None if the ride is gone."""
+    from .models import Ride
+
+    if seats is None:
+        seats = Ride.objects.filter(pk=ride_id).values_list('available_seats', flat=True).first()
+        if seats is None:
+            return None
+    return client.register_script(LOAD_SCRIPT)(
+        keys=_keys(ride_id), args=[seats, COUNTER_TTL, 'NX' if only_if_missing else '']
+    )
+
+
+def _take(client, ride_id, seats):
+    lease = f"{uuid.uuid4().hex}:{seats}"
+    take = client.register_script(TAKE_SCRIPT)
+    args = [seats, lease, time.time() + LEASE_SECONDS, COUNTER_TTL]
+    left = take(keys=_keys(ride_id), args=args)
+    if left == -2:
+        if _load(client, ride_id) is None:
+            return False
+        left = take(keys=_keys(ride_id), args=args)
+    return lease if left >= 0 else False
+
+
+def take(ride_id, seats):
+    """
+    Take `seats` from the ride's counter, loading it from the row on first use.
+    Returns a lease to settle() or cancel(), False if too few seats are left,
+    or None if the counters are not in use.
+    """
+    return _redis_call(_take, ride_id, seats)
+
+
+def settle(ride_id, lease):
+    """The taken seats are now on the row: drop the lease. Call on commit."""
+    return _redis_call(lambda client: client.zrem(LEASES_KEY.format(ride_id), lease))
+
+
+def cancel(ride_id, lease):
+    """Give the lease's seats back straight away, e.g. when the booking could not go ahead."""
+    return _redis_call(
+        lambda client: client.register_script(CANCEL_SCRIPT)(keys=_keys(ride_id), args=[lease])
+    )
+
+
+def forget(*ride_ids):
+    """Drop the counters of rides whose seats changed in the database; the next take reloads them."""
+    if ride_ids:
+        return _redis_call(lambda client: client.delete(*[COUNTER_KEY.format(ride_id) for ride_id in ride_ids]))
+
+
+def peek(ride_id):
+    """Seats left according to the counter, or None if it is not loaded (or not in use)."""
+    left = _redis_call(lambda client: client.get(COUNTER_KEY.format(ride_id)))
+    return None if left is None else int(left)
+
+
+def _reconcile(client, ride_ids, now):
+    from .models import Ride
+
+    expire = client.register_script(EXPIRE_SCRIPT)
+    returned = sum(expire(keys=_keys(ride_id), args=[now]) for ride_id in ride_ids)
+    drifted = 0
+    rows = dict(Ride.objects.filter(pk__in=ride_ids).values_list('id', 'available_seats'))
+    for ride_id in ride_ids:
+        if ride_id not in rows:
+            client.delete(*_keys(ride_id))
+            continue
+        counted = client.get(COUNTER_KEY.format(ride_id))
+        expected = _load(client, ride_id, rows[ride_id], only_if_missing=False)
+        if counted is not None and int(counted) != expected:
+            drifted += 1
+    return {'rides': len(ride_ids), 'returned': returned, 'drifted': drifted}
+
+
+def loaded_ride_ids(batch_size=500):
+    """Ids of the rides that have a counter, in batches, without blocking Redis (SCAN)."""
+    client = _client()
+    batch = []
+    for key in client.scan_iter(match=COUNTER_KEY.format('*'), count=batch_size):
+        batch.append(int(key.decode().split(':', 1)[1]))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reconcile(ride_ids, now=None):
+    """
+    Give back the seats of expired leases, then reset the counters of `ride_ids`
+    from their rows. Returns {'rides', 'returned', 'drifted'}, or None if the counters are not in use.
+    """
+    return _redis_call(_reconcile, list(ride_ids), now or time.time())
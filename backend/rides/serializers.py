@@ -1,17 +1,23 @@
 # rides/serializers.py
 from rest_framework import serializers
 from django.utils import timezone
-from .models import Ride, Booking, RideImage, Review
+from django.db import transaction as db_transaction
+from .models import Ride, Booking, RideImage, Review, SavedSearch, RideTemplate, RideTemplateImage, UploadedImage, UploadSession, RouteDemand, Place
+from .images import SrcsetField
+from .inventory import change_seats
+from .search import tokenize
+from .stops import MAX_STOPS, seats_between, set_stops, stop_range
 from accounts.models import User, Driver
 from decimal import Decimal
 
 
 class DriverProfileSerializer(serializers.ModelSerializer):
     rating = serializers.SerializerMethodField()
+    vehicle_picture_srcset = SrcsetField(source='vehicle_picture')
 
     class Meta:
         model = Driver
-        fields = ['vehicle_model', 'vehicle_color', 'vehicle_plate', 'vehicle_picture', 'rating']
+        fields = ['vehicle_model', 'vehicle_color', 'vehicle_plate', 'vehicle_picture', 'vehicle_picture_srcset', 'rating']
 
     def get_rating(self, obj):
         return float(obj.rating)
@@ -19,56 +25,146 @@ class DriverProfileSerializer(serializers.ModelSerializer):
 
 class UserSerializer(serializers.ModelSerializer):
     driver_profile = DriverProfileSerializer(read_only=True)
+    profile_picture_srcset = SrcsetField(source='profile_picture')
     
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'phone_number', 'profile_picture', 'driver_profile']
+        fields = [
+            'id', 'username', 'email', 'first_name', 'last_name', 'phone_number',
+            'profile_picture', 'profile_picture_srcset', 'driver_profile'
+        ]
 
 
 class RideImageSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField(source='image')
+
     class Meta:
         model = RideImage
-        fields = ['id', 'image', 'created_at']
+        fields = ['id', 'image', 'srcset', 'created_at']
 
 
 class RideListSerializer(serializers.ModelSerializer):
     driver = UserSerializer(read_only=True)  # Return full driver object
-    available_seats = serializers.IntegerField()
+    available_seats = serializers.IntegerField(min_value=0)
     is_available = serializers.SerializerMethodField()
     images = RideImageSerializer(many=True, read_only=True)
     uploaded_images = serializers.ListField(
         child=serializers.ImageField(max_length=1000000, allow_empty_file=False, use_url=False),
         write_only=True,
-        required=True,
+        required=False,
         allow_empty=False
     )
+    # Completed uploads (rides.uploads); nothing is written to storage while the ride is created
+    image_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        write_only=True,
+        required=False,
+        allow_empty=False,
+        max_length=10
+    )
+    # Intermediate stops between departure and destination, in travel order
+    stops = serializers.ListField(
+        child=serializers.CharField(max_length=100),
+        write_only=True,
+        required=False,
+        max_length=MAX_STOPS
+    )
 
     class Meta:
         model = Ride
-        fields = '__all__'
+        exclude = [
+            'departure_search', 'destination_search', 'departure_geohash', 'destination_geohash',
+            'booking_count', 'confirmed_seat_count', 'held_seats',
+        ]
         read_only_fields = ['status', 'created_at', 'updated_at', 'driver', 'images']
 
+    def validate(self, data):
+        for point in ('departure', 'destination'):
+            latitude = data.get(f'{point}_latitude', getattr(self.instance, f'{point}_latitude', None))
+            longitude = data.get(f'{point}_longitude', getattr(self.instance, f'{point}_longitude', None))
+            if (latitude is None) != (longitude is None):
+                raise serializers.ValidationError(
+                    {f'{point}_latitude': "Latitude and longitude must be provided together."}
+                )
+        if self.instance is None and not data.get('uploaded_images') and not data.get('image_ids'):
+            raise serializers.ValidationError({"image_ids": "At least one image is required."})
+        if self.instance is not None:
+            if 'stops' in data:
+                raise serializers.ValidationError({"stops": "Stops can only be set when the ride is created."})
+            if (
+                self.instance.is_multi_stop
+                and 'available_seats' in data
+                and data['available_seats'] != self.instance.available_seats
+            ):
+                raise serializers.ValidationError(
+                    {"available_seats": "Seats of a multi-stop ride are managed per segment."}
+                )
+            if self.instance.is_multi_stop:
+                # The first and last stops, and their search terms, are the endpoints
+                for field in ('departure_location', 'destination'):
+                    if field in data and data[field] != getattr(self.instance, field):
+                        raise serializers.ValidationError(
+                            {field: "The endpoints of a multi-stop ride are its first and last stops."}
+                        )
+        return data
+
+    def validate_image_ids(self, value):
+        # Only the uploader can attach an upload
+        uploads = UploadedImage.objects.filter(id__in=value, owner=self.context['request'].user)
+        by_id = {upload.id: upload for upload in uploads}
+        missing = [image_id for image_id in value if image_id not in by_id]
+        if missing:
+            raise serializers.ValidationError(f"Unknown upload(s): {missing}.")
+        return [by_id[image_id] for image_id in dict.fromkeys(value)]
+
     def create(self, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', [])
-        ride = Ride.objects.create(**validated_data)
-        
+        uploads = validated_data.pop('image_ids', [])
+        stops = validated_data.pop('stops', [])
+        with db_transaction.atomic():
+            ride = Ride.objects.create(**validated_data)
+            set_stops(ride, stops)
+            RideImage.objects.bulk_create([RideImage(ride=ride, image=upload.image.name) for upload in uploads])
+
         for image in uploaded_images:
             RideImage.objects.create(ride=ride, image=image)
             
         return ride
 
+    def update(self, instance, validated_data):
+        # Ride.save leaves the seats alone; a capacity edit is applied as a change to the free seats
+        seats = validated_data.pop('available_seats', instance.available_seats)
+        with db_transaction.atomic():
+            ride = super().update(instance, validated_data)
+            if not change_seats(ride.pk, seats - instance.available_seats):
+                raise serializers.ValidationError(
+                    {"available_seats": "More seats are already taken than the new capacity allows."}
+                )
+            ride.refresh_from_db(fields=['available_seats', 'status', 'updated_at'])
+        return ride
+
     def get_is_available(self, obj):
         return obj.available_seats > 0 and obj.status == 'available'
 
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        # Present only on "rides near me" searches, where the queryset is annotated
+        if hasattr(instance, 'distance_km'):
+            representation['distance_km'] = round(instance.distance_km, 3)
+        return representation
+
 
 class RideDetailSerializer(serializers.ModelSerializer):
     driver = UserSerializer(read_only=True)
-    available_seats = serializers.IntegerField()
+    available_seats = serializers.IntegerField(min_value=0)
     is_available = serializers.SerializerMethodField()
 
     class Meta:
         model = Ride
-        fields = '__all__'
+        exclude = [
+            'departure_search', 'destination_search', 'departure_geohash', 'destination_geohash',
+            'booking_count', 'confirmed_seat_count', 'held_seats',
+        ]
         read_only_fields = ['status', 'created_at', 'updated_at', 'driver']
 
     def validate_departure_time(self, value):
@@ -95,9 +191,9 @@ class BookingSerializer(serializers.ModelSerializer):
         model = Booking
         fields = [
             'id', 'ride', 'ride_details', 'user', 'no_of_seats', 'status',
-            'is_paid', 'booked_at', 'updated_at', 'total_price'
+            'is_paid', 'booked_at', 'updated_at', 'hold_expires_at', 'from_stop', 'to_stop', 'total_price'
         ]
-        read_only_fields = ['booked_at', 'updated_at']
+        read_only_fields = ['booked_at', 'updated_at', 'hold_expires_at']
 
     def get_total_price(self, obj):
         subtotal = obj.no_of_seats * obj.ride.price
@@ -141,9 +237,20 @@ class BookingSerializer(serializers.ModelSerializer):
         if ride.status != 'available':
             raise serializers.ValidationError({"ride": "This ride is not available for booking"})
             
-        if no_of_seats and no_of_seats > ride.available_seats:
+        available_seats = ride.available_seats
+        if ride.is_multi_stop:
+            try:
+                from_stop, to_stop = stop_range(ride, data.get('from_stop'), data.get('to_stop'))
+            except ValueError as e:
+                raise serializers.ValidationError({"to_stop": str(e)})
+            data['from_stop'], data['to_stop'] = from_stop, to_stop
+            available_seats = seats_between(ride, from_stop, to_stop)
+        elif data.get('from_stop') is not None or data.get('to_stop') is not None:
+            raise serializers.ValidationError({"from_stop": "This ride has no intermediate stops"})
+
+        if no_of_seats and no_of_seats > available_seats:
             raise serializers.ValidationError(
-                {"no_of_seats": f"Only {ride.available_seats} seats available"}
+                {"no_of_seats": f"Only {available_seats} seats available"}
             )
             
         return data
@@ -234,3 +341,113 @@ class PublicProfileSerializer(serializers.ModelSerializer):
 
     def get_full_name(self, obj):
         return f"{obj.first_name} {obj.last_name}".strip() or obj.username
+
+
+class SavedSearchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SavedSearch
+        fields = [
+            'id', 'departure_location', 'destination', 'date_from', 'date_to',
+            'max_price', 'is_active', 'last_notified_at', 'created_at'
+        ]
+        read_only_fields = ['last_notified_at', 'created_at']
+
+    def validate(self, data):
+        departure = data.get('departure_location', getattr(self.instance, 'departure_location', ''))
+        destination = data.get('destination', getattr(self.instance, 'destination', ''))
+        if not tokenize(departure) and not tokenize(destination):
+            raise serializers.ValidationError("Provide a departure location, a destination or both.")
+
+        date_from = data.get('date_from', getattr(self.instance, 'date_from', None))
+        date_to = data.get('date_to', getattr(self.instance, 'date_to', None))
+        if date_from and date_to and date_to < date_from:
+            raise serializers.ValidationError({"date_to": "Must be after date_from."})
+        return data
+
+
+class RideTemplateImageSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField(source='image')
+
+    class Meta:
+        model = RideTemplateImage
+        fields = ['id', 'image', 'srcset', 'created_at']
+
+
+class RideTemplateSerializer(serializers.ModelSerializer):
+    images = RideTemplateImageSerializer(many=True, read_only=True)
+    uploaded_images = serializers.ListField(
+        child=serializers.ImageField(max_length=1000000, allow_empty_file=False, use_url=False),
+        write_only=True,
+        required=True,
+        allow_empty=False
+    )
+
+    class Meta:
+        model = RideTemplate
+        fields = '__all__'
+        read_only_fields = ['driver', 'created_at', 'updated_at']
+
+    def validate_weekdays(self, value):
+        days = sorted(set(value))
+        if not days or any(day not in '0123456' for day in days):
+            raise serializers.ValidationError("Use the digits 0 (Monday) to 6 (Sunday), e.g. '01234'.")
+        return ''.join(days)
+
+    def create(self, validated_data):
+        uploaded_images = validated_data.pop('uploaded_images', [])
+        template = RideTemplate.objects.create(**validated_data)
+        for image in uploaded_images:
+            RideTemplateImage.objects.create(template=template, image=image)
+        return template
+
+    def update(self, instance, validated_data):
+        uploaded_images = validated_data.pop('uploaded_images', [])
+        instance = super().update(instance, validated_data)
+        if uploaded_images:
+            instance.images.all().delete()
+            for image in uploaded_images:
+                RideTemplateImage.objects.create(template=instance, image=image)
+        return instance
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'received', 'expires_at']
+        read_only_fields = ['received', 'expires_at']
+
+
+class UploadedImageSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField(source='image')
+
+    class Meta:
+        model = UploadedImage
+        fields = ['id', 'image', 'srcset', 'sha256', 'size', 'created_at']
+
+
+class PlaceSerializer(serializers.ModelSerializer):
+    aliases = serializers.SlugRelatedField(many=True, read_only=True, slug_field='alias')
+
+    class Meta:
+        model = Place
+        fields = ['id', 'name', 'aliases']
+
+
+class RouteDemandSerializer(serializers.ModelSerializer):
+    weekday = serializers.SerializerMethodField()
+    hour = serializers.SerializerMethodField()
+    average_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = RouteDemand
+        fields = [
+            'departure', 'destination', 'hour_of_week', 'weekday', 'hour',
+            'searches', 'bookings', 'seats_sold', 'average_price', 'updated_at'
+        ]
+
+    def get_weekday(self, obj):
+        # 0 = Monday
+        return obj.hour_of_week // 24
+
+    def get_hour(self, obj):
+        return obj.hour_of_week % 24
@@ -0,0 +1,122 @@
+# rides/stops.py
+"""
+Multi-stop rides.
+
+A multi-stop ride has ordered RideStop rows. Stop 0 is the departure, the last
+stop is the destination, and the stops in between are where the driver picks
+up or drops off. Every leg between two neighbouring stops is a RideSegment with
+its own seat count. A booking from stop `a` to stop `b` takes seats on segments
+a .. b-1 only (rides.inventory), so one physical trip can be sold as many
+overlapping trips. Ride.available_seats mirrors the fullest segment, which is
+what a whole-route booking can still get.
+
+Stop locations get prefix terms like the route index in rides.search, so
+"rides passing through A and then B" is answered from an index with two
+EXISTS subqueries.
+"""
+from django.db.models import Exists, Min, OuterRef, Q
+
+from .search import location_condition, normalize_location, prefix_terms, tokenize
+
+MAX_STOPS = 10
+
+
+def set_stops(ride, intermediate_stops):
+    """
+    Create the stops and segments of a newly created ride.
+
+    `intermediate_stops` are the location names between departure and
+    destination. Passing none leaves the ride an ordinary single-leg ride.
+    """
+    from .models import Ride, RideSegment, RideStop, RideStopTerm
+
+    locations = [location.strip() for location in intermediate_stops if location and location.strip()]
+    if not locations:
+        return []
+    locations = [ride.departure_location, *locations, ride.destination]
+
+    stops = RideStop.objects.bulk_create([
+        RideStop(ride=ride, sequence=sequence, location=location, location_search=normalize_location(location))
+        for sequence, location in enumerate(locations)
+    ])
+    RideStopTerm.objects.bulk_create([
+        RideStopTerm(stop=stop, term=term)
+        for stop in stops
+        for term in prefix_terms(stop.location)
+    ], batch_size=1000)
+    RideSegment.objects.bulk_create([
+        RideSegment(ride=ride, sequence=sequence, available_seats=ride.available_seats)
+        for sequence in range(len(stops) - 1)
+    ])
+    Ride.objects.filter(pk=ride.pk).update(is_multi_stop=True)
+    ride.is_multi_stop = True
+    return stops
+
+
+def matching_stops(tokens):
+    """RideStop queryset of stops whose location matches every one of `tokens` (from tokenize())."""
+    from .models import RideStop, RideStopTerm
+
+    stops = RideStop.objects.all()
+    for token in tokens:
+        stops = stops.filter(id__in=RideStopTerm.objects.filter(term=token).values('stop_id'))
+    return stops
+
+
+def filter_through(queryset, pickup=None, dropoff=None):
+    """
+    Restrict a Ride queryset to rides that can carry a passenger from `pickup`
+    to `dropoff` (either may be omitted).
+
+    Multi-stop rides match when a stop matching `pickup` comes before a stop
+    matching `dropoff`. Single-leg rides match on their departure and
+    destination through the route index.
+    """
+    pickup_tokens, dropoff_tokens = tokenize(pickup), tokenize(dropoff)
+    if not pickup_tokens and not dropoff_tokens:
+        return queryset
+
+    boarding = matching_stops(pickup_tokens) if pickup_tokens else None
+    alighting = matching_stops(dropoff_tokens) if dropoff_tokens else None
+    if boarding is not None and alighting is not None:
+        boarding = boarding.filter(Exists(
+            alighting.filter(ride_id=OuterRef('ride_id'), sequence__gt=OuterRef('sequence'))
+        ))
+    elif boarding is not None:
+        from .models import RideStop
+
+        # Somewhere to get off after boarding, i.e. not the final stop
+        boarding = boarding.filter(Exists(
+            RideStop.objects.filter(ride_id=OuterRef('ride_id'), sequence__gt=OuterRef('sequence'))
+        ))
+    else:
+        boarding = alighting.filter(sequence__gt=0)
+
+    # Conditions on the outer queryset itself, not a second copy of it as a subquery
+    single_leg = Q(is_multi_stop=False)
+    if pickup_tokens:
+        single_leg &= location_condition('departure_location', pickup_tokens)
+    if dropoff_tokens:
+        single_leg &= location_condition('destination', dropoff_tokens)
+
+    return queryset.filter(Q(is_multi_stop=True, id__in=boarding.values('ride_id')) | single_leg)
+
+
+def stop_range(ride, from_stop=None, to_stop=None):
+    """
+    Validated (from_stop, to_stop) stop sequences for a booking on `ride`.
+    Missing ends default to the first and last stop. Raises ValueError.
+    """
+    last = ride.stops.count() - 1
+    from_stop = 0 if from_stop is None else int(from_stop)
+    to_stop = last if to_stop is None else int(to_stop)
+    if not 0 <= from_stop < to_stop <= last:
+        raise ValueError(f"Stops must satisfy 0 <= from_stop < to_stop <= {last}.")
+    return from_stop, to_stop
+
+
+def seats_between(ride, from_stop, to_stop):
+    """Seats a booking from `from_stop` to `to_stop` can still get."""
+    return ride.segments.filter(sequence__gte=from_stop, sequence__lt=to_stop).aggregate(
+        seats=Min('available_seats')
+    )['seats'] or 0
@@ -1,12 +1,20 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.cache import cache
+from django.http import QueryDict
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+import os
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
 
 from payments.models import Wallet, Transaction
 from rides.models import Ride, Booking
+from rides.cache import invalidate_ride_lists, list_cache_key
 
 User = get_user_model()
 
@@ -191,3 +199,1743 @@ class RideEditPermissionTest(TestCase):
         self.assertEqual(response.status_code, 400)
         ride.refresh_from_db()
         self.assertEqual(ride.destination, 'Kisii')
+
+
+class RideRouteSearchTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='searchdriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='searchpassenger', password='pass', user_type='passenger')
+        departure_time = timezone.now() + timedelta(days=1)
+        self.nairobi = Ride.objects.create(
+            departure_location='Nairobi CBD',
+            destination='Mombasa',
+            departure_time=departure_time,
+            driver=self.driver,
+            available_seats=2,
+            price=Decimal('100.00')
+        )
+        self.kisumu = Ride.objects.create(
+            departure_location='Kisumu',
+            destination='Nakuru',
+            departure_time=departure_time,
+            driver=self.driver,
+            available_seats=2,
+            price=Decimal('100.00')
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.passenger)
+
+    def _search(self, **params):
+        response = self.client.get('/api/rides/', params)
+        self.assertEqual(response.status_code, 200)
+        return [ride['id'] for ride in response.data['results']]
+
+    def test_ride_save_builds_search_terms(self):
+        self.assertEqual(self.nairobi.departure_search, 'nairobi cbd')
+        terms = set(self.nairobi.search_terms.filter(field='departure').values_list('term', flat=True))
+        self.assertIn('nai', terms)
+        self.assertIn('cbd', terms)
+
+    def test_token_prefix_search(self):
+        self.assertEqual(self._search(departure_location='nai'), [self.nairobi.id])
+        self.assertEqual(self._search(departure_location=' NAIROBI, cbd'), [self.nairobi.id])
+        self.assertEqual(self._search(destination='nak'), [self.kisumu.id])
+        self.assertEqual(self._search(departure_location='nairobi', destination='nakuru'), [])
+
+    def test_location_change_reindexes(self):
+        self.kisumu.departure_location = 'Eldoret'
+        self.kisumu.save()
+
+        self.assertEqual(self._search(departure_location='eldo'), [self.kisumu.id])
+        self.assertEqual(self._search(departure_location='kisumu'), [])
+
+
+class RidesNearMeTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='geodriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='geopassenger', password='pass', user_type='passenger')
+        departure_time = timezone.now() + timedelta(days=1)
+
+        def ride(location, latitude, longitude):
+            return Ride.objects.create(
+                departure_location=location,
+                destination='Nakuru',
+                departure_latitude=latitude,
+                departure_longitude=longitude,
+                departure_time=departure_time,
+                driver=self.driver,
+                available_seats=2,
+                price=Decimal('100.00')
+            )
+
+        self.cbd = ride('Nairobi CBD', -1.2864, 36.8172)
+        self.thika = ride('Thika', -1.0333, 37.0693)
+        self.mombasa = ride('Mombasa', -4.0435, 39.6682)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.passenger)
+
+    def test_geohash_encoding(self):
+        from rides.geo import encode
+        self.assertEqual(encode(57.64911, 10.40744), 'u4pruydqq')
+        self.assertEqual(self.cbd.departure_geohash, encode(-1.2864, 36.8172))
+
+    def test_cells_are_index_range_scans(self):
+        from rides.geo import filter_near, next_cell
+
+        self.assertEqual(next_cell('kzf'), 'kzg')
+        self.assertEqual(next_cell('kzz'), 'm')
+        self.assertIsNone(next_cell('zz'))
+        plan = filter_near(Ride.objects.all(), -1.29, 36.82, 5).explain()
+        if connection.vendor == 'sqlite':
+            self.assertIn('departure_geohash', plan)
+            self.assertIn('USING INDEX', plan)
+
+    def test_near_search_ranks_by_distance(self):
+        response = self.client.get('/api/rides/', {'lat': -1.29, 'lng': 36.82, 'radius_km': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['id'] for r in response.data['results']], [self.cbd.id])
+
+        response = self.client.get('/api/rides/', {'lat': -1.29, 'lng': 36.82, 'radius_km': 60})
+        results = response.data['results']
+        self.assertEqual([r['id'] for r in results], [self.cbd.id, self.thika.id])
+        self.assertLess(results[0]['distance_km'], results[1]['distance_km'])
+
+    def test_invalid_radius_rejected(self):
+        response = self.client.get('/api/rides/', {'lat': -1.29, 'lng': 36.82, 'radius_km': 5000})
+        self.assertEqual(response.status_code, 400)
+
+
+class RideKeysetPaginationTest(TestCase):
+    def setUp(self):
+        from rides.pagination import RideKeysetPagination
+
+        self.driver = User.objects.create_user(username='pagedriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='pagepassenger', password='pass', user_type='passenger')
+        base = timezone.now() + timedelta(days=1)
+        # Two rides share a departure time so the id tie-breaker is exercised
+        offsets = [0, 1, 1, 2, 3]
+        self.rides = [
+            Ride.objects.create(
+                departure_location='Nairobi',
+                destination='Nakuru',
+                departure_time=base + timedelta(hours=offset),
+                driver=self.driver,
+                available_seats=2,
+                price=Decimal(100 + index),
+            )
+            for index, offset in enumerate(offsets)
+        ]
+        patcher = patch.object(RideKeysetPagination, 'page_size', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.passenger)
+
+    def _walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(ride['id'] for ride in response.data['results'])
+            url = response.data['next']
+        return ids, response
+
+    def test_cursor_walk_visits_every_ride_once(self):
+        ids, _ = self._walk('/api/rides/?pagination=cursor')
+        self.assertEqual(ids, [ride.id for ride in self.rides])
+
+    def test_descending_price_ordering(self):
+        ids, _ = self._walk('/api/rides/?pagination=cursor&ordering=-price')
+        self.assertEqual(ids, [ride.id for ride in reversed(self.rides)])
+
+    def test_insert_between_pages_does_not_shift_results(self):
+        first = self.client.get('/api/rides/?pagination=cursor')
+        Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Nakuru',
+            departure_time=timezone.now() + timedelta(hours=1),
+            driver=self.driver,
+            available_seats=2,
+            price=Decimal('50.00'),
+        )
+        second = self.client.get(first.data['next'])
+        self.assertEqual(
+            [ride['id'] for ride in second.data['results']],
+            [self.rides[2].id, self.rides[3].id],
+        )
+
+    def test_previous_link_returns_prior_page(self):
+        first = self.client.get('/api/rides/?pagination=cursor')
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [ride['id'] for ride in back.data['results']],
+            [ride['id'] for ride in first.data['results']],
+        )
+        self.assertIsNone(back.data['previous'])
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RideListCacheGenerationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='cachedriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='cachepassenger', password='pass', user_type='passenger')
+        self.ride = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Mombasa',
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=2,
+            price=Decimal('100.00')
+        )
+        self.other_route = Ride(departure_location='Kisumu', destination='Nakuru')
+
+    def _key(self, query):
+        return list_cache_key('rides_list_passenger', QueryDict(query))
+
+    def test_booking_on_other_route_keeps_cached_route_lists(self):
+        route_key = self._key('departure_location=nairobi')
+        browse_key = self._key('')
+
+        invalidate_ride_lists(self.other_route)
+
+        self.assertEqual(self._key('departure_location=nairobi'), route_key)
+        self.assertNotEqual(self._key(''), browse_key)
+
+    def test_ride_change_bumps_its_route(self):
+        route_key = self._key('departure_location=nai&destination=momb')
+        invalidate_ride_lists(self.ride)
+        self.assertNotEqual(self._key('departure_location=nai&destination=momb'), route_key)
+
+    def test_seat_change_refreshes_cached_seat_counts(self):
+        client = APIClient()
+        client.force_authenticate(user=self.passenger)
+        response = client.get('/api/rides/', {'departure_location': 'Nairobi'})
+        self.assertEqual(response.data['results'][0]['available_seats'], 2)
+
+        booking = Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.reduce_seats()
+
+        response = client.get('/api/rides/', {'departure_location': 'Nairobi'})
+        self.assertEqual(response.data['results'][0]['available_seats'], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RideFragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='fragdriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='fragpassenger', password='pass', user_type='passenger')
+        self.rides = [
+            Ride.objects.create(
+                departure_location='Nairobi',
+                destination=destination,
+                departure_time=timezone.now() + timedelta(days=1, hours=index),
+                driver=self.driver,
+                available_seats=2,
+                price=Decimal('100.00')
+            )
+            for index, destination in enumerate(['Mombasa', 'Nakuru'])
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.passenger)
+
+    def test_overlapping_queries_share_ride_fragments(self):
+        first = self.client.get('/api/rides/', {'departure_location': 'nairobi'})
+        self.assertEqual(len(first.data['results']), 2)
+
+        # Only the count and the id page are read; both rides come from fragments
+        with self.assertNumQueries(2):
+            second = self.client.get('/api/rides/', {'destination': 'mombasa'})
+        self.assertEqual(second.data['results'], [first.data['results'][0]])
+
+    def test_changed_ride_gets_a_fresh_fragment(self):
+        self.client.get('/api/rides/', {'departure_location': 'nairobi'})
+
+        from rides.inventory import reserve_seats
+
+        ride = self.rides[1]
+        reserve_seats(ride.id, 1)
+        invalidate_ride_lists(ride)
+
+        response = self.client.get('/api/rides/', {'departure_location': 'nairobi'})
+        seats = {r['id']: r['available_seats'] for r in response.data['results']}
+        self.assertEqual(seats, {self.rides[0].id: 2, ride.id: 1})
+
+
+class RideReadSerializerParityTest(TestCase):
+    def setUp(self):
+        from accounts.models import Driver
+        from rides.models import RideImage
+
+        self.driver = User.objects.create_user(
+            username='paritydriver', password='pass', user_type='driver',
+            first_name='Amina', profile_picture='profile_pictures/amina.png'
+        )
+        Driver.objects.create(
+            user=self.driver, vehicle_model='Probox', vehicle_color='White',
+            vehicle_plate='KAA 001A', vehicle_picture='vehicle_pictures/probox.jpg', rating=Decimal('4.25')
+        )
+        self.plain_driver = User.objects.create_user(username='plaindriver', password='pass', user_type='driver')
+        departure_time = timezone.now() + timedelta(days=1)
+        self.with_images = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Mombasa',
+            departure_latitude=-1.2864,
+            departure_longitude=36.8172,
+            departure_time=departure_time,
+            driver=self.driver,
+            available_seats=3,
+            price=Decimal('1500.50'),
+            additional_info='AC, luggage space'
+        )
+        RideImage.objects.create(ride=self.with_images, image='ride_images/front.jpg')
+        RideImage.objects.create(ride=self.with_images, image='ride_images/back.jpg')
+        self.bare = Ride.objects.create(
+            departure_location='Kisumu',
+            destination='Nakuru',
+            departure_time=departure_time,
+            driver=self.plain_driver,
+            available_seats=0,
+            price=Decimal('800.00')
+        )
+
+    def test_output_is_byte_identical(self):
+        from rest_framework.renderers import JSONRenderer
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from rides.read_serializers import serialize_rides
+        from rides.serializers import RideListSerializer
+
+        context = {'request': Request(APIRequestFactory().get('/api/rides/'))}
+        queryset = Ride.objects.order_by('id')
+        expected = RideListSerializer(
+            queryset.select_related('driver', 'driver__driver_profile').prefetch_related('images'),
+            many=True, context=context
+        ).data
+
+        with self.assertNumQueries(3):
+            actual = serialize_rides(queryset, context)
+
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(actual), renderer.render(expected))
+
+    def test_retrieve_uses_read_path(self):
+        client = APIClient()
+        client.force_authenticate(user=self.driver)
+        response = client.get(f'/api/rides/{self.with_images.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['images']), 2)
+        self.assertEqual(response.data['driver']['driver_profile']['rating'], 4.25)
+
+        response = client.get(f'/api/rides/{self.bare.id}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class RideBookingCounterTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='counterdriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='counterpassenger', password='pass', user_type='passenger')
+        self.ride = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Nakuru',
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=4,
+            price=Decimal('500.00')
+        )
+
+    def assertCounters(self, bookings, seats):
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.booking_count, self.ride.confirmed_seat_count), (bookings, seats))
+
+    def test_counters_follow_booking_lifecycle(self):
+        booking = Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=2)
+        self.assertCounters(1, 0)
+
+        booking.status = 'confirmed'
+        booking.save()
+        self.assertCounters(1, 2)
+
+        Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=1, status='confirmed')
+        self.assertCounters(2, 3)
+
+        booking.status = 'cancelled'
+        booking.save(update_fields=['status'])
+        self.assertCounters(2, 1)
+
+        booking.delete()
+        self.assertCounters(1, 1)
+
+    def test_stale_ride_save_keeps_counters(self):
+        stale = Ride.objects.get(pk=self.ride.pk)
+        Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=1, status='confirmed')
+        stale.additional_info = 'Edited'
+        stale.save()
+        self.assertCounters(1, 1)
+
+    def test_repair_command_fixes_drift(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=2, status='confirmed')
+        Ride.objects.filter(pk=self.ride.pk).update(booking_count=7, confirmed_seat_count=0)
+        call_command('repair_ride_counters', stdout=StringIO())
+        self.assertCounters(1, 2)
+
+    def test_driver_categories_use_counters(self):
+        past_time = timezone.now() - timedelta(hours=2)
+        Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=1)
+        Ride.objects.filter(pk=self.ride.pk).update(departure_time=past_time)
+        empty = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Nakuru',
+            departure_time=past_time,
+            driver=self.driver,
+            available_seats=4,
+            price=Decimal('500.00')
+        )
+        client = APIClient()
+        client.force_authenticate(user=self.driver)
+
+        def ids(category):
+            response = client.get('/api/rides/', {'category': category})
+            self.assertEqual(response.status_code, 200)
+            return [ride['id'] for ride in response.data['results']]
+
+        self.assertEqual(ids('past'), [self.ride.id])
+        self.assertEqual(ids('expired'), [empty.id])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='etagdriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='etagpassenger', password='pass', user_type='passenger')
+        self.ride = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Kisumu',
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=3,
+            price=Decimal('900.00')
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.passenger)
+
+    def test_ride_list_revalidates(self):
+        response = self.client.get('/api/rides/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotIn('no-store', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with patch('rides.views.RideViewSet.ride_fragments') as fragments:
+            response = self.client.get('/api/rides/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        fragments.assert_not_called()
+
+        self.ride.price = Decimal('950.00')
+        self.ride.save()
+        # As every ride writer does
+        invalidate_ride_lists(self.ride)
+        response = self.client.get('/api/rides/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cached_ride_list_revalidates_without_touching_rides(self):
+        etag = self.client.get('/api/rides/')['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/rides/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries if 'rides_ride' in query['sql']])
+
+    def test_driver_profile_edit_moves_ride_etags(self):
+        driver_client = APIClient()
+        driver_client.force_authenticate(user=self.driver)
+        list_etag = self.client.get('/api/rides/')['ETag']
+        detail_etag = driver_client.get(f'/api/rides/{self.ride.id}/')['ETag']
+
+        response = driver_client.patch('/api/auth/profile/', {'first_name': 'Otieno'}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/api/rides/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['driver']['first_name'], 'Otieno')
+        response = driver_client.get(f'/api/rides/{self.ride.id}/', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_ride_retrieve_etag_and_missing_ride(self):
+        driver_client = APIClient()
+        driver_client.force_authenticate(user=self.driver)
+        response = driver_client.get(f'/api/rides/{self.ride.id}/')
+        self.assertEqual(response.status_code, 200)
+        response = driver_client.get(f'/api/rides/{self.ride.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = driver_client.get('/api/rides/999999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('no-store', response['Cache-Control'])
+
+    def test_booking_status_change_moves_etag(self):
+        booking = Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=1)
+        etag = self.client.get('/api/bookings/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'cancelled'
+            booking.save(update_fields=['status'])
+
+        response = self.client.get('/api/bookings/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['status'], 'cancelled')
+
+
+class SeatInventoryTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='inventorydriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='inventorypassenger', password='pass', user_type='passenger')
+        self.ride = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Eldoret',
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=3,
+            price=Decimal('700.00')
+        )
+
+    def test_reserve_and_release_flip_status(self):
+        from rides.inventory import reserve_seats, release_seats
+
+        self.assertTrue(reserve_seats(self.ride.id, 2))
+        self.assertFalse(reserve_seats(self.ride.id, 2))
+        self.assertTrue(reserve_seats(self.ride.id, 1))
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.status), (0, 'fully_booked'))
+
+        self.assertTrue(release_seats(self.ride.id, 2))
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.status), (2, 'available'))
+
+    def test_taking_the_last_seats_keeps_other_statuses(self):
+        from rides.inventory import reserve_seats
+
+        Ride.objects.filter(pk=self.ride.id).update(status='pending_payment')
+        self.assertTrue(reserve_seats(self.ride.id, 3))
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.status), (0, 'pending_payment'))
+
+    def test_booking_cannot_deduct_twice(self):
+        booking = Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=2)
+        stale = Booking.objects.get(pk=booking.pk)
+        booking.reduce_seats()
+        stale.reduce_seats()
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.available_seats, 1)
+
+        with self.assertRaises(ValueError):
+            Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=2).reduce_seats()
+
+        booking.cancel_booking()
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.available_seats, 3)
+
+    def test_negative_seats_are_rejected_by_the_database(self):
+        from django.db import IntegrityError, transaction
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Ride.objects.filter(pk=self.ride.pk).update(available_seats=-1)
+
+    def test_stale_full_save_keeps_the_inventory(self):
+        from rides.inventory import reserve_seats
+
+        stale = Ride.objects.get(pk=self.ride.pk)
+        reserve_seats(self.ride.id, 3)
+        stale.price = Decimal('750.00')
+        stale.save()
+        self.ride.refresh_from_db()
+        self.assertEqual(
+            (self.ride.available_seats, self.ride.status, self.ride.price), (0, 'fully_booked', Decimal('750.00'))
+        )
+
+    def test_capacity_edit_goes_through_the_inventory(self):
+        from rides.inventory import change_seats, reserve_seats
+
+        Ride.objects.filter(pk=self.ride.pk).update(status='pending_payment')
+        client = APIClient()
+        client.force_authenticate(user=self.driver)
+        with patch('rides.serializers.change_seats', wraps=change_seats) as change:
+            response = client.patch(f'/api/rides/{self.ride.id}/', {'available_seats': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['available_seats'], 5)
+        change.assert_called_once_with(self.ride.id, 2)
+
+        # A seat is taken while the driver shrinks the ride to 3: the change is applied, not the value
+        with patch('rides.serializers.change_seats', side_effect=lambda ride_id, delta: (
+            reserve_seats(ride_id, 1) and change_seats(ride_id, delta)
+        )):
+            response = client.patch(f'/api/rides/{self.ride.id}/', {'available_seats': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.available_seats, 2)
+
+        # Both free seats are taken meanwhile: there is no seat left to remove
+        with patch('rides.serializers.change_seats', side_effect=lambda ride_id, delta: (
+            reserve_seats(ride_id, 2) and change_seats(ride_id, delta)
+        )):
+            response = client.patch(f'/api/rides/{self.ride.id}/', {'available_seats': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('available_seats', response.data)
+
+    def test_admin_rejects_the_whole_edit_when_seats_are_short(self):
+        from django.forms.models import model_to_dict
+        from rides.admin import RideAdminForm
+        from rides.inventory import reserve_seats
+
+        data = {**model_to_dict(self.ride), 'price': '800.00', 'available_seats': 1}
+        form = RideAdminForm(data=data, instance=Ride.objects.get(pk=self.ride.pk))
+        # Two of the three seats are booked after the admin opened the form
+        reserve_seats(self.ride.id, 2)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(list(form.errors), ['available_seats'])
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.price), (1, Decimal('700.00')))
+
+
+class SeatHoldTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='holddriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='holdpassenger', password='pass', user_type='passenger')
+        self.ride = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Naivasha',
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=3,
+            price=Decimal('400.00')
+        )
+
+    def hold(self, seats, ttl=timedelta(minutes=15)):
+        from rides.holds import place_hold
+
+        booking = Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=seats)
+        place_hold(booking, ttl=ttl)
+        return booking
+
+    def test_hold_takes_seats_and_payment_keeps_them(self):
+        booking = self.hold(2)
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.held_seats), (1, 2))
+
+        booking.confirm_payment()
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.held_seats), (1, 0))
+        self.assertIsNone(Booking.objects.get(pk=booking.pk).hold_expires_at)
+
+    def test_sweep_releases_expired_holds_in_bulk(self):
+        from rides.holds import expire_holds
+
+        Ride.objects.filter(pk=self.ride.pk).update(available_seats=4)
+        expired = [self.hold(1, ttl=timedelta(minutes=-1)), self.hold(2, ttl=timedelta(minutes=-1))]
+        live = self.hold(1)
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.status), (0, 'fully_booked'))
+
+        self.assertEqual(expire_holds(batch_size=1), 2)
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.held_seats, self.ride.status), (3, 1, 'available'))
+        live.refresh_from_db()
+        self.assertEqual(live.status, 'pending')
+        for booking in expired:
+            booking.refresh_from_db()
+            self.assertEqual((booking.status, booking.seats_deducted), ('cancelled', False))
+        self.assertEqual(expire_holds(), 0)
+
+    def test_late_payment_retakes_released_seats(self):
+        from rides.holds import expire_holds
+
+        booking = self.hold(2, ttl=timedelta(minutes=-1))
+        expire_holds()
+        booking.confirm_payment()
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.held_seats), (1, 0))
+
+
+class RideLifecycleTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='lifecycledriver', password='pass', user_type='driver')
+
+    def ride(self, hours, **kwargs):
+        return Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Thika',
+            departure_time=timezone.now() + timedelta(hours=hours),
+            driver=self.driver,
+            price=Decimal('200.00'),
+            **{'available_seats': 2, **kwargs}
+        )
+
+    def test_departed_rides_transition_in_batches(self):
+        from rides.lifecycle import expire_departed_rides
+
+        gone = [self.ride(-3), self.ride(-2, available_seats=0), self.ride(-1)]
+        completed = self.ride(-1, status='completed')
+        upcoming = self.ride(2)
+
+        metrics = expire_departed_rides(batch_size=2)
+        self.assertEqual(metrics['transitioned'], 3)
+        self.assertEqual(metrics['by_status'], {'available': 2, 'fully_booked': 1})
+        self.assertEqual(metrics['batches'], 2)
+
+        statuses = dict(Ride.objects.values_list('id', 'status'))
+        self.assertTrue(all(statuses[ride.id] == 'departed' for ride in gone))
+        self.assertEqual(statuses[completed.id], 'completed')
+        self.assertEqual(statuses[upcoming.id], 'available')
+        self.assertEqual(expire_departed_rides()['transitioned'], 0)
+
+    def test_rescheduled_departed_ride_reopens(self):
+        ride = self.ride(-1, status='departed')
+        ride.departure_time = timezone.now() + timedelta(days=1)
+        ride.save()
+        ride.refresh_from_db()
+        self.assertEqual(ride.status, 'available')
+
+
+class MultiStopRideTest(TestCase):
+    def setUp(self):
+        from rides.stops import set_stops
+
+        self.driver = User.objects.create_user(username='stopsdriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='stopspassenger', password='pass', user_type='passenger')
+        self.ride = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Eldoret',
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=2,
+            price=Decimal('1200.00')
+        )
+        set_stops(self.ride, ['Nakuru'])
+        self.direct = Ride.objects.create(
+            departure_location='Nakuru',
+            destination='Eldoret',
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=2,
+            price=Decimal('600.00')
+        )
+
+    def segment_seats(self):
+        return list(self.ride.segments.values_list('available_seats', flat=True))
+
+    def test_sub_route_bookings_share_the_trip(self):
+        first_leg = Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=2, from_stop=0, to_stop=1)
+        first_leg.reduce_seats()
+        second_leg = Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=2, from_stop=1, to_stop=2)
+        second_leg.reduce_seats()
+        self.assertEqual(self.segment_seats(), [0, 0])
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.status), (0, 'fully_booked'))
+
+        whole = Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=1)
+        self.assertEqual((whole.from_stop, whole.to_stop), (0, 2))
+        with self.assertRaises(ValueError):
+            whole.reduce_seats()
+        self.assertEqual(self.segment_seats(), [0, 0])
+
+        first_leg.cancel_booking()
+        self.assertEqual(self.segment_seats(), [2, 0])
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.status), (0, 'fully_booked'))
+
+    def test_pickup_dropoff_search_uses_stops(self):
+        client = APIClient()
+        client.force_authenticate(user=self.passenger)
+
+        def ids(**params):
+            response = client.get('/api/rides/', params)
+            self.assertEqual(response.status_code, 200)
+            return sorted(ride['id'] for ride in response.data['results'])
+
+        self.assertEqual(ids(pickup='nakuru', dropoff='eldoret'), sorted([self.ride.id, self.direct.id]))
+        self.assertEqual(ids(pickup='nairobi', dropoff='nakuru'), [self.ride.id])
+        self.assertEqual(ids(pickup='eldoret', dropoff='nakuru'), [])
+        self.assertEqual(ids(pickup='nakuru'), sorted([self.ride.id, self.direct.id]))
+
+        # Single-leg rides are matched on the outer query, not a second scan of rides
+        from rides.stops import filter_through
+
+        sql = str(filter_through(Ride.objects.filter(status='available'), 'nakuru', 'eldoret').query)
+        self.assertEqual(sql.count('FROM "rides_ride"'), 1)
+
+    def test_stops_endpoint_lists_leg_seats(self):
+        client = APIClient()
+        client.force_authenticate(user=self.passenger)
+        response = client.get(f'/api/rides/{self.ride.id}/stops/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(stop['location'], stop['seats_to_next']) for stop in response.data],
+            [('Nairobi', 2), ('Nakuru', 2), ('Eldoret', None)]
+        )
+
+    def test_endpoints_of_a_multi_stop_ride_cannot_be_edited(self):
+        Ride.objects.filter(pk=self.ride.pk).update(status='pending_payment')
+        client = APIClient()
+        client.force_authenticate(user=self.driver)
+        response = client.patch(f'/api/rides/{self.ride.id}/', {'destination': 'Kitale'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('destination', response.data)
+
+        response = client.patch(f'/api/rides/{self.ride.id}/', {'destination': 'Eldoret'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.ride.stops.values_list('location', flat=True)), ['Nairobi', 'Nakuru', 'Eldoret'])
+
+
+class SavedSearchAlertTest(TestCase):
+    def setUp(self):
+        from rides.models import SavedSearch
+
+        self.driver = User.objects.create_user(username='alertdriver', password='pass', user_type='driver')
+        self.passengers = [
+            User.objects.create_user(username=f'alertpassenger{index}', password='pass', user_type='passenger')
+            for index in range(4)
+        ]
+        self.departure_time = timezone.now() + timedelta(days=2)
+        SavedSearch.objects.create(user=self.passengers[0], departure_location='Nairobi', destination='Mombasa')
+        SavedSearch.objects.create(user=self.passengers[1], destination='momb', max_price=Decimal('900.00'))
+        SavedSearch.objects.create(
+            user=self.passengers[2], departure_location='nai', destination='Mombasa',
+            date_to=timezone.now() + timedelta(days=1)
+        )
+        SavedSearch.objects.create(user=self.passengers[3], departure_location='Nairobi', destination='Kisumu')
+
+    def ride(self, **kwargs):
+        return Ride.objects.create(**{
+            'departure_location': 'Nairobi CBD',
+            'destination': 'Mombasa',
+            'departure_time': self.departure_time,
+            'driver': self.driver,
+            'available_seats': 3,
+            'price': Decimal('800.00'),
+            **kwargs
+        })
+
+    def notified(self):
+        from accounts.models import Notification
+
+        return set(
+            Notification.objects.filter(title="New Ride Matches Your Search").values_list('user__username', flat=True)
+        )
+
+    def test_new_ride_notifies_matching_searches_only(self):
+        from rides.alerts import notify_saved_searches
+
+        ride = self.ride()
+        # Candidate lookup, notification insert, last_notified_at update
+        with self.assertNumQueries(3):
+            self.assertEqual(notify_saved_searches(ride), 2)
+        self.assertEqual(self.notified(), {'alertpassenger0', 'alertpassenger1'})
+
+    def test_price_cap_and_intermediate_stops(self):
+        from rides.alerts import notify_saved_searches
+        from rides.stops import set_stops
+
+        ride = self.ride(departure_location='Nairobi', destination='Kisumu', price=Decimal('1500.00'))
+        set_stops(ride, ['Mombasa'])
+        notify_saved_searches(ride)
+        # Nairobi -> Mombasa is a sub-route; Kisumu also matches; the price cap excludes passenger 1
+        self.assertEqual(self.notified(), {'alertpassenger0', 'alertpassenger3'})
+
+    def test_saved_search_api_requires_a_route(self):
+        client = APIClient()
+        client.force_authenticate(user=self.passengers[0])
+        response = client.post('/api/saved-searches/', {'max_price': '500.00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = client.post('/api/saved-searches/', {'destination': 'Nakuru'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = client.get('/api/saved-searches/')
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class RideTemplateMaterializeTest(TestCase):
+    def setUp(self):
+        from datetime import time
+        from accounts.models import Driver
+        from rides.models import RideTemplate, RideTemplateImage
+
+        self.driver = User.objects.create_user(
+            username='templatedriver', password='pass', user_type='driver',
+            profile_picture='profile_pictures/driver.png'
+        )
+        Driver.objects.create(
+            user=self.driver, license_number='DL-1', vehicle_model='Probox',
+            vehicle_color='White', vehicle_plate='KAA 002A'
+        )
+        self.wallet = Wallet.objects.create(user=self.driver, balance=Decimal('100.00'))
+        self.template = RideTemplate.objects.create(
+            driver=self.driver,
+            departure_location='Kitengela',
+            destination='Nairobi CBD',
+            departure_time=time(6, 30),
+            weekdays='01234',
+            available_seats=4,
+            price=Decimal('150.00')
+        )
+        RideTemplateImage.objects.create(template=self.template, image='ride_images/commuter.jpg')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.driver)
+
+    def test_materialize_creates_rides_with_one_fee_charge(self):
+        url = f'/api/ride-templates/{self.template.id}/materialize/'
+        response = self.client.post(url, {'count': 3}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+
+        rides = Ride.objects.filter(template=self.template)
+        self.assertEqual(rides.count(), 3)
+        self.assertTrue(all(ride.departure_time.weekday() < 5 for ride in rides))
+        self.assertEqual(
+            set(rides.values_list('images__image', flat=True)), {'ride_images/commuter.jpg'}
+        )
+        # Searchable like rides posted one by one
+        self.assertEqual(
+            Ride.objects.filter(search_terms__field='destination', search_terms__term='cbd').distinct().count(), 3
+        )
+
+        fees = Transaction.objects.filter(wallet=self.wallet, transaction_type='ride_fee')
+        self.assertEqual(fees.count(), 1)
+        self.assertEqual(fees.get().amount, Decimal('-90.00'))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('10.00'))
+
+        # Occurrences that already exist are skipped
+        response = self.client.post(url, {'count': 3}, format='json')
+        self.assertEqual(response.data['created'], 0)
+
+    def test_insufficient_balance_creates_nothing(self):
+        response = self.client.post(
+            f'/api/ride-templates/{self.template.id}/materialize/', {'count': 4}, format='json'
+        )
+        self.assertEqual(response.status_code, 402)
+        self.assertFalse(Ride.objects.filter(template=self.template).exists())
+
+
+class ImageDerivativeTest(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.driver = User.objects.create_user(username='photodriver', password='pass', user_type='driver')
+        self.ride = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Naivasha',
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=3,
+            price=Decimal('600.00')
+        )
+
+    def store_photo(self, name):
+        import io
+        from PIL import Image
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+
+        photo = Image.new('RGB', (3000, 2000), 'teal')
+        exif = photo.getexif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees
+        exif[0x010F] = 'PhoneMaker'
+        buffer = io.BytesIO()
+        photo.save(buffer, 'JPEG', exif=exif)
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def test_worker_builds_stripped_derivatives_and_serializers_expose_srcset(self):
+        from PIL import Image
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from rides.images import process_pending
+        from rides.models import ImageDerivative, RideImage
+
+        RideImage.objects.create(ride=self.ride, image=self.store_photo('ride_images/a.jpg'))
+        # Same bytes uploaded again: shares the rendered files
+        RideImage.objects.create(ride=self.ride, image=self.store_photo('ride_images/b.jpg'))
+        RideImage.objects.create(
+            ride=self.ride, image=default_storage.save('ride_images/broken.jpg', ContentFile(b'not an image'))
+        )
+
+        self.assertEqual(process_pending(), (2, 1))
+        self.assertEqual(process_pending(), (0, 0))
+        self.assertTrue(ImageDerivative.objects.get(source='ride_images/broken.jpg').error)
+
+        first, second = ImageDerivative.objects.filter(error='').order_by('source')
+        self.assertEqual(first.variants, second.variants)
+        card = first.variants['card']
+        # EXIF orientation applied, longest side bounded
+        self.assertEqual((card['width'], card['height']), (320, 480))
+        with default_storage.open(card['jpeg']) as f, Image.open(f) as rendition:
+            self.assertEqual(len(rendition.getexif()), 0)
+        self.assertIn(first.content_hash, card['webp'])
+
+        client = APIClient()
+        client.force_authenticate(user=self.driver)
+        response = client.get(f'/api/rides/{self.ride.id}/')
+        srcsets = [image['srcset'] for image in response.data['images']]
+        self.assertTrue(srcsets[0]['thumb']['webp'].endswith('_thumb.webp'))
+        self.assertEqual(srcsets[0]['full']['width'], 1280 * 2 // 3)
+        self.assertIsNone(srcsets[2])
+        self.assertIsNone(response.data['driver']['profile_picture_srcset'])
+
+    def test_bookings_list_loads_derivatives_once(self):
+        from rides.models import RideImage
+
+        passenger = User.objects.create_user(
+            username='photopassenger', password='pass', user_type='passenger',
+            profile_picture='profile_pictures/passenger.png'
+        )
+        client = APIClient()
+        client.force_authenticate(user=passenger)
+
+        def book(index):
+            ride = Ride.objects.create(
+                departure_location='Nairobi', destination=f'Town {index}',
+                departure_time=timezone.now() + timedelta(days=1), driver=self.driver,
+                available_seats=3, price=Decimal('600.00')
+            )
+            RideImage.objects.create(ride=ride, image=f'ride_images/{index}a.jpg')
+            RideImage.objects.create(ride=ride, image=f'ride_images/{index}b.jpg')
+            Booking.objects.create(ride=ride, user=passenger, no_of_seats=1, status='confirmed')
+
+        book(0)
+        with CaptureQueriesContext(connection) as one:
+            self.assertEqual(client.get('/api/bookings/').status_code, 200)
+        self.assertEqual(sum('rides_imagederivative' in query['sql'] for query in one), 1)
+
+        for index in range(1, 4):
+            book(index)
+        with self.assertNumQueries(len(one)):
+            response = client.get('/api/bookings/')
+        self.assertEqual(len(response.data['results']), 4)
+
+
+class ChunkedUploadTest(TestCase):
+    def setUp(self):
+        import io
+        import shutil
+        import tempfile
+        from PIL import Image
+        from accounts.models import Driver
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, UPLOAD_SESSION_DIR=f'{media_root}/sessions')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), 'navy').save(buffer, 'JPEG')
+        self.photo = buffer.getvalue()
+
+        self.driver = User.objects.create_user(
+            username='uploaddriver', password='pass', user_type='driver',
+            profile_picture='profile_pictures/driver.png'
+        )
+        Driver.objects.create(
+            user=self.driver, license_number='DL-2', vehicle_model='Noah',
+            vehicle_color='Silver', vehicle_plate='KAB 003B'
+        )
+        Wallet.objects.create(user=self.driver, balance=Decimal('500.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.driver)
+
+    def upload(self, client=None):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        client = client or self.client
+        session = client.post('/api/uploads/', {'filename': 'car.jpg', 'size': len(self.photo)}, format='json')
+        self.assertEqual(session.status_code, 201)
+        url = f"/api/uploads/{session.data['id']}/"
+        middle = len(self.photo) // 2
+        for offset, part in ((0, self.photo[:middle]), (middle, self.photo[middle:])):
+            response = client.post(
+                f'{url}chunk/', {'offset': offset, 'chunk': SimpleUploadedFile('blob', part)}, format='multipart'
+            )
+            self.assertEqual(response.status_code, 200)
+        return client.post(f'{url}complete/')
+
+    def test_chunks_in_order_and_duplicate_content_stored_once(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from rides.models import UploadedImage
+
+        first = self.upload()
+        self.assertEqual(first.status_code, 201)
+        self.assertFalse(first.data['deduplicated'])
+        again = self.upload()
+        self.assertTrue(again.data['deduplicated'])
+        self.assertEqual(again.data['image_id'], first.data['image_id'])
+
+        passenger = User.objects.create_user(username='uploadpassenger', password='pass', user_type='driver')
+        client = APIClient()
+        client.force_authenticate(user=passenger)
+        theirs = self.upload(client)
+        # Same content from another user: own row, shared stored file
+        self.assertNotEqual(theirs.data['image_id'], first.data['image_id'])
+        self.assertEqual(UploadedImage.objects.values('image').distinct().count(), 1)
+
+        session = self.client.post('/api/uploads/', {'filename': 'car.jpg', 'size': 10}, format='json')
+        response = self.client.post(
+            f"/api/uploads/{session.data['id']}/chunk/",
+            {'offset': 4, 'chunk': SimpleUploadedFile('blob', b'1234')}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['received'], 0)
+
+    def test_ride_is_posted_with_image_ids(self):
+        image_id = self.upload().data['image_id']
+        ride_data = {
+            'departure_location': 'Thika',
+            'destination': 'Nairobi',
+            'departure_time': (timezone.now() + timedelta(days=1)).isoformat(),
+            'available_seats': 3,
+            'price': '200.00',
+            'payment_method': 'wallet',
+        }
+        response = self.client.post('/api/rides/', {**ride_data, 'image_ids': [image_id]}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        ride = Ride.objects.get(id=response.data['id'])
+        from rides.models import UploadedImage
+        self.assertEqual(
+            list(ride.images.values_list('image', flat=True)), [UploadedImage.objects.get(id=image_id).image.name]
+        )
+
+        other = User.objects.create_user(username='otheruploader', password='pass', user_type='driver')
+        client = APIClient()
+        client.force_authenticate(user=other)
+        foreign_id = self.upload(client).data['image_id']
+        response = self.client.post('/api/rides/', {**ride_data, 'image_ids': [foreign_id]}, format='json')
+        self.assertNotEqual(response.status_code, 201)
+        self.assertEqual(Ride.objects.filter(driver=self.driver).count(), 1)
+
+
+class WaitlistTest(TestCase):
+    def setUp(self):
+        from rides.holds import place_hold
+
+        self.driver = User.objects.create_user(username='waitdriver', password='pass', user_type='driver')
+        self.ride = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Eldoret',
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=2,
+            price=Decimal('1200.00')
+        )
+        self.booker = User.objects.create_user(username='booker', password='pass', user_type='passenger')
+        self.booking = Booking.objects.create(ride=self.ride, user=self.booker, no_of_seats=2, status='pending')
+        place_hold(self.booking)
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.status, 'fully_booked')
+
+        self.waiting = []
+        for name, seats in (('first', 1), ('second', 2), ('third', 1)):
+            user = User.objects.create_user(username=name, password='pass', user_type='passenger')
+            client = APIClient()
+            client.force_authenticate(user=user)
+            response = client.post(f'/api/rides/{self.ride.id}/waitlist/', {'no_of_seats': seats}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.waiting.append((user, client, response.data))
+
+    def test_queue_positions_and_rejoin(self):
+        self.assertEqual([data['position'] for _, _, data in self.waiting], [1, 2, 3])
+        user, client, data = self.waiting[0]
+        response = client.post(f'/api/rides/{self.ride.id}/waitlist/', {'no_of_seats': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], data['id'])
+
+    def test_cancellation_promotes_head_in_fifo_order(self):
+        from accounts.models import Notification
+
+        self.booking.cancel_booking()
+
+        first, second, third = (user for user, _, _ in self.waiting)
+        promoted = Booking.objects.filter(ride=self.ride, status='pending')
+        # 2 seats freed: the head takes 1, the next needs 2 and does not fit, so the third keeps waiting
+        self.assertEqual(list(promoted.values_list('user', flat=True)), [first.id])
+        self.assertIsNotNone(promoted.get().hold_expires_at)
+        self.assertTrue(Notification.objects.filter(user=first, title="A Seat Opened Up").exists())
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.available_seats, 1)
+        self.assertEqual(self.ride.held_seats, 1)
+
+        # The promoted passenger lets the hold lapse: the seat passes down the queue
+        from rides.holds import expire_holds
+        expire_holds(now=timezone.now() + timedelta(days=1, minutes=-1))
+        self.assertEqual(
+            list(Booking.objects.filter(ride=self.ride, status='pending').values_list('user', flat=True)),
+            [second.id]
+        )
+        self.assertTrue(self.ride.waitlist.filter(user=third, status='waiting').exists())
+
+    def test_leave_waitlist(self):
+        user, client, _ = self.waiting[0]
+        self.assertEqual(client.delete(f'/api/rides/{self.ride.id}/waitlist/').status_code, 204)
+        self.booking.cancel_booking()
+        self.assertFalse(Booking.objects.filter(ride=self.ride, user=user).exists())
+
+
+class RideCompletionTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='completedriver', password='pass', user_type='driver')
+        self.passengers = [
+            User.objects.create_user(username=f'rider{i}', password='pass', user_type='passenger') for i in range(3)
+        ]
+        self.rides = []
+        for days in (-2, -1, 1):
+            ride = Ride.objects.create(
+                departure_location='Nairobi',
+                destination='Nyeri',
+                departure_time=timezone.now() + timedelta(days=days),
+                driver=self.driver,
+                available_seats=4,
+                price=Decimal('700.00')
+            )
+            for passenger in self.passengers[:2]:
+                Booking.objects.create(ride=ride, user=passenger, no_of_seats=1, status='confirmed')
+            Booking.objects.create(ride=ride, user=self.passengers[2], no_of_seats=1, status='pending')
+            self.rides.append(ride)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.driver)
+
+    def test_complete_notifies_confirmed_passengers_in_bulk(self):
+        from accounts.models import Notification
+
+        ride = self.rides[0]
+        with self.assertNumQueries(9):
+            # get_object (ride + images), lock, snapshot, 2 UPDATEs, 1 bulk INSERT and the savepoint pair
+            response = self.client.post(f'/api/rides/{ride.id}/complete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['bookings_completed'], 2)
+        self.assertEqual(ride.bookings.filter(status='completed').count(), 2)
+        self.assertEqual(ride.bookings.filter(status='pending').count(), 1)
+        self.assertEqual(
+            set(Notification.objects.filter(title="Ride Completed").values_list('user', flat=True)),
+            {self.passengers[0].id, self.passengers[1].id}
+        )
+
+    def test_complete_past_covers_only_departed_rides(self):
+        response = self.client.post('/api/rides/complete-past/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['rides_completed'], response.data['bookings_completed']), (2, 4))
+        self.assertEqual(
+            list(Ride.objects.filter(driver=self.driver).order_by('departure_time').values_list('status', flat=True)),
+            ['completed', 'completed', 'available']
+        )
+        self.rides[2].refresh_from_db()
+        self.assertEqual(self.rides[2].confirmed_seat_count, 2)
+
+    def test_complete_past_rejects_impossible_dates(self):
+        for before in ('soon', '2026-02-30T10:00:00'):
+            response = self.client.post('/api/rides/complete-past/', {'before': before})
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Ride.objects.filter(status='completed').exists())
+
+
+class RouteDemandTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='demanddriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='demandpassenger', password='pass', user_type='passenger')
+        departure = timezone.localtime(timezone.now() + timedelta(days=2)).replace(hour=7, minute=30)
+        self.ride = Ride.objects.create(
+            departure_location='Nairobi CBD',
+            destination='Mombasa',
+            departure_time=departure,
+            driver=self.driver,
+            available_seats=5,
+            price=Decimal('1500.00')
+        )
+        self.hour_of_week = departure.weekday() * 24 + 7
+
+    def demand(self):
+        from rides.models import RouteDemand
+        return RouteDemand.objects.get(departure='nairobi cbd', destination='mombasa', hour_of_week=self.hour_of_week)
+
+    def test_bookings_update_rollup_incrementally(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=2, status='confirmed')
+        with self.captureOnCommitCallbacks(execute=True):
+            pending = Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=1, status='pending')
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.status = 'confirmed'
+            pending.save(update_fields=['status'])
+
+        demand = self.demand()
+        self.assertEqual((demand.bookings, demand.seats_sold), (2, 3))
+        self.assertEqual(demand.average_price, Decimal('1500.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.status = 'cancelled'
+            pending.save(update_fields=['status'])
+        demand.refresh_from_db()
+        self.assertEqual((demand.bookings, demand.seats_sold), (1, 2))
+
+        # A rebuild from the bookings agrees with the incremental rollup
+        from rides.demand import rebuild_booking_demand
+        rebuild_booking_demand()
+        demand.refresh_from_db()
+        self.assertEqual((demand.bookings, demand.seats_sold, demand.price_total), (1, 2, Decimal('3000.00')))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_searches_are_counted_and_rolled_up(self):
+        from rides.demand import roll_up_searches
+
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(user=self.passenger)
+        params = {
+            'departure_location': 'Nairobi CBD',
+            'destination': 'MOMBASA',
+            'date_after': timezone.localtime(self.ride.departure_time).replace(minute=0).isoformat(),
+        }
+        for _ in range(3):
+            client.get('/api/rides/', params)
+        client.get('/api/rides/', {'departure_location': 'Nairobi'})
+        # The current bucket is still open
+        self.assertEqual(roll_up_searches(), 0)
+        later = timezone.now() + timedelta(minutes=15)
+        self.assertEqual(roll_up_searches(now=later), 3)
+        self.assertEqual(roll_up_searches(now=later), 0)
+        self.assertEqual(self.demand().searches, 3)
+
+        driver_client = APIClient()
+        driver_client.force_authenticate(user=self.driver)
+        response = driver_client.get('/api/route-demand/', {'departure': 'nairobi', 'weekday': self.hour_of_week // 24})
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual([(row['destination'], row['hour'], row['searches']) for row in rows], [('mombasa', 7, 3)])
+        self.assertEqual(client.get('/api/route-demand/').status_code, 403)
+
+
+class LocationAutocompleteTest(TestCase):
+    def setUp(self):
+        from rides.autocomplete import location_index
+
+        self.index = location_index
+        self.index.built_at = None
+        self.driver = User.objects.create_user(username='autodriver', password='pass', user_type='driver')
+        for departure, destination in (
+            ('Nairobi CBD', 'Mombasa'), ('nairobi cbd', 'Nakuru'), ('Nairobi CBD', 'Mombasa'), ('Naivasha', 'Nakuru'),
+        ):
+            self.create_ride(departure, destination)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.driver)
+
+    def create_ride(self, departure, destination):
+        return Ride.objects.create(
+            departure_location=departure,
+            destination=destination,
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=3,
+            price=Decimal('500.00')
+        )
+
+    def test_suggestions_by_word_prefix_weighted_by_rides(self):
+        response = self.client.get('/api/rides/autocomplete/', {'q': 'Na'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['location'], row['rides']) for row in response.data],
+            [('Nairobi CBD', 3), ('Nakuru', 2), ('Naivasha', 1)]
+        )
+        response = self.client.get('/api/rides/autocomplete/', {'q': 'cb'})
+        self.assertEqual([row['location'] for row in response.data], ['Nairobi CBD'])
+
+        # Built once; keystrokes afterwards never query the database
+        with self.assertNumQueries(0):
+            self.index.suggest('mom')
+
+    def test_new_rides_are_added_on_commit(self):
+        self.index.suggest('x')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_ride('Kisumu', 'Kitale')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.suggest('ki'), [('Kisumu', 1), ('Kitale', 1)])
+
+        # Rides written by another process arrive with the next sync
+        Ride.objects.bulk_create([Ride(
+            departure_location='Kisii', destination='Kericho', departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver, available_seats=2, price=Decimal('400.00')
+        )])
+        self.index.synced_at -= 60
+        self.assertEqual([location for location, _ in self.index.suggest('ki')], ['Kisii', 'Kisumu', 'Kitale'])
+        self.assertEqual(self.index.suggest('kisumu'), [('Kisumu', 1)])
+
+
+class PlaceGazetteerTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='placedriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='placepassenger', password='pass', user_type='passenger')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.passenger)
+
+    def create_ride(self, departure, destination='Mombasa'):
+        return Ride.objects.create(
+            departure_location=departure,
+            destination=destination,
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=3,
+            price=Decimal('500.00')
+        )
+
+    def _search(self, **params):
+        response = self.client.get('/api/rides/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(ride['id'] for ride in response.data['results'])
+
+    def test_spellings_resolve_to_one_place_and_merge(self):
+        from rides.gazetteer import merge_places
+        from rides.models import Place
+
+        plain = self.create_ride('Nairobi')
+        shouted = self.create_ride(' NAIROBI, ')
+        short = self.create_ride('NRB')
+        self.assertIsNotNone(plain.departure_place_id)
+        self.assertEqual(shouted.departure_place_id, plain.departure_place_id)
+        self.assertNotEqual(short.departure_place_id, plain.departure_place_id)
+        self.assertEqual(plain.destination_place_id, short.destination_place_id)
+
+        nairobi = Place.objects.get(id=plain.departure_place_id)
+        self.assertEqual(nairobi.name, 'Nairobi')
+        self.assertEqual(merge_places(nairobi, [Place.objects.get(id=short.departure_place_id)]), 1)
+        self.assertEqual(self._search(departure_place=nairobi.id), [plain.id, shouted.id, short.id])
+
+        # New rides spelled "NRB" now land on Nairobi, and the text resolves to it
+        self.assertEqual(self.create_ride('nrb').departure_place_id, nairobi.id)
+        response = self.client.get('/api/places/', {'q': 'NRB'})
+        self.assertEqual([(place['id'], place['aliases']) for place in response.data['results']], [(nairobi.id, ['nairobi', 'nrb'])])
+
+    def test_location_change_moves_place(self):
+        ride = self.create_ride('Kisumu')
+        ride.departure_location = 'Eldoret'
+        ride.save(update_fields=['departure_location'])
+        ride.refresh_from_db()
+        self.assertEqual(self._search(departure_place=ride.departure_place_id), [ride.id])
+        self.assertEqual(ride.departure_place.name, 'Eldoret')
+
+    def test_backfill_command_canonicalizes_in_batches(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        existing = self.create_ride('Nakuru')
+        Ride.objects.bulk_create([
+            Ride(
+                departure_location=departure, destination='Mombasa', departure_time=timezone.now() + timedelta(days=1),
+                driver=self.driver, available_seats=3, price=Decimal('500.00')
+            )
+            for departure in ('nakuru', 'Naivasha', 'NAKURU ')
+        ])
+        call_command('canonicalize_ride_places', batch_size=2, stdout=StringIO())
+
+        places = dict(Ride.objects.values_list('departure_location', 'departure_place_id'))
+        self.assertEqual(places['nakuru'], existing.departure_place_id)
+        self.assertEqual(places['NAKURU '], existing.departure_place_id)
+        self.assertNotEqual(places['Naivasha'], existing.departure_place_id)
+        self.assertFalse(Ride.objects.filter(destination_place__isnull=True).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RouteCalendarTest(TestCase):
+    def setUp(self):
+        from datetime import datetime, time
+
+        cache.clear()
+        self.driver = User.objects.create_user(username='calendardriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='calendarpassenger', password='pass', user_type='passenger')
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+        noon = timezone.make_aware(datetime.combine(self.tomorrow, time(12)))
+        self.first = self.create_ride('Nakuru', noon, 3, '500.00')
+        self.create_ride('Nakuru', noon + timedelta(hours=2), 2, '450.00')
+        self.create_ride('Nakuru', noon + timedelta(days=2), 4, '600.00')
+        self.create_ride('Kisumu', noon, 4, '300.00')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.passenger)
+
+    def create_ride(self, destination, departure_time, seats, price):
+        return Ride.objects.create(
+            departure_location='Nairobi',
+            destination=destination,
+            departure_time=departure_time,
+            driver=self.driver,
+            available_seats=seats,
+            price=Decimal(price)
+        )
+
+    def _calendar(self, **params):
+        response = self.client.get('/api/rides/calendar/', {
+            'date_from': self.tomorrow.isoformat(),
+            'date_to': (self.tomorrow + timedelta(days=2)).isoformat(),
+            **params
+        })
+        self.assertEqual(response.status_code, 200)
+        return [(day['rides'], day['seats'], day['min_price']) for day in response.data['days']]
+
+    def test_per_day_counts_for_a_route(self):
+        self.assertEqual(self._calendar(destination='nakuru'), [(2, 5, '450.00'), (0, 0, None), (1, 4, '600.00')])
+        self.assertEqual(
+            self._calendar(destination_place=self.first.destination_place_id, min_seats=3),
+            [(1, 3, '500.00'), (0, 0, None), (1, 4, '600.00')]
+        )
+        self.assertEqual(self.client.get('/api/rides/calendar/').status_code, 400)
+        self.assertEqual(self.client.get('/api/rides/calendar/', {'destination': 'nakuru', 'date_to': 'soon'}).status_code, 400)
+
+    def test_cached_until_a_ride_on_the_route_changes(self):
+        self._calendar(destination='nakuru')
+        with self.assertNumQueries(0):
+            self._calendar(destination='nakuru')
+
+        self.first.available_seats = 0
+        self.first.save()
+        invalidate_ride_lists(self.first)
+        self.assertEqual(self._calendar(destination='nakuru')[0], (1, 2, '450.00'))
+
+
+class RideBatchLookupTest(TestCase):
+    def setUp(self):
+        self.driver = User.objects.create_user(username='batchdriver', password='pass', user_type='driver')
+        self.other = User.objects.create_user(username='batchother', password='pass', user_type='driver')
+        self.rides = [self.create_ride(self.driver, destination) for destination in ('Nakuru', 'Kisumu')]
+        self.foreign = self.create_ride(self.other, 'Eldoret')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.driver)
+
+    def create_ride(self, driver, destination):
+        from rides.models import RideImage
+
+        ride = Ride.objects.create(
+            departure_location='Nairobi',
+            destination=destination,
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=driver,
+            available_seats=3,
+            price=Decimal('500.00')
+        )
+        RideImage.objects.create(ride=ride, image='ride_images/batch.jpg')
+        return ride
+
+    def test_batch_matches_retrieve(self):
+        first, second = self.rides
+        ids = f"{second.id},{first.id},{self.foreign.id},{second.id},999999"
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/rides/batch/', {'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([ride['id'] for ride in response.data['results']], [second.id, first.id])
+        # Rides retrieve would 404 on are missing, not leaked
+        self.assertEqual(response.data['missing'], [self.foreign.id, 999999])
+        self.assertEqual(response.data['results'][1], self.client.get(f'/api/rides/{first.id}/').data)
+        self.assertEqual(self.client.get(f'/api/rides/{self.foreign.id}/').status_code, 404)
+
+    def test_rejects_bad_ids(self):
+        self.assertEqual(self.client.get('/api/rides/batch/', {'ids': '1,two'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/rides/batch/').status_code, 400)
+        too_many = ','.join(str(ride_id) for ride_id in range(1, 102))
+        self.assertEqual(self.client.get('/api/rides/batch/', {'ids': too_many}).status_code, 400)
+
+
+SEAT_COUNTER_REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1')
+
+
+def redis_reachable(url):
+    import redis
+
+    try:
+        return redis.Redis.from_url(url, socket_connect_timeout=0.2).ping()
+    except redis.exceptions.RedisError:
+        return False
+
+
+def redis_caches(url):
+    return {'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': url,
+        'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient', 'IGNORE_EXCEPTIONS': True},
+    }}
+
+
+class SeatCounterTestMixin:
+    def setUp(self):
+        self.driver = User.objects.create_user(username='counterdriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='counterpassenger', password='pass', user_type='passenger')
+        self.ride = Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Mombasa',
+            departure_time=timezone.now() + timedelta(days=1),
+            driver=self.driver,
+            available_seats=3,
+            price=Decimal('1500.00')
+        )
+
+    def book(self, seats):
+        booking = Booking.objects.create(ride=self.ride, user=self.passenger, no_of_seats=seats)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.reduce_seats()
+        return booking
+
+
+@override_settings(SEAT_COUNTER_BACKEND='redis', CACHES=redis_caches('redis://127.0.0.1:1/0'))
+class SeatCounterFallbackTest(SeatCounterTestMixin, TestCase):
+    def test_unreachable_redis_falls_back_to_the_row(self):
+        from rides import seat_counter
+
+        self.assertIsNone(seat_counter.take(self.ride.id, 1))
+        self.book(2)
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.available_seats, 1)
+        with self.assertRaises(ValueError):
+            self.book(2)
+
+
+@skipUnless(redis_reachable(SEAT_COUNTER_REDIS_URL), "needs a Redis server at REDIS_URL")
+@override_settings(SEAT_COUNTER_BACKEND='redis', CACHES=redis_caches(SEAT_COUNTER_REDIS_URL))
+class LiveSeatCounterTest(SeatCounterTestMixin, TestCase):
+    def setUp(self):
+        from django_redis import get_redis_connection
+
+        super().setUp()
+        self.redis = get_redis_connection('default')
+        self.keys = [f'ride_seats:{self.ride.id}', f'ride_seat_leases:{self.ride.id}']
+        self.redis.delete(*self.keys)
+        self.addCleanup(self.redis.delete, *self.keys)
+
+    def test_short_rides_are_rejected_from_the_counter(self):
+        from rides import seat_counter
+
+        self.book(2)
+        self.assertEqual(seat_counter.peek(self.ride.id), 1)
+        self.assertEqual(self.redis.zcard(self.keys[1]), 0)
+
+        client = APIClient()
+        client.force_authenticate(user=self.passenger)
+        # Only get_object()'s lookup (the ride and its prefetched images); no seat row is written or locked
+        with self.assertNumQueries(2):
+            response = client.post(f'/api/rides/{self.ride.id}/book/', {'payment_method': 'mpesa', 'no_of_seats': 2})
+        self.assertEqual(response.status_code, 400)
+
+        self.book(1)
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.available_seats, self.ride.status), (0, 'fully_booked'))
+        self.assertEqual(seat_counter.peek(self.ride.id), 0)
+        # A ride the passenger can no longer see does not reveal its counter
+        response = client.post(f'/api/rides/{self.ride.id}/book/', {'payment_method': 'mpesa'})
+        self.assertEqual(response.status_code, 404)
+
+        # A cancellation reloads the counter from the row
+        booking = Booking.objects.filter(ride=self.ride, no_of_seats=1).get()
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.restore_seats()
+        self.assertIsNone(seat_counter.peek(self.ride.id))
+        self.book(1)
+        self.assertEqual(seat_counter.peek(self.ride.id), 0)
+
+    def test_reconcile_returns_rolled_back_leases_and_fixes_drift(self):
+        import time
+        from rides import seat_counter
+
+        # A booking transaction that took seats and then rolled back leaves its lease behind
+        self.assertTrue(seat_counter.take(self.ride.id, 2))
+        self.assertEqual(seat_counter.peek(self.ride.id), 1)
+        result = seat_counter.reconcile([self.ride.id], now=time.time() + seat_counter.LEASE_SECONDS + 1)
+        self.assertEqual((result['returned'], result['drifted']), (2, 0))
+        self.assertEqual(seat_counter.peek(self.ride.id), 3)
+
+        Ride.objects.filter(pk=self.ride.pk).update(available_seats=1)
+        self.assertEqual(seat_counter.reconcile([self.ride.id])['drifted'], 1)
+        self.assertEqual(seat_counter.peek(self.ride.id), 1)
+
+    def test_failed_wallet_booking_leaves_the_counter_alone(self):
+        from rides import seat_counter
+
+        self.book(1)
+        self.assertEqual(seat_counter.peek(self.ride.id), 2)
+        Wallet.objects.create(user=self.passenger, balance=Decimal('10.00'))
+        client = APIClient()
+        client.force_authenticate(user=self.passenger)
+        response = client.post(f'/api/rides/{self.ride.id}/book/', {'payment_method': 'wallet', 'no_of_seats': 2})
+        self.assertIn('Insufficient wallet balance', response.data['error'])
+        self.assertEqual(seat_counter.peek(self.ride.id), 2)
+        self.assertEqual(self.redis.zcard(self.keys[1]), 0)
+
+        # Any failure after the seats were taken cancels the lease too
+        Wallet.objects.filter(user=self.passenger).update(balance=Decimal('10000.00'))
+        with patch('rides.utils.send_booking_confirmation_email', side_effect=RuntimeError("mail down")):
+            response = client.post(f'/api/rides/{self.ride.id}/book/', {'payment_method': 'wallet', 'no_of_seats': 2})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(seat_counter.peek(self.ride.id), 2)
+        self.assertEqual(self.redis.zcard(self.keys[1]), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DriverDashboardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver = User.objects.create_user(username='dashdriver', password='pass', user_type='driver')
+        self.passenger = User.objects.create_user(username='dashpassenger', password='pass', user_type='passenger')
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.next_ride = self.create_ride(now + timedelta(days=1))
+            self.later_ride = self.create_ride(now + timedelta(days=3))
+            past = self.create_ride(now - timedelta(days=1))
+            self.create_ride(now - timedelta(days=2))
+            completed = self.create_ride(now - timedelta(days=5), status='completed')
+            Booking.objects.create(ride=self.next_ride, user=self.passenger, no_of_seats=2, status='confirmed')
+            Booking.objects.create(ride=self.later_ride, user=self.passenger, no_of_seats=1, status='pending')
+            Booking.objects.create(ride=past, user=self.passenger, no_of_seats=1, status='confirmed')
+            Booking.objects.create(ride=completed, user=self.passenger, no_of_seats=3, status='completed')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.driver)
+
+    def create_ride(self, departure_time, status='available'):
+        return Ride.objects.create(
+            departure_location='Nairobi',
+            destination='Nakuru',
+            departure_time=departure_time,
+            driver=self.driver,
+            available_seats=4,
+            price=Decimal('500.00'),
+            status=status
+        )
+
+    def test_summary_in_three_queries_and_cached(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/rides/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['categories'], {'active': 2, 'completed': 1, 'past': 1, 'expired': 1})
+        self.assertEqual(response.data['total_rides'], 5)
+        self.assertEqual([ride['id'] for ride in response.data['upcoming']], [self.next_ride.id, self.later_ride.id])
+        self.assertEqual((response.data['pending_requests'], response.data['pending_seats']), (1, 1))
+        self.assertEqual((response.data['seats_sold'], response.data['earnings']), (6, '3000.00'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/rides/dashboard/').data, response.data)
+
+        # A booking on one of the driver's rides moves the driver's version
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(ride=self.later_ride, user=self.passenger, no_of_seats=2, status='confirmed')
+        response = self.client.get('/api/rides/dashboard/')
+        self.assertEqual((response.data['seats_sold'], response.data['earnings']), (8, '4000.00'))
+
+    def test_passengers_have_no_dashboard(self):
+        self.client.force_authenticate(user=self.passenger)
+        self.assertEqual(self.client.get('/api/rides/dashboard/').status_code, 403)
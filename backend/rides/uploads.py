@@ -0,0 +1,156 @@
+# rides/uploads.py
+"""
+Chunked, deduplicated image uploads.
+
+Ride images used to arrive in the ride-creation request itself. They were
+parsed into memory and written to storage while RideViewSet.create held the
+driver's wallet row lock. Now the client uploads them first:
+
+    POST /api/uploads/                 {"filename", "size"}        -> {"id", ...}
+    POST /api/uploads/<id>/chunk/      multipart `chunk` + `offset` -> {"received", ...}
+    POST /api/uploads/<id>/complete/                                -> {"image_id", ...}
+
+It then posts the ride with `image_ids`, which only creates RideImage rows
+pointing at files that are already stored.
+
+Each chunk is appended to a part file under settings.UPLOAD_SESSION_DIR.
+Completing hashes that file in blocks. If an upload with the same SHA-256
+exists, its stored file is reused, so a driver's repeated vehicle photo is
+stored once; otherwise the part file is streamed to media storage.
+"""
+import hashlib
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.validators import get_available_image_extensions
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import UploadedImage, UploadSession
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_SIZE = 15 * 1024 * 1024
+SESSION_TTL = timedelta(hours=6)
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def part_path(session):
+    return os.path.join(settings.UPLOAD_SESSION_DIR, f"{session.id}.part")
+
+
+def start_session(owner, filename, size):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension not in get_available_image_extensions():
+        raise UploadError("Only image files can be uploaded.")
+    if not 0 < size <= MAX_UPLOAD_SIZE:
+        raise UploadError(f"Size must be between 1 and {MAX_UPLOAD_SIZE} bytes.")
+
+    os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+    session = UploadSession.objects.create(
+        owner=owner,
+        filename=os.path.basename(filename)[-255:],
+        size=size,
+        expires_at=timezone.now() + SESSION_TTL
+    )
+    open(part_path(session), 'wb').close()
+    return session
+
+
+def _locked_session(session_id, owner):
+    session = (
+        UploadSession.objects.select_for_update()
+        .filter(id=session_id, owner=owner, expires_at__gt=timezone.now())
+        .first()
+    )
+    if session is None:
+        raise UploadError("Upload session not found or expired.", status=404)
+    return session
+
+
+def append_chunk(session_id, owner, offset, chunk):
+    """
+    Write `chunk` (an UploadedFile) at `offset`. Chunks must arrive in order;
+    a mismatched offset raises UploadError(409) carrying the offset to resume from.
+    """
+    with db_transaction.atomic():
+        # The row lock keeps two chunks of one session from interleaving
+        session = _locked_session(session_id, owner)
+        if offset != session.received:
+            raise UploadError(
+                f"Expected the chunk at offset {session.received}.", status=409, received=session.received
+            )
+        if offset + chunk.size > session.size:
+            raise UploadError("Chunk runs past the declared size.")
+
+        with open(part_path(session), 'r+b') as part:
+            part.seek(offset)
+            for block in chunk.chunks():
+                part.write(block)
+            part.truncate()
+        session.received = offset + chunk.size
+        session.save(update_fields=['received'])
+    return session
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_session(session_id, owner):
+    """Turn a fully received session into an UploadedImage. Returns (uploaded image, deduplicated)."""
+    with db_transaction.atomic():
+        session = _locked_session(session_id, owner)
+        if session.received != session.size:
+            raise UploadError(f"Upload incomplete: {session.received} of {session.size} bytes received.")
+
+        path = part_path(session)
+        sha256 = file_sha256(path)
+        uploaded = UploadedImage.objects.filter(owner=owner, sha256=sha256).first()
+        deduplicated = uploaded is not None
+        if uploaded is None:
+            stored = UploadedImage.objects.filter(sha256=sha256).values_list('image', flat=True).first()
+            deduplicated = stored is not None
+            if stored is None:
+                try:
+                    with Image.open(path) as image:
+                        image.verify()
+                except Exception:
+                    raise UploadError("The uploaded file is not a valid image.")
+                extension = os.path.splitext(session.filename)[1].lower()
+                with open(path, 'rb') as f:
+                    stored = default_storage.save(f"ride_images/{sha256}{extension}", File(f))
+            uploaded = UploadedImage.objects.create(owner=owner, sha256=sha256, image=stored, size=session.size)
+
+        session.delete()
+    os.remove(path)
+    return uploaded, deduplicated
+
+
+def purge_expired_sessions(now=None):
+    """Delete abandoned sessions and their part files. Returns the number purged."""
+    expired = list(UploadSession.objects.filter(expires_at__lte=now or timezone.now()))
+    for session in expired:
+        try:
+            os.remove(part_path(session))
+        except FileNotFoundError:
+            pass
+    UploadSession.objects.filter(id__in=[session.id for session in expired]).delete()
+    logger.info(f"Purged {len(expired)} expired upload session(s).")
+    return len(expired)
@@ -7,6 +7,11 @@ router = DefaultRouter()
 router.register(r'rides', views.RideViewSet, basename='ride')
 router.register(r'bookings', views.BookingViewSet, basename='booking')
 router.register(r'reviews', views.ReviewViewSet, basename='review')
+router.register(r'ride-templates', views.RideTemplateViewSet, basename='ride-template')
+router.register(r'saved-searches', views.SavedSearchViewSet, basename='saved-search')
+router.register(r'uploads', views.UploadSessionViewSet, basename='upload')
+router.register(r'route-demand', views.RouteDemandViewSet, basename='route-demand')
+router.register(r'places', views.PlaceViewSet, basename='place')
 # router.register(r'payments', views.PaymentViewSet, basename='payment')
 
 urlpatterns = [
@@ -9,18 +9,46 @@ from django_filters.rest_framework import OrderingFilter
 from django_filters import rest_framework as django_filters
 from django.db.models import Q
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.http import QueryDict
+from django.http import Http404
 from django.db import transaction as db_transaction
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page, never_cache
 from django.utils.cache import patch_vary_headers
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from django.core.cache import cache
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
 
 from .serializers import (
     RideListSerializer, RideDetailSerializer,
-    BookingSerializer, ReviewSerializer
+    BookingSerializer, ReviewSerializer, SavedSearchSerializer, RideTemplateSerializer,
+    UploadSessionSerializer, UploadedImageSerializer, RouteDemandSerializer, PlaceSerializer
+)
+from .models import Ride, Booking, Review, SavedSearch, RideTemplate, UploadSession, RouteDemand, Place
+from .recurring import MAX_OCCURRENCES, InsufficientBalance, materialize
+from .uploads import UploadError, append_chunk, complete_session, start_session
+from .alerts import notify_saved_searches
+from .search import filter_by_location, normalize_location
+from .stops import filter_through, seats_between, stop_range
+from .geo import filter_near, MAX_RADIUS_KM
+from .pagination import RideKeysetPagination
+from .read_serializers import serialize_rides
+from .holds import place_hold
+from . import seat_counter
+from .completion import complete_rides, past_rides
+from .dashboard import cached_driver_summary
+from .demand import log_search
+from .gazetteer import find_place
+from .autocomplete import DEFAULT_LIMIT, MAX_LIMIT, location_index
+from .availability import DEFAULT_CALENDAR_DAYS, MAX_CALENDAR_DAYS, route_calendar
+from .waitlist import WAITLIST_STATUSES, join_waitlist, leave_waitlist, queue_position
+from .conditional import ConditionalGetMixin, revalidate_or_never_cache
+from .cache import (
+    LIST_CACHE_TIMEOUT, FRAGMENT_CACHE_TIMEOUT, invalidate_ride_lists, bump_generations, bump_user_versions,
+    ride_scopes, list_cache_key, fragment_key, fragment_stamp
 )
-from .models import Ride, Booking, Review
 from payments.models import Wallet, Transaction
 from payments.mpesa import lipa_na_mpesa
 from accounts.models import Notification, Driver
@@ -28,21 +56,40 @@ from accounts.models import Notification, Driver
 
 
 class RideFilter(django_filters.FilterSet):
-    departure_location = django_filters.CharFilter(lookup_expr='icontains')
-    destination = django_filters.CharFilter(lookup_expr='icontains')
+    departure_location = django_filters.CharFilter(method='filter_location')
+    destination = django_filters.CharFilter(method='filter_location')
     min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
     min_seats = django_filters.NumberFilter(field_name='available_seats', lookup_expr='gte')
     date_after = django_filters.DateTimeFilter(field_name='departure_time', lookup_expr='gte')
     date_before = django_filters.DateTimeFilter(field_name='departure_time', lookup_expr='lte')
+    # Rides that pass through `pickup` and later `dropoff`, including intermediate stops
+    pickup = django_filters.CharFilter(method='filter_through')
+    dropoff = django_filters.CharFilter(method='filter_through')
+    # Gazetteer place ids (see rides.gazetteer): equality on the indexed place columns
+    departure_place = django_filters.NumberFilter(field_name='departure_place_id')
+    destination_place = django_filters.NumberFilter(field_name='destination_place_id')
 
     class Meta:
         model = Ride
         fields = [
             'departure_location', 'destination', 'min_price', 'max_price',
-            'min_seats', 'date_after', 'date_before', 'status', 'driver'
+            'min_seats', 'date_after', 'date_before', 'status', 'driver', 'pickup', 'dropoff',
+            'departure_place', 'destination_place'
         ]
 
+    def filter_location(self, queryset, name, value):
+        # Token-prefix match served from the route search index instead of an icontains scan
+        return filter_by_location(queryset, name, value)
+
+    def filter_through(self, queryset, name, value):
+        # pickup and dropoff are applied together, once
+        if name == 'dropoff' and self.form.cleaned_data.get('pickup'):
+            return queryset
+        return filter_through(
+            queryset, self.form.cleaned_data.get('pickup'), self.form.cleaned_data.get('dropoff')
+        )
+
 class IsDriverOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
          # Allow all safe methods (GET, HEAD, OPTIONS) for authenticated users
@@ -61,8 +108,8 @@ class IsDriverOrReadOnly(permissions.BasePermission):
         # Write permissions only for the driver who created the ride
         return obj.driver == request.user
     
-@method_decorator(never_cache, name='dispatch')
-class RideViewSet(viewsets.ModelViewSet):
+@method_decorator(revalidate_or_never_cache, name='dispatch')
+class RideViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Ride.objects.all()
     serializer_class = RideListSerializer
     permission_classes = [IsDriverOrReadOnly]
@@ -71,6 +118,17 @@ class RideViewSet(viewsets.ModelViewSet):
     ordering_fields = ['departure_time', 'price', 'available_seats']
     ordering = ['departure_time']
 
+    @property
+    def paginator(self):
+        # ?pagination=cursor (or any ?cursor=) switches the list to keyset pagination.
+        # "Rides near me" results are ordered by distance, so they keep page numbers.
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            wants_cursor = 'cursor' in params or params.get('pagination') == 'cursor'
+            if wants_cursor and 'lat' not in params:
+                self._paginator = RideKeysetPagination()
+        return super().paginator
+
     def create(self, request, *args, **kwargs):
         user = request.user
         if not user.is_profile_complete:
@@ -104,6 +162,10 @@ class RideViewSet(viewsets.ModelViewSet):
             if platform_fee < 1:  # Minimum fee of 1 KES
                 platform_fee = Decimal('1.00')
 
+            # Validate (and decode any inline uploaded_images) before taking the wallet lock
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+
             with db_transaction.atomic():
                 if payment_method == 'wallet':
                     wallet, _ = Wallet.objects.get_or_create(user=user)
@@ -118,8 +180,6 @@ class RideViewSet(viewsets.ModelViewSet):
                         }, status=status.HTTP_402_PAYMENT_REQUIRED)
 
                     # Create the ride
-                    serializer = self.get_serializer(data=request.data)
-                    serializer.is_valid(raise_exception=True)
                     ride = serializer.save(driver=user, platform_fee=platform_fee, status='available')
 
                     # Deduct from wallet
@@ -145,15 +205,14 @@ class RideViewSet(viewsets.ModelViewSet):
                         notification_type="success"
                     )
 
-                    # Invalidate cache
-                    cache.delete_pattern("rides_list_*")
+                    # Invalidate cached lists for this route
+                    invalidate_ride_lists(ride)
+                    db_transaction.on_commit(lambda: notify_saved_searches(ride), robust=True)
                     
                     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
                 elif payment_method == 'mpesa':
                     # Create the ride with status 'pending_payment'
-                    serializer = self.get_serializer(data=request.data)
-                    serializer.is_valid(raise_exception=True)
                     ride = serializer.save(driver=user, status='pending_payment', platform_fee=platform_fee)
 
                     # Initiate STK Push
@@ -206,26 +265,152 @@ class RideViewSet(viewsets.ModelViewSet):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def perform_create(self, serializer):
-        serializer.save(driver=self.request.user)
+        ride = serializer.save(driver=self.request.user)
         # Invalidate cache when new ride is created
-        cache.delete_pattern("rides_list_*")
+        invalidate_ride_lists(ride)
+        if ride.status == 'available':
+            db_transaction.on_commit(lambda: notify_saved_searches(ride), robust=True)
+
+    def perform_update(self, serializer):
+        # Both the old and the new route namespaces can hold this ride
+        old_scopes = ride_scopes(serializer.instance)
+        ride = serializer.save()
+        bump_generations(old_scopes | ride_scopes(ride))
 
     def list(self, request, *args, **kwargs):
         # Only cache for passengers (who see all rides)
         if request.user.user_type == 'driver':
             return super().list(request, *args, **kwargs)
         
+        # Cache hits count as demand too
+        log_search(request.query_params)
+
         # Create a cache key based on query params
-        # Use a shared key for all passengers for the same query
-        cache_key = f"rides_list_passenger_{request.query_params.urlencode()}"
-        cached_data = cache.get(cache_key)
-        
-        if cached_data:
-            return Response(cached_data)
-        
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, timeout=60*5) # Cache for 5 minutes
-        return response
+        # Use a shared key for all passengers for the same query, namespaced by route generation.
+        # The cached page only lists ride ids; the rides themselves come from per-ride fragments.
+        cache_key = list_cache_key("rides_list_passenger", request.query_params)
+        page = cache.get(cache_key)
+
+        if page is None:
+            page = self.list_page_keys()
+            cache.set(cache_key, page, timeout=LIST_CACHE_TIMEOUT)
+
+        self.check_conditional(request, *self.page_validators(request, cache_key, page))
+
+        if isinstance(page, dict):
+            return Response({**page, 'results': self.ride_fragments(page['results'])})
+        return Response(self.ride_fragments(page))
+
+    def page_validators(self, request, cache_key, page):
+        """
+        (etag, last_modified) of a cached list page. The key carries the route
+        generations and the rows carry each ride's fragment stamp, which is all
+        the response is built from.
+        """
+        rows = page['results'] if isinstance(page, dict) else page
+        links = [page.get(name) for name in ('count', 'next', 'previous')] if isinstance(page, dict) else []
+        etag = self.make_etag(request, cache_key, *links, rows)
+        stamps = [float(stamp) for _, stamp, _ in rows]
+        last_modified = datetime.fromtimestamp(max(stamps), tz=dt_timezone.utc) if stamps else None
+        return etag, last_modified
+
+    # Columns needed to filter, order and paginate the list without loading whole rides
+    LIST_KEY_FIELDS = ('id', 'updated_at', 'departure_time', 'price', 'available_seats')
+
+    def list_page_keys(self):
+        """The filtered, paginated list as [ride id, fragment stamp, distance] rows."""
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.select_related(None).prefetch_related(None).only(*self.LIST_KEY_FIELDS)
+        page = self.paginate_queryset(queryset)
+        rides = page if page is not None else queryset
+        rows = [
+            [ride.id, fragment_stamp(ride.updated_at), getattr(ride, 'distance_km', None)]
+            for ride in rides
+        ]
+        if page is not None:
+            return dict(self.get_paginated_response(rows).data)
+        return rows
+
+    def ride_fragments(self, rows):
+        """Serialized rides for the page, read with one get_many and filled in on a miss."""
+        keys = [fragment_key(ride_id, stamp) for ride_id, stamp, _ in rows]
+        fragments = cache.get_many(keys)
+
+        missing = [row[0] for row, key in zip(rows, keys) if key not in fragments]
+        fresh = {}
+        if missing:
+            serialized = serialize_rides(Ride.objects.filter(id__in=missing), self.get_serializer_context())
+            fresh = {data['id']: data for data in serialized}
+            cache.set_many(
+                {fragment_key(data['id'], fragment_stamp(parse_datetime(data['updated_at']))): data for data in serialized},
+                timeout=FRAGMENT_CACHE_TIMEOUT
+            )
+
+        results = []
+        for (ride_id, _, distance_km), key in zip(rows, keys):
+            fragment = fragments.get(key) or fresh.get(ride_id)
+            if fragment is None:
+                # Deleted since the page was cached
+                continue
+            if distance_km is not None:
+                fragment = {**fragment, 'distance_km': round(distance_km, 3)}
+            results.append(fragment)
+        return results
+
+    def retrieve(self, request, *args, **kwargs):
+        # Read-only fast path: same payload as RideListSerializer, built from values() rows
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        queryset = self.filter_queryset(self.get_queryset()).filter(**lookup)
+        found = queryset.select_related(None).prefetch_related(None).values('id', 'driver_id', 'updated_at').first()
+        if found is None:
+            raise Http404
+        self.check_object_permissions(request, Ride(pk=found['id'], driver_id=found['driver_id']))
+        # Everything the payload embeds moves updated_at (see rides.cache.touch_rides)
+        self.check_conditional(
+            request, self.make_etag(request, fragment_stamp(found['updated_at'])), found['updated_at']
+        )
+        rows = serialize_rides(queryset, self.get_serializer_context())
+        if not rows:
+            raise Http404
+        return Response(rows[0])
+
+    def get_validators(self, request):
+        # The passenger list and retrieve call check_conditional() themselves, without the aggregate
+        if self.action == 'list' and getattr(request.user, 'user_type', None) == 'driver':
+            return super().get_validators(request)
+        return None
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and 'lat' in self.request.query_params:
+            queryset = self.filter_near_me(queryset)
+        return queryset
+
+    def filter_near_me(self, queryset):
+        """
+        "Rides near me" mode: ?lat=&lng=&radius_km=[&near=departure|destination]
+        Candidates come from the geohash cells around the point and are ranked by distance.
+        """
+        from rest_framework.exceptions import ValidationError
+
+        params = self.request.query_params
+        try:
+            latitude = float(params.get('lat'))
+            longitude = float(params.get('lng'))
+            radius_km = float(params.get('radius_km', 10))
+        except (TypeError, ValueError):
+            raise ValidationError({"detail": "lat, lng and radius_km must be numbers."})
+
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({"detail": "lat/lng out of range."})
+        if not 0 < radius_km <= MAX_RADIUS_KM:
+            raise ValidationError({"detail": f"radius_km must be between 0 and {MAX_RADIUS_KM}."})
+
+        point = params.get('near', 'departure')
+        if point not in ('departure', 'destination'):
+            raise ValidationError({"near": "Must be 'departure' or 'destination'."})
+
+        return filter_near(queryset, latitude, longitude, radius_km, point=point)
 
     def get_queryset(self):
         user = self.request.user
@@ -234,31 +419,36 @@ class RideViewSet(viewsets.ModelViewSet):
 
         # Let authenticated owners access their own rides directly for detail/update/delete flows
         # even if they are currently in passenger mode.
-        if user.is_authenticated and getattr(self, 'action', None) in ('retrieve', 'update', 'partial_update', 'destroy', 'complete'):
+        if user.is_authenticated and getattr(self, 'action', None) in (
+            'retrieve', 'batch', 'update', 'partial_update', 'destroy', 'complete'
+        ):
             return queryset.filter(driver=user)
+
+        if getattr(self, 'action', None) == 'waitlist':
+            # The waitlist is for rides passengers can no longer see in the list: fully booked ones
+            return queryset.filter(departure_time__gte=now, status__in=WAITLIST_STATUSES)
         
         if user.is_anonymous or user.user_type == 'passenger':
-            # Passengers only see future, available rides
+            # Passengers only see future, available rides (served by ride_available_departure_idx)
             return queryset.filter(departure_time__gte=now, status='available')
         
         if user.user_type == 'driver':
             queryset = queryset.filter(driver=user)
             category = self.request.query_params.get('category')
             
-            from django.db.models import Count
             if category == 'active':
                 return queryset.filter(departure_time__gte=now).exclude(status='completed')
             elif category == 'completed':
                 return queryset.filter(status='completed')
             elif category == 'past':
                 # Departed rides (not marked completed) with at least one booking
-                return queryset.annotate(booking_count=Count('bookings')).filter(
+                return queryset.filter(
                     departure_time__lt=now, 
                     booking_count__gt=0
                 ).exclude(status='completed')
             elif category == 'expired':
                 # Departed rides with no bookings
-                return queryset.annotate(booking_count=Count('bookings')).filter(
+                return queryset.filter(
                     departure_time__lt=now, 
                     booking_count=0
                 ).exclude(status='completed')
@@ -268,6 +458,37 @@ class RideViewSet(viewsets.ModelViewSet):
         # If user has no valid type, return empty for safety
         return Ride.objects.none()
 
+    MAX_BATCH_IDS = 100
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """
+        Up to MAX_BATCH_IDS rides by `ids` (comma-separated) in one call, each as
+        retrieve returns it and under the same permissions; ids that retrieve
+        would answer with 404 are listed under `missing`
+        """
+        try:
+            ids = list(dict.fromkeys(
+                int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()
+            ))
+        except ValueError:
+            return Response({"error": "ids must be comma-separated integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < len(ids) <= self.MAX_BATCH_IDS:
+            return Response(
+                {"error": f"Pass between 1 and {self.MAX_BATCH_IDS} ids"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        rows = serialize_rides(
+            self.filter_queryset(self.get_queryset()).filter(id__in=ids), self.get_serializer_context()
+        )
+        for row in rows:
+            self.check_object_permissions(request, Ride(pk=row['id'], driver_id=row['driver']['id']))
+        by_id = {row['id']: row for row in rows}
+        return Response({
+            'results': [by_id[ride_id] for ride_id in ids if ride_id in by_id],
+            'missing': [ride_id for ride_id in ids if ride_id not in by_id],
+        })
+
     def destroy(self, request, *args, **kwargs):
         ride = self.get_object()
 
@@ -278,7 +499,8 @@ class RideViewSet(viewsets.ModelViewSet):
             )
 
         self.perform_destroy(ride)
-        cache.delete_pattern("rides_list_*")
+        invalidate_ride_lists(ride)
+        bump_user_versions(ride.driver_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def partial_update(self, request, *args, **kwargs):
@@ -290,9 +512,7 @@ class RideViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        response = super().partial_update(request, *args, **kwargs)
-        cache.delete_pattern("rides_list_*")
-        return response
+        return super().partial_update(request, *args, **kwargs)
 
     def update(self, request, *args, **kwargs):
         ride = self.get_object()
@@ -303,21 +523,28 @@ class RideViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        response = super().update(request, *args, **kwargs)
-        cache.delete_pattern("rides_list_*")
-        return response
+        return super().update(request, *args, **kwargs)
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def book(self, request, pk=None):
         """
         Book a ride with payment
         """
-        ride = self.get_object()
         payment_method = request.data.get('payment_method')
         try:
             no_of_seats = int(request.data.get('no_of_seats', 1))
         except (ValueError, TypeError):
             no_of_seats = 1
+
+        ride = self.get_object()
+
+        # With live seat counters a sold-out ride is turned away before any seat row is touched
+        # (see rides.seat_counter); get_object() first, so hidden rides still 404
+        counted = None if ride.is_multi_stop else seat_counter.peek(ride.id)
+        if counted is not None and counted < no_of_seats:
+            return Response({
+                'error': f'Only {counted} seat(s) available'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         # Validate payment method
         if payment_method not in ['wallet', 'mpesa', 'card']:
@@ -325,10 +552,20 @@ class RideViewSet(viewsets.ModelViewSet):
                 'error': 'Invalid payment method. Must be wallet, mpesa, or card'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        # Sub-route of a multi-stop ride (defaults to the whole route)
+        from_stop = to_stop = None
+        seats_left = ride.available_seats
+        if ride.is_multi_stop:
+            try:
+                from_stop, to_stop = stop_range(ride, request.data.get('from_stop'), request.data.get('to_stop'))
+            except (TypeError, ValueError) as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            seats_left = seats_between(ride, from_stop, to_stop)
+
         # Validate seats availability
-        if ride.available_seats < no_of_seats:
+        if seats_left < no_of_seats:
             return Response({
-                'error': f'Only {ride.available_seats} seat(s) available'
+                'error': f'Only {seats_left} seat(s) available'
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Prevent driver from booking their own ride
@@ -338,6 +575,7 @@ class RideViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Create booking with transaction
+        booking = None
         try:
             with db_transaction.atomic():
                 # Create booking
@@ -345,6 +583,8 @@ class RideViewSet(viewsets.ModelViewSet):
                     ride=ride,
                     user=request.user,
                     no_of_seats=no_of_seats,
+                    from_stop=from_stop,
+                    to_stop=to_stop,
                     status='pending'
                 )
                 
@@ -353,10 +593,7 @@ class RideViewSet(viewsets.ModelViewSet):
 
                 # Handle payment method
                 if payment_method == 'wallet':
-                    # Reduce seats immediately for wallet payment
-                    booking.reduce_seats()
-                    
-                    # Process wallet payment immediately
+                    # Check the wallet before any seat is taken
                     try:
                         wallet = Wallet.objects.select_for_update().get(user=request.user)
                     except Wallet.DoesNotExist:
@@ -368,6 +605,9 @@ class RideViewSet(viewsets.ModelViewSet):
                     
                     if wallet.balance < total_amount:
                         raise ValueError(f"Insufficient wallet balance. Required: KSh {total_amount:.2f} (includes 5% fee), Available: KSh {wallet.balance:.2f}")
+
+                    # Reduce seats immediately for wallet payment
+                    booking.reduce_seats()
                     
                     # Deduct from wallet
                     wallet.balance -= total_amount
@@ -435,9 +675,10 @@ class RideViewSet(viewsets.ModelViewSet):
 
                 elif payment_method in ['mpesa', 'card']:
                     # Payment will be confirmed via callback/webhook
-                    # Booking stays in pending status but seats are already reserved
+                    # Booking stays in pending status and holds its seats until the hold expires
+                    place_hold(booking)
                     message = 'Booking created. Awaiting payment confirmation.'
-                    extra_data = {'status': 'pending_payment'}
+                    extra_data = {'status': 'pending_payment', 'hold_expires_at': booking.hold_expires_at}
                     
                     # Notification for driver about new pending booking
                     Notification.objects.create(
@@ -447,11 +688,13 @@ class RideViewSet(viewsets.ModelViewSet):
                         notification_type="info"
                     )
                 
-                # Refresh ride to get updated available_seats for the response
-                ride.refresh_from_db()
-                
-                # Invalidate cache since available_seats has changed
-                cache.delete_pattern("rides_list_passenger_*")
+                # Seats left for the response: from the live counter if there is one, else the row
+                # (cached lists are invalidated by Booking.reduce_seats)
+                counted = None if ride.is_multi_stop else seat_counter.peek(ride.id)
+                if counted is None:
+                    ride.refresh_from_db(fields=['available_seats'])
+                else:
+                    ride.available_seats = counted
 
                 return Response({
                     'success': True,
@@ -467,10 +710,147 @@ class RideViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_201_CREATED)
                 
         except Exception as e:
+            # The booking rolled back; give back any seats it took from the live counter
+            if booking is not None and booking.seat_lease:
+                seat_counter.cancel(ride.id, booking.seat_lease)
             return Response({
                 'error': f'Booking failed: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=True, methods=['post', 'delete'], permission_classes=[permissions.IsAuthenticated])
+    def waitlist(self, request, pk=None):
+        """
+        Join (POST, with `no_of_seats`) or leave (DELETE) the waitlist of a fully booked ride
+        """
+        ride = self.get_object()
+        if request.method == 'DELETE':
+            if not leave_waitlist(ride, request.user):
+                return Response({'error': 'You are not on the waitlist for this ride'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        try:
+            no_of_seats = int(request.data.get('no_of_seats', 1))
+        except (ValueError, TypeError):
+            no_of_seats = 1
+        if ride.driver_id == request.user.id:
+            return Response({'error': 'You cannot join the waitlist of your own ride'}, status=status.HTTP_400_BAD_REQUEST)
+        if ride.status not in WAITLIST_STATUSES or ride.departure_time <= timezone.now():
+            return Response({'error': 'This ride is no longer taking bookings'}, status=status.HTTP_400_BAD_REQUEST)
+        if no_of_seats < 1:
+            return Response({'error': 'Invalid number of seats'}, status=status.HTTP_400_BAD_REQUEST)
+        if ride.available_seats >= no_of_seats:
+            return Response(
+                {'error': f'{ride.available_seats} seat(s) are available; book the ride instead'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        entry, created = join_waitlist(ride, request.user, no_of_seats)
+        return Response({
+            'id': entry.id,
+            'no_of_seats': entry.no_of_seats,
+            'position': queue_position(entry),
+            'created_at': entry.created_at,
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(
+        detail=False, methods=['get'],
+        # Token claims only: a keystroke never waits on a user lookup
+        authentication_classes=[JWTStatelessUserAuthentication]
+    )
+    def autocomplete(self, request):
+        """
+        Location suggestions for `q` from the in-process index, most used first
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        suggestions = location_index.suggest(request.query_params.get('q', ''), limit)
+        return Response([{'location': location, 'rides': rides} for location, rides in suggestions])
+
+    @action(detail=False, methods=['get'])
+    def dashboard(self, request):
+        """
+        The driver's ride category counts, next departures, pending requests, seats sold and earnings
+        """
+        if request.user.user_type != 'driver':
+            return Response({"error": "Only drivers have a dashboard"}, status=status.HTTP_403_FORBIDDEN)
+        return Response(cached_driver_summary(request.user.id))
+
+    # Ride list filters that narrow the calendar; dates and ordering are the calendar's own
+    CALENDAR_FILTERS = ('departure_location', 'destination', 'departure_place', 'destination_place', 'min_seats')
+
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """
+        Bookable rides, free seats and the cheapest price per day on a route, from
+        date_from to date_to (YYYY-MM-DD, inclusive; defaults to the next month)
+        """
+        params = request.query_params
+        if not params.get('destination') and not params.get('destination_place'):
+            return Response(
+                {"error": "destination or destination_place is required"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        today = timezone.localdate()
+        try:
+            first_day = parse_date(params['date_from']) if params.get('date_from') else today
+            last_day = (
+                parse_date(params['date_to']) if params.get('date_to')
+                else first_day + timedelta(days=DEFAULT_CALENDAR_DAYS - 1)
+            )
+        except (TypeError, ValueError):
+            first_day = last_day = None
+        if first_day is None or last_day is None:
+            return Response({"error": "Dates must be YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        first_day = max(first_day, today)
+        if last_day < first_day or (last_day - first_day).days >= MAX_CALENDAR_DAYS:
+            return Response(
+                {"error": f"date_to must be on or after date_from and today, at most {MAX_CALENDAR_DAYS} days on"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        route = QueryDict(mutable=True)
+        for name in self.CALENDAR_FILTERS:
+            if params.get(name):
+                route[name] = params[name]
+        # Same route generations as the ride list, so any ride write on the route invalidates it
+        key_params = route.copy()
+        key_params['date_from'], key_params['date_to'] = first_day.isoformat(), last_day.isoformat()
+        cache_key = list_cache_key("rides_calendar", key_params)
+        days = cache.get(cache_key)
+
+        if days is None:
+            filterset = RideFilter(route, queryset=Ride.objects.all(), request=request)
+            if not filterset.is_valid():
+                return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+            days = [
+                {
+                    **day,
+                    'date': day['date'].isoformat(),
+                    'min_price': None if day['min_price'] is None else str(day['min_price'].quantize(Decimal('0.01'))),
+                }
+                for day in route_calendar(filterset.qs, first_day, last_day)
+            ]
+            cache.set(cache_key, days, timeout=LIST_CACHE_TIMEOUT)
+
+        return Response({'date_from': first_day, 'date_to': last_day, 'days': days})
+
+    @action(detail=True, methods=['get'])
+    def stops(self, request, pk=None):
+        """
+        Ordered stops of a multi-stop ride with the seats left on the leg to the next stop
+        """
+        ride = self.get_object()
+        seats = dict(ride.segments.values_list('sequence', 'available_seats'))
+        return Response([
+            {
+                'sequence': sequence,
+                'location': location,
+                'seats_to_next': seats.get(sequence)
+            }
+            for sequence, location in ride.stops.values_list('sequence', 'location')
+        ])
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def complete(self, request, pk=None):
         """
@@ -483,24 +863,34 @@ class RideViewSet(viewsets.ModelViewSet):
         if ride.status == 'completed':
             return Response({"error": "Ride is already completed"}, status=status.HTTP_400_BAD_REQUEST)
 
-        with db_transaction.atomic():
-            ride.status = 'completed'
-            ride.save()
-            
-            # Also mark all confirmed bookings as completed
-            confirmed_bookings = ride.bookings.filter(status='confirmed')
-            confirmed_bookings.update(status='completed')
-            
-            # Notify passengers
-            for booking in confirmed_bookings:
-                Notification.objects.create(
-                    user=booking.user,
-                    title="Ride Completed",
-                    message=f"Your ride from {ride.departure_location} to {ride.destination} has been marked as completed. Please leave a review for your driver!",
-                    notification_type="success"
-                )
+        completed = complete_rides(Ride.objects.filter(pk=ride.pk), skip_locked=False)
+
+        return Response({
+            "success": True,
+            "message": "Ride and all bookings marked as completed",
+            "bookings_completed": completed['bookings']
+        })
 
-        return Response({"success": True, "message": "Ride and all bookings marked as completed"})
+    @action(detail=False, methods=['post'], url_path='complete-past')
+    def complete_past(self, request):
+        """
+        Mark every one of the driver's rides that departed before `before` (default: now) as completed
+        """
+        before = timezone.now()
+        if request.data.get('before'):
+            try:
+                before = parse_datetime(str(request.data['before']))
+            except ValueError:
+                # Well formed but not a real date, e.g. February 30th
+                before = None
+            if before is None:
+                return Response({"error": "before must be an ISO 8601 datetime"}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(before):
+                before = timezone.make_aware(before)
+            before = min(before, timezone.now())
+
+        completed = complete_rides(past_rides(before, driver=request.user))
+        return Response({"success": True, "rides_completed": completed['rides'], "bookings_completed": completed['bookings']})
     
 
 class IsBookingOwner(permissions.BasePermission):
@@ -514,8 +904,8 @@ class IsPaymentOwner(permissions.BasePermission):
 
 
 
-@method_decorator(never_cache, name='dispatch')
-class BookingViewSet(viewsets.ModelViewSet):
+@method_decorator(revalidate_or_never_cache, name='dispatch')
+class BookingViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = BookingSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [django_filters.DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
@@ -523,6 +913,8 @@ class BookingViewSet(viewsets.ModelViewSet):
     search_fields = ['ride__departure_location', 'ride__destination', 'ride__driver__username']
     ordering_fields = ['booked_at', 'updated_at']
     ordering = ['-booked_at']
+    # Bookings embed their ride, whose seats and status change independently
+    conditional_timestamp_fields = ('updated_at', 'ride__updated_at')
 
     def dispatch(self, request, *args, **kwargs):
         response = super().dispatch(request, *args, **kwargs)
@@ -534,7 +926,7 @@ class BookingViewSet(viewsets.ModelViewSet):
         # Allow both the Passenger AND the Driver to see the booking
         user = self.request.user
         return Booking.objects.select_related(
-            'user', 'ride', 'ride__driver', 'ride__driver__driver_profile'
+            'user', 'user__driver_profile', 'ride', 'ride__driver', 'ride__driver__driver_profile'
         ).prefetch_related(
             'ride__images'
         ).filter(
@@ -611,8 +1003,8 @@ class BookingViewSet(viewsets.ModelViewSet):
         )
 
 
-@method_decorator(never_cache, name='dispatch')
-class ReviewViewSet(viewsets.ModelViewSet):
+@method_decorator(revalidate_or_never_cache, name='dispatch')
+class ReviewViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -657,3 +1049,176 @@ class ReviewViewSet(viewsets.ModelViewSet):
             message=f"You have received a new {serializer.validated_data['rating']}-star review for your ride from {booking.ride.departure_location}.",
             notification_type="info"
         )
+
+
+class IsStaffOrDriver(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and (request.user.is_staff or request.user.user_type == 'driver')
+
+
+class RouteDemandFilter(django_filters.FilterSet):
+    departure = django_filters.CharFilter(method='filter_route')
+    destination = django_filters.CharFilter(method='filter_route')
+    weekday = django_filters.NumberFilter(method='filter_weekday')
+    hour = django_filters.NumberFilter(method='filter_hour')
+
+    class Meta:
+        model = RouteDemand
+        fields = ['departure', 'destination', 'weekday', 'hour']
+
+    def filter_route(self, queryset, name, value):
+        # Rollup keys are normalized locations
+        return queryset.filter(**{f'{name}__startswith': normalize_location(value)})
+
+    def filter_weekday(self, queryset, name, value):
+        # 0 = Monday
+        return queryset.filter(hour_of_week__gte=int(value) * 24, hour_of_week__lt=(int(value) + 1) * 24)
+
+    def filter_hour(self, queryset, name, value):
+        return queryset.filter(hour_of_week__in=[day * 24 + int(value) for day in range(7)])
+
+
+@method_decorator(never_cache, name='dispatch')
+class RouteDemandViewSet(viewsets.ReadOnlyModelViewSet):
+    """Demand by route and hour of the week, read from the RouteDemand rollup (see rides.demand)."""
+    queryset = RouteDemand.objects.all()
+    serializer_class = RouteDemandSerializer
+    permission_classes = [IsStaffOrDriver]
+    filter_backends = [django_filters.DjangoFilterBackend, filters.OrderingFilter]
+    filterset_class = RouteDemandFilter
+    ordering_fields = ['searches', 'bookings', 'seats_sold', 'hour_of_week']
+    ordering = ['-seats_sold', 'id']
+
+
+@method_decorator(never_cache, name='dispatch')
+class PlaceViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Gazetteer places (see rides.gazetteer). `?q=` resolves free text to its
+    place, whose id the ride list takes as departure_place / destination_place.
+    """
+    serializer_class = PlaceSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        places = Place.objects.prefetch_related('aliases')
+        if 'q' in self.request.query_params:
+            places = places.filter(id=find_place(self.request.query_params['q']))
+        return places
+
+
+@method_decorator(never_cache, name='dispatch')
+class SavedSearchViewSet(viewsets.ModelViewSet):
+    serializer_class = SavedSearchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+@method_decorator(never_cache, name='dispatch')
+class RideTemplateViewSet(viewsets.ModelViewSet):
+    serializer_class = RideTemplateSerializer
+    permission_classes = [IsDriverOrReadOnly]
+
+    def get_queryset(self):
+        return RideTemplate.objects.filter(driver=self.request.user).prefetch_related('images')
+
+    def perform_create(self, serializer):
+        serializer.save(driver=self.request.user)
+
+    @action(detail=True, methods=['post'])
+    def materialize(self, request, pk=None):
+        """
+        Post the template's next `count` rides in one go, paid with one wallet debit
+        """
+        template = self.get_object()
+        if not template.is_active:
+            return Response({"error": "This template is paused."}, status=status.HTTP_400_BAD_REQUEST)
+        if not request.user.is_profile_complete:
+            return Response({
+                "error": "Profile Incomplete",
+                "detail": "Please complete your profile before posting a ride."
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            count = int(request.data.get('count', 5))
+        except (TypeError, ValueError):
+            count = 0
+        if not 1 <= count <= MAX_OCCURRENCES:
+            return Response(
+                {"error": f"count must be between 1 and {MAX_OCCURRENCES}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            rides, total_fee = materialize(template, count)
+        except InsufficientBalance as e:
+            return Response({
+                "error": "Insufficient Balance",
+                "detail": str(e),
+                "fee": float(e.fee)
+            }, status=status.HTTP_402_PAYMENT_REQUIRED)
+
+        rides = Ride.objects.filter(id__in=[ride.id for ride in rides]).order_by('departure_time')
+        return Response({
+            "created": len(rides),
+            "fee": float(total_fee),
+            "rides": serialize_rides(rides, self.get_serializer_context())
+        }, status=status.HTTP_201_CREATED)
+
+
+@method_decorator(never_cache, name='dispatch')
+class UploadSessionViewSet(viewsets.GenericViewSet):
+    """Chunked image uploads, completed before the ride that uses them is posted (see rides.uploads)."""
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsDriverOrReadOnly]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user)
+
+    def upload_error(self, error):
+        return Response({"error": str(error), **error.extra}, status=error.status)
+
+    def create(self, request):
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({"error": "size is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = start_session(request.user, request.data.get('filename', ''), size)
+        except UploadError as e:
+            return self.upload_error(e)
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def chunk(self, request, pk=None):
+        """
+        Append the multipart `chunk` file at byte `offset`
+        """
+        chunk = request.FILES.get('chunk')
+        try:
+            offset = int(request.data.get('offset', 0))
+        except (TypeError, ValueError):
+            offset = -1
+        if chunk is None or offset < 0:
+            return Response({"error": "A chunk file and a non-negative offset are required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = append_chunk(pk, request.user, offset, chunk)
+        except UploadError as e:
+            return self.upload_error(e)
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        try:
+            uploaded, deduplicated = complete_session(pk, request.user)
+        except UploadError as e:
+            return self.upload_error(e)
+        return Response({
+            "image_id": uploaded.id,
+            "deduplicated": deduplicated,
+            **UploadedImageSerializer(uploaded, context=self.get_serializer_context()).data
+        }, status=status.HTTP_201_CREATED)
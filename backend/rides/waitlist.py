@@ -0,0 +1,119 @@
+# rides/waitlist.py
+"""
+First-come, first-served waitlists for fully booked rides.
+
+Passengers who cannot get enough seats join the ride's queue. When seats come
+back (Booking.restore_seats on a cancellation, or expire_holds releasing
+unpaid holds), promote_waitlist() runs in the same transaction. It takes the
+head of the queue and reserves its seats with the guarded UPDATE in
+rides.inventory. It then creates a pending booking holding those seats for
+SEAT_HOLD_MINUTES and notifies the passenger, who pays for it like any other
+pending booking. If the passenger never pays, the hold expires and the seats
+move on to the next entry in the queue.
+
+Each promotion is one probe of the partial waitlist_queue_idx index plus the
+booking writes, whatever the queue length. Promotions lock the ride row first,
+so concurrent cancellations on one ride take turns and never promote the same
+entry twice or skip past a head another transaction is holding. The queue is
+strict: if the head needs more seats than are free, nobody behind it jumps
+ahead.
+"""
+import logging
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import Notification
+
+from .holds import hold_ttl, place_hold
+from .models import Booking, Ride, WaitlistEntry
+
+logger = logging.getLogger(__name__)
+
+WAITLIST_STATUSES = ('available', 'fully_booked')
+
+
+def join_waitlist(ride, user, no_of_seats):
+    """Queue `user` for `no_of_seats` on `ride`. Returns (entry, created); an existing place is kept."""
+    try:
+        with db_transaction.atomic():
+            return WaitlistEntry.objects.create(ride=ride, user=user, no_of_seats=no_of_seats), True
+    except IntegrityError:
+        # Already waiting (waitlist_one_waiting_entry_per_user)
+        return WaitlistEntry.objects.get(ride=ride, user=user, status='waiting'), False
+
+
+def leave_waitlist(ride, user):
+    return bool(WaitlistEntry.objects.filter(ride=ride, user=user, status='waiting').update(status='left'))
+
+
+def queue_position(entry):
+    """1-based place of a waiting entry in its ride's queue."""
+    ahead = WaitlistEntry.objects.filter(ride_id=entry.ride_id, status='waiting').filter(
+        Q(created_at__lt=entry.created_at) | Q(created_at=entry.created_at, id__lt=entry.id)
+    )
+    return ahead.count() + 1
+
+
+def promote_waitlist(ride_id):
+    """
+    Hand seats that are free on the ride to the head of its queue, in order,
+    until the head no longer fits. Call it inside the transaction that freed
+    the seats. Returns the bookings created.
+    """
+    # Serializes promotions per ride; waits for any other promotion to commit
+    ride = Ride.objects.select_for_update().filter(pk=ride_id).only('status', 'departure_time', 'departure_location', 'destination').first()
+    if ride is None or ride.status not in WAITLIST_STATUSES or ride.departure_time <= timezone.now():
+        return []
+
+    promoted = []
+    while True:
+        entry = (
+            WaitlistEntry.objects.select_for_update()
+            .filter(ride_id=ride_id, status='waiting')
+            .order_by('created_at', 'id')
+            .first()
+        )
+        if entry is None:
+            break
+        # Cheap check first, so a head that does not fit creates no booking (or driver email)
+        if not Ride.objects.filter(pk=ride_id, available_seats__gte=entry.no_of_seats).exists():
+            break
+        try:
+            with db_transaction.atomic():
+                booking = Booking.objects.create(
+                    ride_id=ride_id, user_id=entry.user_id, no_of_seats=entry.no_of_seats, status='pending'
+                )
+                place_hold(booking)
+        except ValueError:
+            # Taken by a concurrent booking in the meantime; the head keeps its place
+            break
+
+        entry.status = 'promoted'
+        entry.booking = booking
+        entry.save(update_fields=['status', 'booking', 'updated_at'])
+        Notification.objects.create(
+            user_id=entry.user_id,
+            title="A Seat Opened Up",
+            message=(
+                f"{entry.no_of_seats} seat(s) on the ride from {ride.departure_location} to {ride.destination} "
+                f"are being held for you as booking #{booking.id}. "
+                f"Pay within {int(hold_ttl().total_seconds() // 60)} minutes to keep them."
+            ),
+            notification_type="success"
+        )
+        promoted.append(booking)
+
+    if promoted:
+        logger.info(f"Promoted {len(promoted)} waitlisted passenger(s) on ride {ride_id}.")
+    return promoted
+
+
+def promote_waitlists(ride_ids):
+    """promote_waitlist() for each of `ride_ids` that has anyone waiting."""
+    queued = (
+        WaitlistEntry.objects.filter(ride_id__in=ride_ids, status='waiting')
+        .order_by().values_list('ride_id', flat=True).distinct()
+    )
+    return [booking for ride_id in sorted(set(queued)) for booking in promote_waitlist(ride_id)]